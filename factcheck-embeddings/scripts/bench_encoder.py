@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from factcheck_relevance.encode import tevatron_encode
+from factcheck_relevance.encoder import Encoder
+from factcheck_relevance.utils import iter_json, load_config, load_reps, save_jsonl
+
+def sample_texts(in_path, max_docs):
+    items = []
+    for item in iter_json(in_path):
+        items.append(item)
+        if len(items) >= max_docs:
+            break
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process Encoder throughput against the Tevatron encode driver")
+    parser.add_argument("--config", required=True, help="Inference config (model, max lengths, batch size, input paths)")
+    parser.add_argument("--is_query", action="store_true", help="Benchmark query encoding instead of the corpus")
+    parser.add_argument("--max_docs", type=int, default=2000)
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    in_path = config['query_in_path'] if args.is_query else config['corpus_in_path']
+    items = sample_texts(in_path, args.max_docs)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        sample_path = os.path.join(work_dir, "texts.jsonl")
+        save_jsonl(items, sample_path)
+
+        # Tevatron reloads the model on every call, so its load time is part of each encode
+        tevatron_path = os.path.join(work_dir, "tevatron.pkl")
+        start = time.perf_counter()
+        tevatron_encode(dict(config, output_dir=work_dir), sample_path, tevatron_path, is_query=args.is_query)
+        tevatron_time = time.perf_counter() - start
+        _, tevatron_reps = load_reps(tevatron_path)
+
+        start = time.perf_counter()
+        encoder = Encoder.from_config(config)
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        native_reps = encoder.encode([i['text'] for i in items], is_query=args.is_query)
+        native_time = time.perf_counter() - start
+
+    rows = [
+        {"encoder": "tevatron", "load_s": None, "encode_s": tevatron_time, "docs/sec": len(items) / tevatron_time},
+        {"encoder": "native", "load_s": load_time, "encode_s": native_time, "docs/sec": len(items) / native_time},
+    ]
+    max_diff = float(np.abs(np.asarray(tevatron_reps) - native_reps).max()) if len(items) else 0.0
+
+    print(f"\n{len(items)} {'queries' if args.is_query else 'passages'}, batch size {encoder.batch_size}")
+    print(pd.DataFrame(rows).to_markdown(index=False, floatfmt=".3f"))
+    print(f"Speedup: {tevatron_time / native_time:.2f}x, max abs difference: {max_diff:.2e}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"rows": rows, "max_abs_diff": max_diff}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
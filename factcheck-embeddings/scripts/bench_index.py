@@ -0,0 +1,84 @@
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+import yaml
+from factcheck_relevance.embedding_store import load_embeddings
+from factcheck_relevance.index import build_index, index_memory_bytes, search
+from factcheck_relevance.utils import load_config
+
+DEFAULT_SPECS = [
+    "ivf_flat:nlist=1024,nprobe=8",
+    "ivf_flat:nlist=1024,nprobe=32",
+    "ivf_pq:nlist=1024,nprobe=32,pq_m=16",
+    "hnsw:hnsw_m=32,ef_search=64",
+    "hnsw:hnsw_m=32,ef_search=256",
+    "sq8:",
+    "sq8:rescore_k=200",
+    "sq8:reduce_dim=128,rescore_k=200",
+]
+
+def parse_spec(spec):
+    # "ivf_flat:nlist=1024,nprobe=16" -> {'index_type': 'ivf_flat', 'nlist': 1024, 'nprobe': 16}
+    index_type, _, params = spec.partition(':')
+    parsed = {'index_type': index_type}
+    for item in filter(None, params.split(',')):
+        key, value = item.split('=')
+        parsed[key] = yaml.safe_load(value)
+    return parsed
+
+def time_index(corpus_reps, query_reps, config, topk):
+    start = time.perf_counter()
+    index = build_index(corpus_reps, config)
+    build_time = time.perf_counter() - start
+
+    # Includes exact rescoring of the top rescore_k when the spec sets it
+    start = time.perf_counter()
+    _, indices = search(index, query_reps, corpus_reps, topk, config)
+    search_time = time.perf_counter() - start
+    return index, indices, build_time, search_time
+
+def overlap_recall(approx, exact):
+    # Fraction of the exact top-k that the approximate index also returned
+    hits = [len(set(a[a >= 0]) & set(e)) for a, e in zip(approx, exact)]
+    return float(np.sum(hits) / exact.size)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare approximate FAISS indexes against the flat index")
+    parser.add_argument("--config", required=True, help="Inference config with corpus/query embedding paths")
+    parser.add_argument("--specs", nargs="+", default=DEFAULT_SPECS, help="index_type:key=value,... specs")
+    parser.add_argument("--topk", type=int, help="Defaults to the config's topk")
+    parser.add_argument("--max_queries", type=int, default=10000)
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    topk = args.topk or config.get('topk', 100)
+    _, corpus_reps = load_embeddings(config['corpus_out_path'])
+    _, query_reps = load_embeddings(config['query_out_path'])
+    query_reps = np.ascontiguousarray(query_reps[:args.max_queries], dtype=np.float32)
+
+    flat, exact, build_time, search_time = time_index(corpus_reps, query_reps, dict(config, index_type='flat', reduce_dim=None, rescore_k=None), topk)
+    rows = [{
+        "index": "flat", f"Recall@{topk}": 1.0, "QPS": len(query_reps) / search_time,
+        "build_s": build_time, "memory_MB": index_memory_bytes(flat) / 2**20,
+    }]
+    del flat
+
+    for spec in args.specs:
+        index, approx, build_time, search_time = time_index(corpus_reps, query_reps, dict(config, **parse_spec(spec)), topk)
+        rows.append({
+            "index": spec, f"Recall@{topk}": overlap_recall(approx, exact), "QPS": len(query_reps) / search_time,
+            "build_s": build_time, "memory_MB": index_memory_bytes(index) / 2**20,
+        })
+        del index
+
+    print(f"\n{len(query_reps)} queries x {len(corpus_reps)} docs, top-{topk}")
+    print(pd.DataFrame(rows).to_markdown(index=False, floatfmt=".4f"))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
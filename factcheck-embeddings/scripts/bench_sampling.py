@@ -0,0 +1,62 @@
+import argparse
+import math
+import random
+import time
+import numpy as np
+from factcheck_relevance.sampling import sample_negatives
+
+def legacy_sample(negatives, positives, config):
+    # Per-positive re-sort and quadratic rest-pool scan, as build_data did before the sampling engine
+    k_neg = config['k_neg']
+    out = []
+    for _ in positives:
+        sorted_negs = sorted(negatives, key=lambda x: x[2], reverse=True)
+        n_hard_pool = sorted_negs[:config['hard_pool_size']]
+        k_hard = math.ceil(config['hard_frac'] * k_neg)
+        sampled_hard = random.sample(n_hard_pool, min(len(n_hard_pool), k_hard))
+        remaining_rand = k_neg - len(sampled_hard)
+        rest_pool = [n for n in negatives if n[0] not in [s[0] for s in sampled_hard]]
+        sampled_rand = random.sample(rest_pool, min(len(rest_pool), remaining_rand))
+        out.append(sampled_hard + sampled_rand)
+    return out
+
+def make_claims(num_claims, num_negatives, num_positives, seed):
+    rng = random.Random(seed)
+    claims = []
+    for c in range(num_claims):
+        negatives = [(f"d_{c}_{j}", f"snippet {c} {j}", rng.random()) for j in range(num_negatives)]
+        positives = [(f"p_{c}_{j}", f"pos {c} {j}", 1.0) for j in range(num_positives)]
+        claims.append((positives, negatives))
+    return claims
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark for hard-negative sampling")
+    parser.add_argument("--num_claims", type=int, default=200)
+    parser.add_argument("--num_positives", type=int, default=20)
+    parser.add_argument("--negatives", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--k_neg", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    config = {"k_neg": args.k_neg, "hard_pool_size": 20, "hard_frac": 0.67, "neg_policy": "hard_mix"}
+    
+    print(f"{'negatives':>10} {'legacy (s)':>12} {'engine (s)':>12} {'speedup':>8}")
+    for num_negatives in args.negatives:
+        claims = make_claims(args.num_claims, num_negatives, args.num_positives, args.seed)
+        
+        random.seed(args.seed)
+        start = time.perf_counter()
+        for positives, negatives in claims:
+            legacy_sample(negatives, positives, config)
+        legacy_time = time.perf_counter() - start
+        
+        rng = np.random.default_rng(args.seed)
+        start = time.perf_counter()
+        for positives, negatives in claims:
+            sample_negatives([n[2] for n in negatives], len(positives), config, rng)
+        engine_time = time.perf_counter() - start
+        
+        print(f"{num_negatives:>10} {legacy_time:>12.4f} {engine_time:>12.4f} {legacy_time / engine_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
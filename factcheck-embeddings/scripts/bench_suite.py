@@ -0,0 +1,244 @@
+import argparse
+import json
+import math
+import os
+import platform
+import numpy as np
+import pandas as pd
+from factcheck_relevance.build_data import build_data
+from factcheck_relevance.build_global import build_global
+from factcheck_relevance.embedding_store import write_embeddings
+from factcheck_relevance.eval import DEFAULT_METRICS, compute_metrics
+from factcheck_relevance.retrieve import run_retrieval
+from factcheck_relevance.telemetry import instrument, load_telemetry
+from factcheck_relevance.utils import iter_json, load_config, write_tsv
+
+# Synthetic end-to-end benchmark of the CPU hot paths (no model, no downloads):
+#   generate  raw claim/evidence JSON in the input schema, split over two files
+#   build     build_data on the first file, build_global on both
+#   embed     random unit-norm corpus vectors; each query is its positives' mean plus noise
+#   retrieve  run_retrieval (load, index, search, write) on a sample of queries
+#   eval      compute_metrics on that run
+# Data is generated once per scale/seed under --work_dir; only the stages are timed.
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+LABELS = ["RELEVANT", "PARTIALLY_RELEVANT", "NOT_RELEVANT", "ERROR"]
+LABEL_PROBS = [0.15, 0.1, 0.7, 0.05]
+
+def parse_scale(text):
+    # "10k" -> 10000, "1M" -> 1000000
+    units = {'k': 10**3, 'm': 10**6}
+    suffix = text[-1].lower()
+    return int(float(text[:-1]) * units[suffix]) if suffix in units else int(text)
+
+def make_vocab(rng, size=5000):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(3, 10, size)
+    return ["".join(rng.choice(letters, n)) for n in lengths]
+
+def generate_raw(paths, num_snippets, args):
+    # Claims carry ``snippets_per_claim`` evidence on average; ``dup_rate`` of the snippets repeat
+    # an earlier one, so both per-claim and cross-file deduplication have work to do
+    rng = np.random.default_rng(args.seed)
+    vocab = np.array(make_vocab(rng))
+    num_claims = max(2, math.ceil(num_snippets / args.snippets_per_claim))
+    pool = []
+    written = 0
+    for file_index, path in enumerate(paths):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        start, end = file_index * num_claims // len(paths), (file_index + 1) * num_claims // len(paths)
+        with open(path, 'w') as f:
+            f.write("[\n")
+            for c in range(start, end):
+                num_evidence = max(1, min(args.snippets_per_claim, num_snippets - written))
+                words = rng.integers(0, len(vocab), (num_evidence, 32))
+                lengths = rng.integers(12, 33, num_evidence)
+                evidence = []
+                for e in range(num_evidence):
+                    if pool and rng.random() < args.dup_rate:
+                        snippet = pool[rng.integers(len(pool))]
+                    else:
+                        snippet = " ".join(vocab[words[e, :lengths[e]]])
+                        if len(pool) < 100000:
+                            pool.append(snippet)
+                    evidence.append({
+                        "snippet": snippet,
+                        "relevance_label": LABELS[rng.choice(len(LABELS), p=LABEL_PROBS)],
+                        "cosine_similarity": round(float(rng.random()), 4),
+                    })
+                written += num_evidence
+                claim = " ".join(vocab[rng.integers(0, len(vocab), rng.integers(8, 16))])
+                f.write(("" if c == start else ",\n") + json.dumps({"claim": f"{claim} {c}", "evidence": evidence}))
+            f.write("\n]\n")
+
+def generate_embeddings(global_dir, emb_dir, args):
+    rng = np.random.default_rng(args.seed + 1)
+    corpus_ids = [item['text_id'] for item in iter_json(os.path.join(global_dir, "corpus.jsonl"))]
+    corpus_reps = np.empty((len(corpus_ids), args.dim), dtype=np.float32)
+    for start in range(0, len(corpus_ids), 100000):
+        block = rng.standard_normal((min(100000, len(corpus_ids) - start), args.dim), dtype=np.float32)
+        corpus_reps[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+
+    positives = {}
+    with open(os.path.join(global_dir, "qrels.tsv"), 'r') as f:
+        for line in f:
+            qid, _, docid, _ = line.rstrip('\n').split('\t')
+            positives.setdefault(qid, []).append(docid)
+    # Queries with at least one positive, in file order, up to --max_queries
+    query_ids = [item['text_id'] for item in iter_json(os.path.join(global_dir, "queries.jsonl")) if item['text_id'] in positives]
+    query_ids = query_ids[:args.max_queries]
+    row = {docid: i for i, docid in enumerate(corpus_ids)}
+    query_reps = np.stack([corpus_reps[[row[d] for d in positives[q]]].mean(axis=0) for q in query_ids])
+    query_reps += rng.standard_normal(query_reps.shape, dtype=np.float32) * (args.query_noise / np.sqrt(args.dim))
+    query_reps /= np.linalg.norm(query_reps, axis=1, keepdims=True)
+
+    write_embeddings(os.path.join(emb_dir, "corpus.emb"), corpus_ids, corpus_reps)
+    write_embeddings(os.path.join(emb_dir, "query.emb"), query_ids, query_reps)
+    with open(os.path.join(emb_dir, "qrels.tsv"), 'w') as f:
+        for qid in query_ids:
+            for docid in positives[qid]:
+                write_tsv(f, [qid, 0, docid, 1])
+
+def load_json_file(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def prepare(scale_dir, num_snippets, args, global_config):
+    # Generated inputs are reused while the generator settings are unchanged
+    settings = {k: getattr(args, k) for k in ("seed", "snippets_per_claim", "dup_rate", "dim", "max_queries", "query_noise")}
+    settings["num_snippets"] = num_snippets
+    manifest_path = os.path.join(scale_dir, "generator.json")
+    raw_paths = [os.path.join(scale_dir, "raw", f"synthetic_{split}.json") for split in ("train", "test")]
+    if os.path.exists(manifest_path) and load_json_file(manifest_path) == settings:
+        return raw_paths
+
+    print(f"Generating {num_snippets} snippets under {scale_dir}...")
+    generate_raw(raw_paths, num_snippets, args)
+    build_global(dict(global_config, input_paths=raw_paths, out_dir=os.path.join(scale_dir, "global"), num_workers=1))
+    generate_embeddings(os.path.join(scale_dir, "global"), os.path.join(scale_dir, "emb"), args)
+    with open(manifest_path, 'w') as f:
+        json.dump(settings, f, indent=2)
+    return raw_paths
+
+def run_stages(scale_dir, raw_paths, args, data_config, global_config):
+    emb_dir = os.path.join(scale_dir, "emb")
+    run_path = os.path.join(scale_dir, "out", "bench.run")
+    retrieve_config = {
+        "query_out_path": os.path.join(emb_dir, "query.emb"), "corpus_out_path": os.path.join(emb_dir, "corpus.emb"),
+        "run_path": run_path, "topk": args.topk, "index_type": args.index_type, "index_cache": False,
+    }
+    stages = {
+        "build_data": lambda: build_data(dict(data_config, input_path=raw_paths[0], out_dir=os.path.join(scale_dir, "out", "tevatron"))),
+        "build_global": lambda: build_global(dict(global_config, input_paths=raw_paths, out_dir=os.path.join(scale_dir, "out", "global"))),
+        "retrieve": lambda: run_retrieval(retrieve_config),
+        "eval": lambda: compute_metrics(os.path.join(emb_dir, "qrels.tsv"), run_path, args.metrics),
+    }
+
+    # Best of --repeat runs for every step, which is the least noisy estimate on a shared machine
+    results = {}
+    metrics = None
+    for name, fn in stages.items():
+        best = {}
+        for _ in range(args.repeat):
+            path = os.path.join(scale_dir, "out", f"{name}.telemetry.json")
+            with instrument(name, path, unit="claims") as stage:
+                output = fn()
+                if isinstance(output, int):
+                    # build_data / build_global return the number of claims they processed
+                    stage.count = output
+            if name == "eval":
+                metrics = {k: float(v) for k, v in output.items()}
+            for s in load_telemetry(path)["steps"]:
+                if s["name"] not in best or s["wall_s"] < best[s["name"]]["wall_s"]:
+                    best[s["name"]] = {"wall_s": s["wall_s"], "per_sec": s["per_sec"], "peak_rss_mb": s["peak_rss_mb"]}
+        results.update(best)
+    return results, metrics
+
+def compare(steps, metrics, baseline, tolerance, min_delta):
+    # A step regresses when it is slower than the baseline by more than ``tolerance`` (relative)
+    # and ``min_delta`` seconds (absolute, so millisecond steps do not flap). The data is seeded and
+    # search is exact, so metrics must match up to float summation order
+    rows = []
+    regressions = []
+    for name, s in steps.items():
+        base = baseline.get("steps", {}).get(name) if baseline else None
+        row = {"step": name, "wall_s": s["wall_s"], "per_sec": s["per_sec"], "baseline_s": None, "change": None, "status": "new"}
+        if base:
+            row["baseline_s"] = base["wall_s"]
+            row["change"] = s["wall_s"] / base["wall_s"] - 1 if base["wall_s"] > 0 else None
+            slower = s["wall_s"] - base["wall_s"]
+            row["status"] = "REGRESSION" if slower > min_delta and slower > tolerance * base["wall_s"] else "ok"
+            if row["status"] == "REGRESSION":
+                regressions.append(f"{name} {base['wall_s']:.3f}s -> {s['wall_s']:.3f}s")
+        rows.append(row)
+    for name, value in (baseline or {}).get("metrics", {}).items():
+        if name not in metrics or abs(metrics[name] - value) > 1e-6:
+            regressions.append(f"{name} changed: {value:.6f} -> {metrics.get(name, float('nan')):.6f}")
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time build_data, build_global, retrieval and eval on synthetic data and compare with a stored baseline")
+    parser.add_argument("--scales", nargs="+", default=["10k"], help="Corpus sizes in snippets, e.g. 10k 100k 1M")
+    parser.add_argument("--work_dir", default="runs/bench_suite", help="Generated data and stage outputs, one subdirectory per scale")
+    parser.add_argument("--data_config", default="configs/data_build.yaml", help="build_data settings (paths are overridden)")
+    parser.add_argument("--global_config", default="configs/global_data_build.yaml", help="build_global settings (paths are overridden)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update_baseline", action="store_true", help="Store this run's timings as the baseline for its scales")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Relative slowdown flagged as a regression")
+    parser.add_argument("--min_delta", type=float, default=0.05, help="Slowdowns below this many seconds are never flagged")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--snippets_per_claim", type=int, default=10)
+    parser.add_argument("--dup_rate", type=float, default=0.1)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--max_queries", type=int, default=1000, help="Queries searched per scale (flat search cost grows with queries x docs)")
+    parser.add_argument("--query_noise", type=float, default=1.5)
+    parser.add_argument("--topk", type=int, default=100)
+    parser.add_argument("--index_type", default="flat")
+    parser.add_argument("--metrics", nargs="+", default=DEFAULT_METRICS)
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    data_config = load_config(args.data_config)
+    global_config = load_config(args.global_config)
+    baselines = load_json_file(args.baseline) if os.path.exists(args.baseline) else {}
+
+    results = {}
+    all_regressions = []
+    for scale in args.scales:
+        num_snippets = parse_scale(scale)
+        scale_dir = os.path.join(args.work_dir, str(num_snippets))
+        raw_paths = prepare(scale_dir, num_snippets, args, global_config)
+        steps, metrics = run_stages(scale_dir, raw_paths, args, data_config, global_config)
+        machine = {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()}
+        baseline = baselines.get(str(num_snippets))
+        if baseline and baseline["machine"] != machine:
+            print(f"Warning: the {scale} baseline was recorded on {baseline['machine']}; timings may not be comparable")
+        rows, regressions = compare(steps, metrics, baseline, args.tolerance, args.min_delta)
+        results[str(num_snippets)] = {
+            "machine": machine,
+            "settings": {k: v for k, v in vars(args).items() if k not in ("scales", "work_dir", "output", "update_baseline", "baseline")},
+            "steps": steps, "metrics": metrics,
+        }
+        all_regressions.extend(f"[{scale}] {r}" for r in regressions)
+
+        print(f"\n== {scale} snippets ({num_snippets})")
+        print(pd.DataFrame(rows).to_markdown(index=False, floatfmt=".3f"))
+        print("Metrics: " + ", ".join(f"{k} {v:.4f}" for k, v in metrics.items()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        baselines.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2)
+        print(f"\nBaseline updated: {args.baseline}")
+    elif all_regressions:
+        print("\nRegressions:\n  " + "\n  ".join(all_regressions))
+        raise SystemExit(1)
+    else:
+        print("\nNo regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
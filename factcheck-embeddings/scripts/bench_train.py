@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+import yaml
+from factcheck_relevance.telemetry import load_telemetry, telemetry_path
+from factcheck_relevance.train import count_examples
+from factcheck_relevance.utils import load_config
+
+# "name:key=value,..." config overrides per setup. The first default is the setup before length
+# grouping: fixed padding to q_max_len/p_max_len, random batches, no accumulation
+DEFAULT_SETUPS = [
+    "fixed padding:group_by_length=false,dynamic_padding=false,gradient_accumulation_steps=1",
+    "configured:",
+]
+
+def parse_setup(spec):
+    name, _, overrides = spec.partition(':')
+    parsed = {}
+    for item in filter(None, overrides.split(',')):
+        key, value = item.split('=')
+        parsed[key] = yaml.safe_load(value)
+    return name, parsed
+
+def run_setup(config, overrides, max_steps, work_dir):
+    # Each setup trains in its own process, so peak RSS is that setup's alone
+    output_dir = os.path.join(work_dir, "model")
+    run_config = dict(config, **overrides, output_dir=output_dir, max_steps=max_steps, pretokenize=True, save_steps=10**9)
+    config_path = os.path.join(work_dir, "train.yaml")
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(run_config, f)
+    log_path = os.path.join(work_dir, "train.log")
+    with open(log_path, 'w') as log:
+        result = subprocess.run([sys.executable, '-m', 'factcheck_relevance.train', '--config', config_path],
+                                stdout=log, stderr=subprocess.STDOUT, env=dict(os.environ, CUDA_VISIBLE_DEVICES=""))
+    if result.returncode != 0:
+        with open(log_path, 'r') as log:
+            raise RuntimeError(f"Training failed:\n{''.join(log.readlines()[-20:])}")
+    with open(os.path.join(output_dir, "train_throughput.json"), 'r') as f:
+        stats = json.load(f)
+    stats["peak_rss_mb"] = load_telemetry(telemetry_path(output_dir, "train"))["peak_rss_mb"]
+    return run_config, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare training throughput and memory across batching setups")
+    parser.add_argument("--config", required=True, help="Training config")
+    parser.add_argument("--setups", nargs="+", default=DEFAULT_SETUPS, help="name:key=value,... config overrides")
+    parser.add_argument("--max_steps", type=int, default=50, help="Optimizer steps per run (each run starts from the config's model)")
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    num_examples = count_examples(config['train_dir'])
+    rows = []
+    for spec in args.setups:
+        name, overrides = parse_setup(spec)
+        with tempfile.TemporaryDirectory() as work_dir:
+            run_config, stats = run_setup(config, overrides, args.max_steps, work_dir)
+        batch = run_config['per_device_train_batch_size'] * run_config.get('gradient_accumulation_steps', 1)
+        examples_per_sec = stats["steps"] * batch / stats["train_runtime"]
+        rows.append({
+            "setup": name,
+            "batch": batch,
+            "grad_cache": run_config.get('grad_cache', False),
+            "s/step": stats["train_runtime"] / stats["steps"],
+            "tokens/sec": stats["tokens_per_sec"],
+            "real/padded": stats["padding_efficiency"],
+            "examples/sec": examples_per_sec,
+            "est. s/epoch": num_examples / examples_per_sec,
+            "peak_RSS_MB": stats["peak_rss_mb"],
+        })
+
+    print(f"\n{args.max_steps} optimizer steps per setup, {num_examples} training examples per epoch")
+    print(pd.DataFrame(rows).to_markdown(index=False, floatfmt=".2f"))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
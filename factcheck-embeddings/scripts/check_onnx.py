@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from factcheck_relevance.encoder import Encoder
+from factcheck_relevance.eval import DEFAULT_METRICS, Qrels, evaluate_runs
+from factcheck_relevance.onnx_encoder import OnnxEncoder
+from factcheck_relevance.retrieve import search_index, write_run_chunk
+from factcheck_relevance.utils import iter_json, load_config
+
+def read_items(path, limit):
+    ids = []
+    texts = []
+    for item in iter_json(path):
+        if limit and len(ids) >= limit:
+            break
+        ids.append(item['text_id'])
+        texts.append(item['text'])
+    return ids, texts
+
+def timed_encode(encoder, texts, is_query):
+    start = time.perf_counter()
+    reps = encoder.encode(texts, is_query=is_query)
+    return reps, time.perf_counter() - start
+
+def cosine(a, b):
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return np.einsum('ij,ij->i', a, b) / np.maximum(norms, 1e-12)
+
+def write_run(path, query_ids, query_reps, corpus_ids, corpus_reps, config, topk):
+    # Exact search, so metric differences come from the encoders alone
+    search_config = dict(config, index_type='flat', index_cache=False)
+    with open(path, 'w') as writer:
+        for qids, scores, indices in search_index(np.asarray(query_ids), query_reps, corpus_reps, None, search_config, topk, 4096):
+            write_run_chunk(writer, qids, corpus_ids, scores, indices)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check an ONNX export against the PyTorch encoder: cosine agreement, metric change and throughput")
+    parser.add_argument("--config", required=True, help="Inference config (model, inputs, qrels_path)")
+    parser.add_argument("--onnx_path", help="Exported ONNX directory (default: the config's onnx_path)")
+    parser.add_argument("--max_queries", type=int, help="Limit the number of queries")
+    parser.add_argument("--max_docs", type=int, help="Limit the corpus (metrics are then relative to the subset)")
+    parser.add_argument("--metrics", nargs="+", default=DEFAULT_METRICS)
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    onnx_path = args.onnx_path or config['onnx_path']
+    qrels_path = config.get('qrels_path', 'data/tevatron/dev_qrels.tsv')
+    topk = config.get('topk', 100)
+
+    query_ids, queries = read_items(config['query_in_path'], args.max_queries)
+    corpus_ids, docs = read_items(config['corpus_in_path'], args.max_docs)
+    corpus_ids = np.asarray(corpus_ids).astype(str)
+
+    encoders = {
+        "torch": Encoder.from_config(dict(config, encoder_backend='native')),
+        "onnx": OnnxEncoder.from_config(dict(config, encoder_backend='onnx', onnx_path=onnx_path)),
+    }
+    reps = {}
+    rows = []
+    for name, encoder in encoders.items():
+        query_reps, query_time = timed_encode(encoder, queries, True)
+        corpus_reps, corpus_time = timed_encode(encoder, docs, False)
+        reps[name] = (query_reps, corpus_reps)
+        rows.append({"backend": name, "queries/sec": len(queries) / query_time, "docs/sec": len(docs) / corpus_time})
+
+    query_cos = cosine(reps["torch"][0], reps["onnx"][0])
+    doc_cos = cosine(reps["torch"][1], reps["onnx"][1])
+
+    qrels = Qrels(qrels_path)
+    with tempfile.TemporaryDirectory() as work_dir:
+        run_paths = {name: os.path.join(work_dir, f"{name}.run") for name in encoders}
+        for name, (query_reps, corpus_reps) in reps.items():
+            write_run(run_paths[name], query_ids, query_reps, corpus_ids, corpus_reps, config, topk)
+        results = evaluate_runs(qrels, list(run_paths.values()), args.metrics)
+    for row in rows:
+        row.update({k: float(v) for k, v in results[run_paths[row["backend"]]].items()})
+
+    print(f"\n{len(queries)} queries x {len(docs)} docs, ONNX artifact {onnx_path}")
+    print(pd.DataFrame(rows).to_markdown(index=False, floatfmt=".4f"))
+    print(f"Cosine(torch, onnx): queries mean {query_cos.mean():.5f} min {query_cos.min():.5f}, "
+          f"docs mean {doc_cos.mean():.5f} min {doc_cos.min():.5f}")
+    deltas = {m: rows[1][m] - rows[0][m] for m in args.metrics}
+    print("Metric change (onnx - torch): " + ", ".join(f"{m} {d:+.4f}" for m, d in deltas.items()))
+    if args.output:
+        summary = {
+            "rows": rows, "metric_delta": deltas,
+            "query_cosine": {"mean": float(query_cos.mean()), "min": float(query_cos.min())},
+            "doc_cosine": {"mean": float(doc_cos.mean()), "min": float(doc_cos.min())},
+        }
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
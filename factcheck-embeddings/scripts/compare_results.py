@@ -1,50 +1,139 @@
 import os
+import json
+import argparse
+from glob import glob
+from multiprocessing import Pool
 import pandas as pd
-from factcheck_relevance.eval import compute_metrics
-from factcheck_relevance.utils import load_config
+from factcheck_relevance.eval import DEFAULT_METRICS, Qrels, evaluate_runs
+from factcheck_relevance.telemetry import load_telemetry, telemetry_path
+from factcheck_relevance.utils import hash_files
 
-def main():
-    runs_dir = "runs"
-    all_results = []
-    
-    # Mapping of run file names to their likely qrels
-    qrels_map = {
-        "dev.run": "data/tevatron/dev_qrels.tsv",
-        "test.run": "data/tevatron_test/dev_qrels.tsv",
-        "global.run": "data/global/qrels.tsv"
-    }
-    
-    for run_name in os.listdir(runs_dir):
+# Mapping of run file names to their likely qrels
+QRELS_MAP = {
+    "dev.run": "data/tevatron/dev_qrels.tsv",
+    "test.run": "data/tevatron_test/dev_qrels.tsv",
+    "global.run": "data/global/qrels.tsv"
+}
+DEFAULT_QRELS = "data/tevatron/dev_qrels.tsv"
+
+# Parsed qrels, shared with pool workers once through the initializer
+_QRELS = {}
+
+def _init_worker(qrels):
+    _QRELS.update(qrels)
+
+def _evaluate(args):
+    run_file_path, qrels_path, metrics = args
+    try:
+        return evaluate_runs(_QRELS[qrels_path], [run_file_path], metrics)[run_file_path], None
+    except Exception as e:
+        return None, str(e)
+
+def cache_key(run_file_path, qrels_hash, metrics):
+    # Runs are identified by size and mtime; qrels by content
+    st = os.stat(run_file_path)
+    return json.dumps([run_file_path, st.st_size, st.st_mtime_ns, qrels_hash, list(metrics)])
+
+def load_cache(cache_path):
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+def step_stat(telemetry, name, key):
+    for s in telemetry.get("steps", []):
+        if s["name"] == name:
+            return s[key]
+    return None
+
+def load_costs(run_file_path):
+    # Cost columns from the telemetry the stages write next to their outputs; read fresh on every
+    # call (they are tiny) so a re-encode without a new run file still shows up
+    costs = {}
+    encodes = [load_telemetry(p) for p in sorted(glob(os.path.join(os.path.dirname(run_file_path), "*.encode.telemetry.json")))]
+    if encodes:
+        costs['encode_s'] = sum(t["wall_s"] for t in encodes)
+    retrieve_path = telemetry_path(run_file_path, "retrieve")
+    if os.path.exists(retrieve_path):
+        retrieve = load_telemetry(retrieve_path)
+        costs['retrieve_s'] = retrieve["wall_s"]
+        costs['search_qps'] = step_stat(retrieve, "retrieve/search", "per_sec")
+        encodes.append(retrieve)
+    rss = [t["peak_rss_mb"] for t in encodes if t.get("peak_rss_mb") is not None]
+    if rss:
+        costs['peak_rss_mb'] = max(rss)
+    return costs
+
+def find_runs(runs_dir):
+    runs = []
+    for run_name in sorted(os.listdir(runs_dir)):
         run_dir = os.path.join(runs_dir, run_name)
         if not os.path.isdir(run_dir):
             continue
-        
+
         # Look for any .run files in the subdirectory
-        run_files = [f for f in os.listdir(run_dir) if f.endswith(".run")]
-        
-        for rf in run_files:
-            run_file_path = os.path.join(run_dir, rf)
-            qrels_path = qrels_map.get(rf, "data/tevatron/dev_qrels.tsv")
-            
-            if not os.path.exists(qrels_path):
+        for rf in sorted(f for f in os.listdir(run_dir) if f.endswith(".run")):
+            qrels_path = QRELS_MAP.get(rf, DEFAULT_QRELS)
+            if os.path.exists(qrels_path):
+                runs.append((run_name, rf, os.path.join(run_dir, rf), qrels_path))
+    return runs
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate every run under runs/ and print a comparison table")
+    parser.add_argument("--runs_dir", default="runs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--metrics", nargs="+", default=DEFAULT_METRICS)
+    parser.add_argument("--cache", help="Metrics cache file (default <runs_dir>/.metrics_cache.json, '' to disable)")
+    parser.add_argument("--no_costs", action="store_true", help="Leave out the encode/retrieve cost columns")
+    args = parser.parse_args()
+    if args.cache is None:
+        args.cache = os.path.join(args.runs_dir, ".metrics_cache.json")
+
+    runs = find_runs(args.runs_dir)
+    cache = load_cache(args.cache)
+    qrels_hashes = {q: hash_files([q]) for q in sorted({r[3] for r in runs})}
+    keys = [cache_key(path, qrels_hashes[qrels_path], args.metrics) for _, _, path, qrels_path in runs]
+
+    # Only new or changed runs are evaluated; each distinct qrels file is parsed once
+    stale = [(run, key) for run, key in zip(runs, keys) if key not in cache]
+    if stale:
+        qrels = {q: Qrels(q) for q in sorted({run[3] for run, _ in stale})}
+        tasks = [(run[2], run[3], args.metrics) for run, _ in stale]
+        workers = max(1, min(args.workers or 1, len(tasks)))
+        if workers > 1:
+            with Pool(workers, initializer=_init_worker, initargs=(qrels,)) as pool:
+                outputs = pool.map(_evaluate, tasks)
+        else:
+            _init_worker(qrels)
+            outputs = [_evaluate(t) for t in tasks]
+
+        for (run, key), (metrics, error) in zip(stale, outputs):
+            if error is not None:
+                print(f"Could not evaluate {run[0]}/{run[1]}: {error}")
                 continue
+            cache[key] = {k: float(v) for k, v in metrics.items()}
+
+        if args.cache:
+            # Drop entries for runs that no longer exist or have changed
+            live = set(keys)
+            with open(args.cache, 'w') as f:
+                json.dump({k: v for k, v in cache.items() if k in live}, f)
+
+    all_results = []
+    for (run_name, rf, path, _), key in zip(runs, keys):
+        if key in cache:
+            costs = {} if args.no_costs else load_costs(path)
+            all_results.append({'Model/Run': f"{run_name} ({rf})", **cache[key], **costs})
 
-            try:
-                metrics = compute_metrics(qrels_path, run_file_path)
-                metrics['Model/Run'] = f"{run_name} ({rf})"
-                all_results.append(metrics)
-            except Exception as e:
-                print(f"Could not evaluate {run_name}/{rf}: {e}")
-            
     if not all_results:
         print("No results found.")
         return
-        
+
     df = pd.DataFrame(all_results)
-    # Reorder columns to put Model/Run first
-    cols = ['Model/Run'] + [c for c in df.columns if c != 'Model/Run']
-    df = df[cols]
-    
+
     print("\n--- Comparison Table ---")
     print(df.to_markdown(index=False))
     print("\n")
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from factcheck_relevance.utils import iter_json, load_config
+
+async def request_json(reader, writer, method, path, payload=None):
+    # Minimal HTTP/1.1 client over an open keep-alive connection
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+async def open_connection(args):
+    if args.socket:
+        return await asyncio.open_unix_connection(args.socket)
+    return await asyncio.open_connection(args.host, args.port)
+
+async def client(args, claims, counter, latencies, errors):
+    reader, writer = await open_connection(args)
+    try:
+        while True:
+            i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            status, _ = await request_json(reader, writer, 'POST', '/search', {"claim": claims[i % len(claims)], "topk": args.topk})
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+async def health(args):
+    reader, writer = await open_connection(args)
+    _, stats = await request_json(reader, writer, 'GET', '/health')
+    writer.close()
+    return stats
+
+async def run(args, claims):
+    # Server counters are cumulative, so the run's share is the difference
+    before = await health(args)
+    counter = iter(range(args.requests))
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args, claims, counter, latencies, errors) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    after = await health(args)
+    stats = {k: after[k] - before[k] for k in ("requests", "batches", "cache_hits")}
+    return latencies, errors, elapsed, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Send concurrent claim searches to the retrieval service and report latency")
+    parser.add_argument("--config", required=True, help="Inference config; claims are read from its query_in_path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="Connect to this Unix socket instead of TCP")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--topk", type=int, default=10)
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    claims = [item['text'] for item in iter_json(config['query_in_path'])]
+    latencies, errors, elapsed, stats = asyncio.run(run(args, claims))
+
+    latencies_ms = np.array(latencies) * 1000
+    result = {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "errors": len(errors),
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_batch_size": stats["requests"] / max(stats["batches"], 1),
+        "cache_hits": stats["cache_hits"],
+    }
+    for key, value in result.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
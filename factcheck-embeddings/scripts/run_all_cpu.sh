@@ -6,10 +6,9 @@ cd "$(dirname "$0")/.."
 
 echo "🚀 Starting Full FactCheck Tevatron Pipeline on CPU"
 
-bash scripts/run_build.sh
-bash scripts/run_train_cpu.sh
-bash scripts/run_encode.sh
-bash scripts/run_retrieve.sh
-bash scripts/run_eval.sh
+# build -> train -> encode (corpus and queries in parallel) -> retrieve -> eval.
+# Stages whose inputs and config are unchanged since their last run are skipped; pass --force to rerun all.
+export PYTHONPATH=$PYTHONPATH:$(pwd)/src
+python -m factcheck_relevance.pipeline --pipeline cpu "$@"
 
 echo "✅ Pipeline completed successfully!"
@@ -1,76 +1,28 @@
 import argparse
 import sys
 import os
-import json
 import logging
-import pickle
-import glob
-from factcheck_relevance.utils import load_config, save_jsonl
+from functools import partial
+from factcheck_relevance.utils import load_config
+from factcheck_relevance.embedding_cache import cached_encode
+from factcheck_relevance.telemetry import instrument, telemetry_path
+from factcheck_relevance.encoder import native_encode
+from factcheck_relevance.sharded_encode import sharded_encode
 from tevatron.driver.encode import main as encode_main
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def apply_prefixes(in_path, out_path, prefix):
-    logger.info(f"Applying prefix '{prefix}' to {in_path} -> {out_path}")
-    with open(in_path, 'r') as f:
-        data = [json.loads(line) for line in f]
-    
-    prefixed_data = []
-    for item in data:
-        # Tevatron expects 'text_id' and 'text'
-        prefixed_item = {
-            "text_id": item['text_id'],
-            "text": f"{prefix}{item['text']}"
-        }
-        prefixed_data.append(prefixed_item)
-    
-    save_jsonl(prefixed_data, out_path)
-
-def check_cache(output_dir, output_path, current_model):
-    metadata_path = os.path.join(output_dir, "model_info.json")
-    if os.path.exists(output_path) and os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r') as f:
-                info = json.load(f)
-            if info.get('model_name_or_path') == current_model:
-                # Check if pkl exists
-                if os.path.isdir(output_path):
-                    if glob.glob(os.path.join(output_path, "*.pkl")):
-                        return True
-                elif output_path.endswith('.pkl'):
-                    return True
-        except:
-            return False
-    return False
-
-def run_encode_with_cache(config, is_query=False):
-    output_dir = config['output_dir']
-    os.makedirs(output_dir, exist_ok=True)
-    
-    target_path = config['query_out_path'] if is_query else config['corpus_out_path']
-    model_name = config['model_name_or_path']
-    
-    if check_cache(output_dir, target_path, model_name):
-        logger.info(f"Cache hit for {target_path}. Skipping encoding.")
-        return
-
-    # Prepare prefixed data
-    prefix = config.get('query_prefix', '') if is_query else config.get('document_prefix', '')
-    original_in_path = config['query_in_path'] if is_query else config['corpus_in_path']
-    
-    prefixed_in_path = os.path.join(output_dir, f"prefixed_{'query' if is_query else 'corpus'}.jsonl")
-    apply_prefixes(original_in_path, prefixed_in_path, prefix)
-
+def tevatron_encode(config, in_path, out_path, is_query=False):
     # Prepare arguments for Tevatron driver
     tevatron_args = [
-        "--output_dir", output_dir,
+        "--output_dir", config['output_dir'],
         "--model_name_or_path", config['model_name_or_path'],
         "--p_max_len", str(config.get('p_max_len', 192)),
         "--q_max_len", str(config.get('q_max_len', 64)),
         "--per_device_eval_batch_size", str(config.get('per_device_eval_batch_size', 32)),
-        "--encode_in_path", prefixed_in_path,
-        "--encoded_save_path", target_path,
+        "--encode_in_path", in_path,
+        "--encoded_save_path", out_path,
     ]
     
     if is_query:
@@ -84,10 +36,22 @@ def run_encode_with_cache(config, is_query=False):
     sys.argv = [sys.argv[0]] + tevatron_args
     encode_main()
 
-    # Save model info after successful encoding
-    metadata_path = os.path.join(output_dir, "model_info.json")
-    with open(metadata_path, 'w') as f:
-        json.dump({'model_name_or_path': model_name}, f)
+def run_encode_with_cache(config, is_query=False):
+    output_dir = config['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+    
+    target_path = config['query_out_path'] if is_query else config['corpus_out_path']
+    in_path = config['query_in_path'] if is_query else config['corpus_in_path']
+    
+    # Prefixes are applied before hashing, so they are part of each cache key
+    prefix = config.get('query_prefix', '') if is_query else config.get('document_prefix', '')
+    if config.get('encoder_backend', 'native') == 'tevatron':
+        encode_fn = tevatron_encode
+    elif config.get('encode_workers', 1) > 1:
+        encode_fn = sharded_encode
+    else:
+        encode_fn = native_encode
+    return cached_encode(config, in_path, target_path, is_query, partial(encode_fn, config, is_query=is_query), prefix=prefix)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -96,4 +60,6 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     config = load_config(args.config)
-    run_encode_with_cache(config, is_query=args.is_query)
+    target_path = config['query_out_path'] if args.is_query else config['corpus_out_path']
+    with instrument("encode", telemetry_path(target_path, "encode"), unit="texts") as s:
+        s.count = run_encode_with_cache(config, is_query=args.is_query)
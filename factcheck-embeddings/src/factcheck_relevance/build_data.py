@@ -1,40 +1,61 @@
 import argparse
-import random
-import math
+import hashlib
+import json
 import logging
 import os
+from contextlib import ExitStack
+import numpy as np
 from tqdm import tqdm
-from factcheck_relevance.utils import load_config, load_json, save_jsonl, save_tsv
+from factcheck_relevance.dedup import Canonicalizer
+from factcheck_relevance.sampling import sample_negatives
+from factcheck_relevance.telemetry import instrument
+from factcheck_relevance.utils import load_config, iter_json, open_output, write_jsonl, write_tsv
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def assign_split(claim_text, seed, dev_ratio):
+    # Hash-based split: stable per claim, needs no global shuffle, so the input can be streamed
+    digest = hashlib.blake2b(f"{seed}:{claim_text}".encode('utf-8'), digest_size=8).digest()
+    return 'dev' if int.from_bytes(digest, 'big') / 2**64 < dev_ratio else 'train'
+
+def make_canonicalizer(config):
+    mode = config.get('corpus_dedup', 'none')
+    if mode == 'none':
+        return None
+    if mode not in ('exact', 'near'):
+        raise ValueError(f"Unknown corpus_dedup: {mode}")
+    return Canonicalizer(near_dup=mode == 'near', num_perm=config.get('minhash_num_perm', 64),
+                         bands=config.get('minhash_bands', 16), threshold=config.get('near_dup_threshold', 0.8),
+                         shingle_size=config.get('shingle_size', 3), seed=config.get('seed', 42))
+
 def build_data(config):
-    raw_data = load_json(config['input_path'])
     seed = config.get('seed', 42)
-    random.seed(seed)
-    
-    # Shuffle and split claims
-    random.shuffle(raw_data)
-    num_claims = len(raw_data)
-    dev_size = int(num_claims * config.get('dev_ratio', 0.05))
-    dev_claims = raw_data[:dev_size]
-    train_claims = raw_data[dev_size:]
-    
-    logger.info(f"Total claims: {num_claims}, Train: {len(train_claims)}, Dev: {len(dev_claims)}")
+    dev_ratio = config.get('dev_ratio', 0.05)
+    rng = np.random.default_rng(seed)
+    out_dir = config['out_dir']
     
-    corpus = {}  # docid -> {text, title}
+    counts = {'train': 0, 'dev': 0}
+    skipped_no_pos = {'train': 0, 'dev': 0}
+    # Snippets repeated across claims (shared sources, boilerplate) are encoded once under the docid
+    # of their first occurrence; qrels, candidates and train texts refer to that canonical snippet
+    canon = make_canonicalizer(config)
     
-    def process_claims(claims, split_name):
-        instances = []
-        qrels = [] if split_name == 'dev' else None
-        queries = [] if split_name == 'dev' else None
-        
-        skipped_no_pos = 0
+    with ExitStack() as stack:
+        train_f = stack.enter_context(open_output(os.path.join(out_dir, "train", "train.jsonl")))
+        # The dev split produces no training instances; the file is kept for Tevatron's layout
+        stack.enter_context(open_output(os.path.join(out_dir, "dev", "dev.jsonl")))
+        corpus_f = stack.enter_context(open_output(os.path.join(out_dir, "corpus.jsonl")))
+        queries_f = stack.enter_context(open_output(os.path.join(out_dir, "dev_queries.jsonl")))
+        qrels_f = stack.enter_context(open_output(os.path.join(out_dir, "dev_qrels.tsv")))
+        # Claim -> its own evidence docids, for candidate-restricted retrieval
+        candidates_f = stack.enter_context(open_output(os.path.join(out_dir, "dev_candidates.jsonl")))
         
-        for i, c_data in enumerate(tqdm(claims, desc=f"Processing {split_name}")):
-            claim_id = f"{split_name}_c{i:06d}"
+        for c_data in tqdm(iter_json(config['input_path']), desc="Processing claims"):
             claim_text = c_data['claim']
+            split_name = assign_split(claim_text, seed, dev_ratio)
+            claim_id = f"{split_name}_c{counts[split_name]:06d}"
+            counts[split_name] += 1
             
             evidences = c_data.get('evidence', [])
             
@@ -42,6 +63,7 @@ def build_data(config):
             negatives = []
             
             seen_snippets = set()
+            seen_docids = set()
             
             for j, ev in enumerate(evidences):
                 snippet = ev['snippet']
@@ -55,91 +77,59 @@ def build_data(config):
                 
                 docid = f"d_{claim_id}_{j:04d}"
                 mapped_label = config['label_mapping'].get(label, 'drop')
+                if mapped_label not in ('positive', 'negative'):
+                    continue
                 
-                doc_obj = {"docid": docid, "title": "", "text": snippet}
+                is_new = True
+                if canon is not None:
+                    docid, snippet, is_new = canon.assign(docid, snippet)
+                    # Near-duplicates within a claim collapse too; the first label wins as above
+                    if docid in seen_docids:
+                        continue
+                    seen_docids.add(docid)
                 
-                if mapped_label == 'positive':
-                    positives.append((docid, snippet, sim))
-                    corpus[docid] = {"title": "", "text": snippet}
-                elif mapped_label == 'negative':
-                    negatives.append((docid, snippet, sim))
-                    corpus[docid] = {"title": "", "text": snippet}
+                (positives if mapped_label == 'positive' else negatives).append((docid, snippet, sim))
+                if is_new:
+                    write_jsonl(corpus_f, {"text_id": docid, "text": snippet})
             
             if split_name == 'dev':
-                queries.append({"query_id": claim_id, "query": claim_text})
+                write_jsonl(queries_f, {"text_id": claim_id, "text": claim_text})
+                write_jsonl(candidates_f, {"text_id": claim_id, "candidates": [d[0] for d in positives + negatives]})
                 for pid, _, _ in positives:
-                    qrels.append([claim_id, 0, pid, 1])
+                    write_tsv(qrels_f, [claim_id, 0, pid, 1])
             
             if not positives:
-                skipped_no_pos += 1
+                skipped_no_pos[split_name] += 1
                 continue
                 
             # Training instance generation (only for train split)
             if split_name == 'train':
-                for pid, p_snippet, _ in positives:
+                sampled = sample_negatives([n[2] for n in negatives], len(positives), config, rng)
+                if sampled is None:
+                    # Not enough negatives in this claim for a full instance
+                    continue
+                
+                for (pid, p_snippet, _), neg_idx in zip(positives, sampled):
                     instance = {
                         "query": claim_text,
                         "positives": [p_snippet],
-                        "negatives": []
+                        "negatives": [negatives[k][1] for k in neg_idx]
                     }
-                    
-                    # Sample negatives
-                    k_neg = config.get('k_neg', 3)
-                    if len(negatives) < k_neg:
-                        # Not enough negatives in this claim, just take all available
-                        sampled_negs = negatives
-                    else:
-                        # Hard negative sampling
-                        hard_pool_size = config.get('hard_pool_size', 20)
-                        hard_frac = config.get('hard_frac', 0.67)
-                        
-                        # Sort by similarity descending
-                        sorted_negs = sorted(negatives, key=lambda x: x[2], reverse=True)
-                        n_hard_pool = sorted_negs[:hard_pool_size]
-                        n_rand_pool = sorted_negs[hard_pool_size:]
-                        
-                        k_hard = math.ceil(hard_frac * k_neg)
-                        k_rand = k_neg - k_hard
-                        
-                        sampled_hard = random.sample(n_hard_pool, min(len(n_hard_pool), k_hard))
-                        remaining_rand = k_neg - len(sampled_hard)
-                        
-                        # Combine remaining pool
-                        rest_pool = [n for n in negatives if n[0] not in [s[0] for s in sampled_hard]]
-                        sampled_rand = random.sample(rest_pool, min(len(rest_pool), remaining_rand))
-                        
-                        sampled_negs = sampled_hard + sampled_rand
-                        
-                    for nid, n_snippet, _ in sampled_negs:
-                        instance["negatives"].append(n_snippet)
-                    
-                    if len(instance["negatives"]) >= k_neg:
-                        instances.append(instance)
-
-        logger.info(f"{split_name} split: processed {len(claims)} claims, skipped {skipped_no_pos} due to no positives.")
-        return instances, queries, qrels
-
-    train_instances, _, _ = process_claims(train_claims, 'train')
-    dev_instances, dev_queries, dev_qrels = process_claims(dev_claims, 'dev')
-    
-    # Save outputs
-    out_dir = config['out_dir']
-    save_jsonl(train_instances, os.path.join(out_dir, "train", "train.jsonl"))
-    save_jsonl(dev_instances, os.path.join(out_dir, "dev", "dev.jsonl"))
-    
-    # Corpus
-    corpus_list = [{"text_id": k, "text": v["text"]} for k, v in corpus.items()]
-    save_jsonl(corpus_list, os.path.join(out_dir, "corpus.jsonl"))
-    
-    # Dev artifacts
-    if dev_queries:
-        # Format queries for encoding
-        query_list = [{"text_id": q['query_id'], "text": q['query']} for q in dev_queries]
-        save_jsonl(query_list, os.path.join(out_dir, "dev_queries.jsonl"))
-    if dev_qrels:
-        save_tsv(dev_qrels, os.path.join(out_dir, "dev_qrels.tsv"))
+                    write_jsonl(train_f, instance)
 
+    num_claims = counts['train'] + counts['dev']
+    logger.info(f"Total claims: {num_claims}, Train: {counts['train']}, Dev: {counts['dev']}")
+    for split_name in ('train', 'dev'):
+        logger.info(f"{split_name} split: processed {counts[split_name]} claims, skipped {skipped_no_pos[split_name]} due to no positives.")
+    if canon is not None:
+        stats = canon.stats()
+        logger.info(f"Corpus dedup ({config['corpus_dedup']}): {stats['occurrences']} snippets -> {stats['canonical']} "
+                    f"({stats['exact_duplicates']} exact, {stats['near_duplicates']} near duplicates), "
+                    f"corpus and index {stats['corpus_reduction']:.1%} smaller, ~{stats['encode_reduction']:.1%} less text to encode")
+        with open(os.path.join(out_dir, "dedup_stats.json"), 'w') as f:
+            json.dump(stats, f, indent=2)
     logger.info("Data building complete.")
+    return num_claims
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -147,4 +137,5 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     config = load_config(args.config)
-    build_data(config)
+    with instrument("build_data", os.path.join(config['out_dir'], "build_data.telemetry.json"), unit="claims") as s:
+        s.count = build_data(config)
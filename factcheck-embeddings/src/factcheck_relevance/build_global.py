@@ -1,73 +1,196 @@
 import argparse
+import hashlib
+import json
 import logging
 import os
-from factcheck_relevance.utils import load_config, load_json, save_jsonl, save_tsv
+import pickle
+import tempfile
+from contextlib import ExitStack
+from multiprocessing import Pool
+from factcheck_relevance.telemetry import instrument
+from factcheck_relevance.utils import load_config, iter_json, hash_files, write_jsonl, write_tsv
 from tqdm import tqdm
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+OUTPUTS = ("corpus.jsonl", "queries.jsonl", "qrels.tsv", "candidates.jsonl")
+# Append state: the ingested input files and output sizes, plus the snippet hashes in docid order
+STATE_FILE = "global_state.json"
+KEYS_FILE = "snippet_keys.bin"
+KEY_SIZE = 16
+
+def snippet_key(snippet):
+    # Fixed-size content hash used as the dedup key instead of the full snippet text
+    return hashlib.blake2b(snippet.encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+def iter_claims(file_path, label_mapping):
+    # Yields (claim_text, [(snippet_key, snippet, is_positive), ...]) per claim
+    for item in iter_json(file_path):
+        evidence = []
+        for ev in item.get('evidence', []):
+            snippet = ev['snippet']
+            mapped_label = label_mapping.get(ev['relevance_label'], 'drop')
+            evidence.append((snippet_key(snippet), snippet, mapped_label == 'positive'))
+        yield item['claim'], evidence
+
+def parse_file(args):
+    # Spools the file's claims to ``spool_path`` as pickled batches, so neither the worker
+    # nor the parent ever holds a whole file's claims
+    file_path, label_mapping, spool_path, batch_size = args
+    with open(spool_path, 'wb') as f:
+        batch = []
+        for claim in iter_claims(file_path, label_mapping):
+            batch.append(claim)
+            if len(batch) == batch_size:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return spool_path
+
+def iter_spooled(spool_path):
+    with open(spool_path, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                break
+            yield from batch
+    os.remove(spool_path)
+
+def input_record(path):
+    return {"path": path, "hash": hash_files([path])}
+
+def load_state(out_dir, input_paths):
+    """The saved state if the current ``input_paths`` extend the ingested ones, else None."""
+    state_path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        logger.info(f"No {STATE_FILE} in {out_dir}, building from scratch")
+        return None
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    ingested = state['inputs']
+    if [r['path'] for r in ingested] != input_paths[:len(ingested)] or any(input_record(r['path']) != r for r in ingested):
+        logger.info("Ingested input files were changed, removed or reordered; rebuilding from scratch")
+        return None
+    return state
+
 def build_global(config):
     # input_paths should be a list in global_data_build.yaml
     input_paths = config['input_paths']
     out_dir = config['out_dir']
     os.makedirs(out_dir, exist_ok=True)
     
-    global_corpus = {}  # text -> docid (for dedup across files)
-    final_corpus = []   # list of {text_id, text}
+    global_corpus = {}  # snippet hash -> docid (for dedup across files)
     
-    all_queries = []
-    all_qrels = []
+    num_queries = 0
+    num_qrels = 0
     
     doc_counter = 0
     
-    for file_path in input_paths:
-        logger.info(f"Processing {file_path}...")
-        data = load_json(file_path)
-        file_basename = os.path.basename(file_path).replace(".json", "")
+    # Append mode only reads files after the ones already ingested; docids, claim ids and output
+    # order are the same as a full rebuild over all input_paths
+    state = load_state(out_dir, input_paths) if config.get('append', False) else None
+    if state is not None:
+        with open(os.path.join(out_dir, KEYS_FILE), 'rb') as f:
+            keys = f.read(state['num_docs'] * KEY_SIZE)
+        global_corpus = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: f"g_doc_{i:08d}" for i in range(state['num_docs'])}
+        doc_counter = state['num_docs']
+        num_queries, num_qrels = state['num_queries'], state['num_qrels']
+        logger.info(f"Appending to {out_dir}: {doc_counter} snippets and {num_queries} queries from {len(state['inputs'])} files")
+    ingested = state['inputs'] if state is not None else []
+    new_paths = input_paths[len(ingested):]
+    num_workers = min(config.get('num_workers', 1), len(new_paths))
+    
+    # The state file is replaced last. An interrupted append keeps the previous state, so the next
+    # append truncates the outputs back to the sizes it records; a full rebuild rewrites the outputs
+    # from the start, so the old state is dropped first
+    state_path = os.path.join(out_dir, STATE_FILE)
+    if state is None and os.path.exists(state_path):
+        os.remove(state_path)
+    
+    with ExitStack() as stack:
+        if num_workers > 1:
+            # Files are parsed concurrently into spool files on disk; they are read back in input
+            # order so doc ids are assigned exactly as in the serial build
+            logger.info(f"Parsing {len(new_paths)} files with {num_workers} workers...")
+            spool_dir = stack.enter_context(tempfile.TemporaryDirectory(dir=config.get('tmp_dir')))
+            pool = stack.enter_context(Pool(num_workers))
+            batch_size = config.get('parse_batch_size', 1000)
+            tasks = [(p, config['label_mapping'], os.path.join(spool_dir, f"{i:05d}.pkl"), batch_size) for i, p in enumerate(new_paths)]
+            per_file_claims = (iter_spooled(path) for path in pool.imap(parse_file, tasks))
+        else:
+            per_file_claims = (iter_claims(p, config['label_mapping']) for p in new_paths)
         
-        for i, item in enumerate(tqdm(data, desc=f"Extracting from {file_basename}")):
-            claim_text = item['claim']
-            claim_id = f"{file_basename}_c{i:06d}"
-            
-            # Record query
-            all_queries.append({"text_id": claim_id, "text": claim_text})
+        # Outputs are streamed as claims are read; only the hash -> docid map is kept in memory
+        files = {}
+        for name in OUTPUTS + (KEYS_FILE,):
+            path = os.path.join(out_dir, name)
+            if state is not None:
+                os.truncate(path, state['sizes'][name])
+            mode = ('a' if state is not None else 'w') + ('b' if name == KEYS_FILE else '')
+            files[name] = stack.enter_context(open(path, mode))
+        corpus_f, queries_f, qrels_f = files["corpus.jsonl"], files["queries.jsonl"], files["qrels.tsv"]
+        # Claim -> its own evidence docids, for candidate-restricted retrieval
+        candidates_f = files["candidates.jsonl"]
+        keys_f = files[KEYS_FILE]
+        
+        for file_path, claims in zip(new_paths, per_file_claims):
+            logger.info(f"Processing {file_path}...")
+            file_basename = os.path.splitext(os.path.basename(file_path))[0]
             
-            evidences = item.get('evidence', [])
-            for ev in evidences:
-                snippet = ev['snippet']
-                label = ev['relevance_label']
-                mapped_label = config['label_mapping'].get(label, 'drop')
+            for i, (claim_text, evidence) in enumerate(tqdm(claims, desc=f"Extracting from {file_basename}")):
+                claim_id = f"{file_basename}_c{i:06d}"
                 
-                # Global Deduplication
-                if snippet not in global_corpus:
-                    doc_id = f"g_doc_{doc_counter:08d}"
-                    global_corpus[snippet] = doc_id
-                    final_corpus.append({"text_id": doc_id, "text": snippet})
-                    doc_counter += 1
+                # Record query
+                write_jsonl(queries_f, {"text_id": claim_id, "text": claim_text})
+                num_queries += 1
                 
-                doc_id = global_corpus[snippet]
+                candidates = []
+                for key, snippet, is_positive in evidence:
+                    # Global Deduplication
+                    if key not in global_corpus:
+                        doc_id = f"g_doc_{doc_counter:08d}"
+                        global_corpus[key] = doc_id
+                        write_jsonl(corpus_f, {"text_id": doc_id, "text": snippet})
+                        keys_f.write(key)
+                        doc_counter += 1
+                    
+                    doc_id = global_corpus[key]
+                    candidates.append(doc_id)
+                    
+                    # If positive, add to qrels
+                    if is_positive:
+                        write_tsv(qrels_f, [claim_id, 0, doc_id, 1])
+                        num_qrels += 1
                 
-                # If positive, add to qrels
-                if mapped_label == 'positive':
-                    all_qrels.append([claim_id, 0, doc_id, 1])
+                write_jsonl(candidates_f, {"text_id": claim_id, "candidates": list(dict.fromkeys(candidates))})
 
-    # Save outputs
-    logger.info(f"Saving global corpus ({len(final_corpus)} unique snippets)...")
-    save_jsonl(final_corpus, os.path.join(out_dir, "corpus.jsonl"))
-    
-    logger.info(f"Saving all queries ({len(all_queries)} total)...")
-    save_jsonl(all_queries, os.path.join(out_dir, "queries.jsonl"))
-    
-    logger.info(f"Saving all qrels ({len(all_qrels)} instances)...")
-    save_tsv(all_qrels, os.path.join(out_dir, "qrels.tsv"))
+    sizes = {name: os.path.getsize(os.path.join(out_dir, name)) for name in OUTPUTS + (KEYS_FILE,)}
+    with open(f"{state_path}.tmp", 'w') as f:
+        json.dump({"inputs": ingested + [input_record(p) for p in new_paths], "num_docs": doc_counter,
+                   "num_queries": num_queries, "num_qrels": num_qrels, "sizes": sizes}, f, indent=2)
+    os.replace(f"{state_path}.tmp", state_path)
+
+    logger.info(f"Saved global corpus ({doc_counter} unique snippets)")
+    logger.info(f"Saved all queries ({num_queries} total)")
+    logger.info(f"Saved all qrels ({num_qrels} instances)")
     
     logger.info("Global data build complete.")
+    return num_queries - (state['num_queries'] if state is not None else 0)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", required=True, help="Path to config yaml")
+    parser.add_argument("--num_workers", type=int, help="Parse input files in a process pool (overrides config)")
+    parser.add_argument("--append", action="store_true", help="Only add input files after the ones already built (overrides config)")
     args = parser.parse_args()
     
     config = load_config(args.config)
-    build_global(config)
+    if args.num_workers:
+        config['num_workers'] = args.num_workers
+    if args.append:
+        config['append'] = True
+    with instrument("build_global", os.path.join(config['out_dir'], "build_global.telemetry.json"), unit="claims") as s:
+        s.count = build_global(config)
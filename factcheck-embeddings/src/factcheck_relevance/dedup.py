@@ -0,0 +1,116 @@
+import hashlib
+import re
+import numpy as np
+
+# Corpus-wide snippet canonicalization for build_data. The first occurrence of a snippet keeps its
+# docid and text; later occurrences map to it when their content is identical, or (with near_dup)
+# when their MinHash signatures agree on at least ``threshold`` of the permutations, i.e. the
+# estimated Jaccard similarity of their word shingles. Candidates come from LSH banding, so each
+# snippet is compared only with the canonical snippets that share a band with it.
+
+MERSENNE = np.uint64((1 << 61) - 1)
+WORD_RE = re.compile(r"\w+")
+
+def content_key(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def shingles(text, size):
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+class MinHasher:
+    def __init__(self, num_perm=64, shingle_size=3, seed=42):
+        rng = np.random.default_rng(seed)
+        # Universal hashing (a * x + b) mod p on 32-bit shingle hashes; a < 2^29 keeps a * x below 2^61
+        self.a = rng.integers(1, 1 << 29, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 29, num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def signature(self, text):
+        hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little')
+                           for s in shingles(text, self.shingle_size)], dtype=np.uint64)
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE).min(axis=1)
+
+class Canonicalizer:
+    """Maps (docid, snippet) occurrences to canonical (docid, snippet), first occurrence wins."""
+
+    def __init__(self, near_dup=False, num_perm=64, bands=16, threshold=0.8, shingle_size=3, seed=42):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.exact = {}        # content key -> canonical row
+        self.docids = []
+        self.texts = []
+        self.near_dup = near_dup
+        if near_dup:
+            self.hasher = MinHasher(num_perm, shingle_size, seed)
+            self.rows_per_band = num_perm // bands
+            self.threshold = threshold
+            self.buckets = {}  # (band, band signature bytes) -> canonical rows
+            self.signatures = np.zeros((1024, num_perm), dtype=np.uint64)
+        self.occurrences = 0
+        self.exact_dups = 0
+        self.near_dups = 0
+        self.words_in = 0
+        self.words_out = 0
+
+    def _band_keys(self, signature):
+        r = self.rows_per_band
+        return [(band, signature[band * r:(band + 1) * r].tobytes()) for band in range(len(signature) // r)]
+
+    def _near_match(self, signature, band_keys):
+        best, best_score = None, self.threshold
+        for row in {row for key in band_keys for row in self.buckets.get(key, ())}:
+            score = float(np.mean(self.signatures[row] == signature))
+            # Ties go to the earliest canonical snippet, so results do not depend on set order
+            if score > best_score or (score == best_score and (best is None or row < best)):
+                best, best_score = row, score
+        return best
+
+    def assign(self, docid, text):
+        """Returns (canonical docid, canonical text, is_new)."""
+        self.occurrences += 1
+        key = content_key(text)
+        row = self.exact.get(key)
+        if row is not None:
+            self.exact_dups += 1
+            return self.docids[row], self.texts[row], False
+        # The embedding cache already encodes repeated texts once, so only distinct texts count towards encode cost
+        num_words = len(WORD_RE.findall(text))
+        self.words_in += num_words
+
+        if self.near_dup:
+            signature = self.hasher.signature(text)
+            band_keys = self._band_keys(signature)
+            row = self._near_match(signature, band_keys)
+            if row is not None:
+                self.near_dups += 1
+                # Later exact repeats of this variant skip the MinHash step
+                self.exact[key] = row
+                return self.docids[row], self.texts[row], False
+
+        row = len(self.docids)
+        self.exact[key] = row
+        self.docids.append(docid)
+        self.texts.append(text)
+        self.words_out += num_words
+        if self.near_dup:
+            if row == len(self.signatures):
+                self.signatures = np.concatenate([self.signatures, np.zeros_like(self.signatures)])
+            self.signatures[row] = signature
+            for band_key in band_keys:
+                self.buckets.setdefault(band_key, []).append(row)
+        return docid, text, True
+
+    def stats(self):
+        unique = len(self.docids)
+        return {
+            "occurrences": self.occurrences,
+            "canonical": unique,
+            "exact_duplicates": self.exact_dups,
+            "near_duplicates": self.near_dups,
+            "corpus_reduction": 1 - unique / self.occurrences if self.occurrences else 0.0,
+            # Encode cost is roughly linear in tokens; exact repeats were never re-encoded (see embedding_cache)
+            "encode_reduction": 1 - self.words_out / self.words_in if self.words_in else 0.0,
+        }
@@ -0,0 +1,174 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+import numpy as np
+from factcheck_relevance.embedding_store import append_embeddings, stored_prefix, write_embeddings
+from factcheck_relevance.telemetry import step
+from factcheck_relevance.utils import hash_files, iter_json, load_reps, save_jsonl
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+
+# Top-level files that determine a checkpoint's outputs. Encode artifacts
+# (corpus.pkl, model_info.json, ...) often live in the same directory and are ignored.
+MODEL_FILE_PATTERNS = [
+    "config.json", "*.safetensors", "pytorch_model*.bin", "tokenizer*", "special_tokens_map.json",
+    "vocab.txt", "*.model", "sentence_bert_config.json", "modules.json", "*.onnx", "onnx_config.json",
+]
+
+def model_fingerprint(model_name_or_path, revision=None):
+    # Local checkpoints are fingerprinted by content, hub ids by name and revision
+    if not os.path.isdir(model_name_or_path):
+        return f"{model_name_or_path}@{revision or 'main'}"
+
+    files = set()
+    for pattern in MODEL_FILE_PATTERNS:
+        files.update(glob.glob(os.path.join(model_name_or_path, pattern)))
+    return hash_files(sorted(files))
+
+def encoder_fingerprint(config):
+    # The ONNX backend encodes with the exported (possibly quantized) graph, not the checkpoint
+    if config.get('encoder_backend', 'native') == 'onnx':
+        return model_fingerprint(config['onnx_path'])
+    return model_fingerprint(config['model_name_or_path'], config.get('model_revision'))
+
+def encoder_backend(config):
+    # How the vectors are computed; backends agree only to within float noise (int8 ONNX not even that)
+    backend = config.get('encoder_backend', 'native')
+    info = {"backend": backend}
+    if backend != 'tevatron':
+        info["sharded"] = config.get('encode_workers', 1) > 1
+    if backend == 'onnx':
+        with open(os.path.join(config['onnx_path'], "onnx_config.json"), 'r') as f:
+            info["quantized"] = json.load(f).get('quantized', False)
+    return info
+
+def text_key(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+def key_array(keys):
+    return np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(len(keys), KEY_SIZE)
+
+class EmbeddingCache:
+    """Persistent text-hash -> vector store for one (model, backend, prefix, max length, role) namespace.
+
+    Vectors are appended as immutable shards (``<shard>.reps.npy`` + ``<shard>.keys.npy``);
+    the keys file is written last, so a shard without keys is an interrupted write and is ignored.
+    """
+
+    def __init__(self, cache_dir, namespace_info):
+        namespace = hashlib.blake2b(json.dumps(namespace_info, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+        self.dir = os.path.join(cache_dir, namespace)
+        os.makedirs(self.dir, exist_ok=True)
+
+        meta_path = os.path.join(self.dir, "namespace.json")
+        if not os.path.exists(meta_path):
+            with open(meta_path, 'w') as f:
+                json.dump(namespace_info, f, indent=2)
+
+        self.index = {}   # key -> (shard number, row)
+        self.shards = []  # memory-mapped reps per shard
+        for keys_path in sorted(glob.glob(os.path.join(self.dir, "*.keys.npy"))):
+            self._register(keys_path[:-len(".keys.npy")])
+
+    def _register(self, shard_prefix):
+        keys = np.load(shard_prefix + ".keys.npy")
+        reps = np.load(shard_prefix + ".reps.npy", mmap_mode='r')
+        shard_id = len(self.shards)
+        self.shards.append(reps)
+        for row, key in enumerate(keys):
+            self.index[key.tobytes()] = (shard_id, row)
+
+    def __len__(self):
+        return len(self.index)
+
+    def missing(self, keys):
+        # Unique keys not yet cached, in first-seen order
+        return [k for k in dict.fromkeys(keys) if k not in self.index]
+
+    def add(self, keys, reps):
+        shard_prefix = os.path.join(self.dir, f"shard_{uuid.uuid4().hex}")
+        np.save(shard_prefix + ".reps.npy", np.ascontiguousarray(reps, dtype=np.float32))
+        np.save(shard_prefix + ".keys.tmp.npy", key_array(keys))
+        os.replace(shard_prefix + ".keys.tmp.npy", shard_prefix + ".keys.npy")
+        self._register(shard_prefix)
+
+    def get(self, keys):
+        locs = np.array([self.index[k] for k in keys], dtype=np.int64).reshape(-1, 2)
+        dim = self.shards[0].shape[1] if self.shards else 0
+        out = np.empty((len(keys), dim), dtype=np.float32)
+        for shard_id in np.unique(locs[:, 0]):
+            mask = locs[:, 0] == shard_id
+            out[mask] = self.shards[shard_id][locs[mask, 1]]
+        return out
+
+def cached_encode(config, in_path, out_path, is_query, encode_fn, prefix=''):
+    """Encode ``in_path`` into embeddings at ``out_path`` (a ``.pkl`` or an embedding store).
+
+    Only texts missing from the cache are passed to ``encode_fn(in_path, out_path)``,
+    which must write a Tevatron pickle for the given jsonl file.
+    """
+    max_len = config.get('q_max_len', 64) if is_query else config.get('p_max_len', 192)
+    namespace_info = {
+        "model": encoder_fingerprint(config),
+        "encoder": encoder_backend(config),
+        "prefix": prefix,
+        "max_len": max_len,
+        "role": "query" if is_query else "passage",
+    }
+    cache_dir = config.get('embedding_cache_dir', 'runs/embedding_cache')
+    cache = EmbeddingCache(cache_dir, namespace_info)
+
+    ids = []
+    keys = []
+    texts = {}
+    with step("read_input", unit="texts") as s:
+        for item in iter_json(in_path):
+            text = f"{prefix}{item['text']}"
+            key = text_key(text)
+            ids.append(item['text_id'])
+            keys.append(key)
+            texts.setdefault(key, text)
+        s.count = len(ids)
+
+    # A store this encoder wrote from a prefix of the same input (e.g. build_global --append)
+    # keeps its rows; only the rows after it are encoded and appended
+    dtype = config.get('embedding_dtype', 'float32')
+    all_keys = key_array(keys)
+    start = stored_prefix(out_path, ids, all_keys, namespace_info, dtype)
+    if start:
+        logger.info(f"{out_path} already holds the first {start} of {len(ids)} texts, appending the rest")
+        if start == len(ids):
+            return 0
+
+    missing = cache.missing(keys[start:])
+    logger.info(f"Embedding cache {cache.dir}: {len(keys) - start - len(missing)}/{len(keys) - start} texts cached, encoding {len(missing)}")
+
+    if missing:
+        work_dir = os.path.join(cache.dir, f"tmp_{uuid.uuid4().hex}")
+        os.makedirs(work_dir)
+        try:
+            tmp_in = os.path.join(work_dir, "texts.jsonl")
+            tmp_out = os.path.join(work_dir, "reps.pkl")
+            save_jsonl(({"text_id": k.hex(), "text": texts[k]} for k in missing), tmp_in)
+            with step("encode_texts", count=len(missing), unit="texts"):
+                encode_fn(tmp_in, tmp_out)
+
+            new_ids, new_reps = load_reps(tmp_out)
+            cache.add([bytes.fromhex(i) for i in new_ids], new_reps)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with step("write_embeddings", count=len(ids) - start, unit="texts"):
+        if start:
+            append_embeddings(out_path, ids[start:], cache.get(keys[start:]), all_keys[start:])
+        else:
+            reps = cache.get(keys)
+            write_embeddings(out_path, ids, reps, model=config['model_name_or_path'], dtype=dtype, keys=all_keys, source=namespace_info)
+    logger.info(f"Saved {len(ids)} embeddings to {out_path}")
+    return len(ids) - start
@@ -0,0 +1,180 @@
+import argparse
+import io
+import json
+import logging
+import os
+import pickle
+import shutil
+import numpy as np
+from factcheck_relevance.utils import load_reps
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# On-disk embedding store: a directory holding
+#   embeddings.npy  contiguous (count, dim) float32/float16 matrix
+#   ids.npy         fixed-width unicode id table, row-aligned with embeddings
+#   meta.json       model, dim, count, dtype, normalized
+#   keys.npy        optional (count, 16) uint8 text hashes, written by the embedding cache
+# Both arrays are opened with np.load(mmap_mode='r'), so loading copies nothing and
+# processes opening the same store share the page cache. Rows can be appended in place
+# (append_embeddings); meta.json is rewritten last and its count is authoritative.
+
+FORMAT_VERSION = 1
+SUPPORTED_DTYPES = ('float32', 'float16')
+
+def is_embedding_store(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "meta.json"))
+
+def save_embeddings(path, ids, reps, model=None, dtype='float32', keys=None, source=None):
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+    reps = np.asarray(reps)
+    if reps.ndim != 2 or reps.shape[0] != len(ids):
+        raise ValueError(f"Expected a ({len(ids)}, dim) matrix, got shape {reps.shape}")
+
+    norms = np.linalg.norm(reps.astype(np.float32, copy=False), axis=1)
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "model": model,
+        "dim": int(reps.shape[1]),
+        "count": int(reps.shape[0]),
+        "dtype": dtype,
+        "normalized": bool(len(norms) and np.allclose(norms, 1.0, atol=1e-3)),
+    }
+    if source is not None:
+        # What produced the rows (encoder fingerprint etc.); appends must come from the same source
+        meta["source"] = source
+
+    # Write into a sibling temp dir and swap it in, so readers never see a partial store
+    tmp_path = f"{path.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "embeddings.npy"), np.ascontiguousarray(reps, dtype=dtype))
+    np.save(os.path.join(tmp_path, "ids.npy"), np.array([str(i) for i in ids], dtype=str))
+    if keys is not None:
+        np.save(os.path.join(tmp_path, "keys.npy"), np.asarray(keys, dtype=np.uint8))
+    with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    os.replace(tmp_path, path)
+    return meta
+
+def open_embeddings(path):
+    """Open a store as memory-mapped (ids, reps, meta) without reading the matrix."""
+    with open(os.path.join(path, "meta.json"), 'r') as f:
+        meta = json.load(f)
+    # Rows past meta's count are left over from an interrupted append
+    reps = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')[:meta['count']]
+    ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')[:meta['count']]
+    return ids, reps, meta
+
+def stored_prefix(path, ids, keys, source, dtype='float32'):
+    """Number of leading rows of the store at ``path`` that already hold ``ids``/``keys`` (a uint8 array).
+
+    0 unless the store was written from the same ``source`` and dtype with text keys and its
+    rows are a prefix of the given ones, i.e. the input only gained rows at the end.
+    """
+    if not is_embedding_store(path) or not os.path.exists(os.path.join(path, "keys.npy")):
+        return 0
+    stored_ids, _, meta = open_embeddings(path)
+    count = meta['count']
+    if meta.get('source') != source or meta['dtype'] != dtype or count > len(ids):
+        return 0
+    # The fixed-width id table cannot take longer ids in place
+    if max(map(len, map(str, ids[count:])), default=0) > stored_ids.dtype.itemsize // 4:
+        return 0
+    stored_keys = np.load(os.path.join(path, "keys.npy"), mmap_mode='r')[:count]
+    if not (np.array_equal(stored_keys, keys[:count]) and stored_ids.tolist() == [str(i) for i in ids[:count]]):
+        return 0
+    return count
+
+def read_npy_header(f):
+    # (version, shape, fortran_order, dtype) of an open .npy file, leaving it at the start of the data
+    version = np.lib.format.read_magic(f)
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    return (version, *read_header(f))
+
+def _append_npy(file_path, count, rows):
+    # Writes ``rows`` after the first ``count`` rows of an .npy file and updates its header in place.
+    # np.save pads the header so the leading dimension can grow without moving the data.
+    with open(file_path, 'r+b') as f:
+        version, shape, fortran_order, dtype = read_npy_header(f)
+        write_header = np.lib.format.write_array_header_1_0 if version == (1, 0) else np.lib.format.write_array_header_2_0
+        data_offset = f.tell()
+        if fortran_order or np.shape(rows)[1:] != shape[1:]:
+            raise ValueError(f"Cannot append rows of shape {np.shape(rows)} to {file_path} {shape}")
+        header = io.BytesIO()
+        write_header(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                              'shape': (count + len(rows),) + shape[1:]})
+        if header.tell() != data_offset:
+            raise ValueError(f"No room to grow the header of {file_path}")
+        row_bytes = dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+        f.seek(data_offset + count * row_bytes)
+        f.truncate()
+        f.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+        f.seek(0)
+        f.write(header.getvalue())
+
+def append_embeddings(path, ids, reps, keys):
+    """Append rows (ids, reps and uint8 text keys) to the store at ``path`` in place."""
+    _, _, meta = open_embeddings(path)
+    count = meta['count']
+    reps = np.asarray(reps)
+    if reps.ndim != 2 or reps.shape != (len(ids), meta['dim']):
+        raise ValueError(f"Expected a ({len(ids)}, {meta['dim']}) matrix, got shape {reps.shape}")
+    for name, rows in (("embeddings.npy", reps), ("ids.npy", np.array([str(i) for i in ids], dtype=str)), ("keys.npy", keys)):
+        _append_npy(os.path.join(path, name), count, rows)
+
+    norms = np.linalg.norm(reps.astype(np.float32, copy=False), axis=1)
+    meta["count"] = count + len(ids)
+    meta["normalized"] = bool(meta["normalized"] and np.allclose(norms, 1.0, atol=1e-3))
+    with open(os.path.join(path, "meta.json.tmp"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+    return meta
+
+def embedding_files(path):
+    # Files holding the embeddings at ``path``, for fingerprinting
+    if is_embedding_store(path):
+        return [os.path.join(path, name) for name in ("embeddings.npy", "ids.npy")]
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.pkl'))
+    return [path]
+
+def load_embeddings(path):
+    # Reads either an embedding store or Tevatron pickle output, returning (ids, reps)
+    if is_embedding_store(path):
+        ids, reps, _ = open_embeddings(path)
+        return ids, reps
+    return load_reps(path)
+
+def write_embeddings(path, ids, reps, model=None, dtype='float32', keys=None, source=None):
+    # Output format follows the path: ".pkl" keeps Tevatron's pickle, anything else is a store
+    if path.endswith('.pkl'):
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump((np.asarray(reps, dtype=np.float32), list(ids)), f, protocol=4)
+    else:
+        save_embeddings(path, ids, reps, model=model, dtype=dtype, keys=keys, source=source)
+
+def convert(input_path, output_path, model=None, dtype='float32'):
+    ids, reps = load_reps(input_path)
+    meta = save_embeddings(output_path, ids, reps, model=model, dtype=dtype)
+    logger.info(f"Converted {input_path} -> {output_path} ({meta['count']} x {meta['dim']}, {dtype})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert Tevatron pickle embeddings to a memory-mapped store")
+    parser.add_argument("--input", required=True, help="Tevatron .pkl file or directory of .pkl shards")
+    parser.add_argument("--output", required=True, help="Output store directory")
+    parser.add_argument("--model", help="Model name recorded in the metadata header")
+    parser.add_argument("--dtype", default="float32", choices=SUPPORTED_DTYPES)
+    args = parser.parse_args()
+
+    convert(args.input, args.output, model=args.model, dtype=args.dtype)
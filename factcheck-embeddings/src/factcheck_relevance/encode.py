@@ -1,29 +1,15 @@
 import argparse
 import sys
 import os
-import glob
-import json
+from functools import partial
 from factcheck_relevance.utils import load_config
+from factcheck_relevance.embedding_cache import cached_encode
+from factcheck_relevance.telemetry import instrument, telemetry_path
+from factcheck_relevance.encoder import native_encode
+from factcheck_relevance.sharded_encode import sharded_encode
 from tevatron.driver.encode import main as encode_main
 
-def check_cache(output_dir, output_path, current_model):
-    metadata_path = os.path.join(output_dir, "model_info.json")
-    if os.path.exists(output_path) and os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r') as f:
-                info = json.load(f)
-            if info.get('model_name_or_path') == current_model:
-                # Also check if pkl exists
-                if os.path.isdir(output_path):
-                    if glob.glob(os.path.join(output_path, "*.pkl")):
-                        return True
-                elif output_path.endswith('.pkl'):
-                    return True
-        except:
-            return False
-    return False
-
-def run_encode(config, is_query=False):
+def tevatron_encode(config, in_path, out_path, is_query=False):
     # Prepare arguments for Tevatron driver
     tevatron_args = [
         "--output_dir", config['output_dir'],
@@ -31,40 +17,36 @@ def run_encode(config, is_query=False):
         "--p_max_len", str(config.get('p_max_len', 192)),
         "--q_max_len", str(config.get('q_max_len', 64)),
         "--per_device_eval_batch_size", str(config.get('per_device_eval_batch_size', 32)),
+        "--encode_in_path", os.path.abspath(in_path),
+        "--encoded_save_path", out_path,
     ]
     
     if config.get('dataset_name'):
         tevatron_args.extend(["--dataset_name", config['dataset_name']])
         
-    model_name = config['model_name_or_path']
     if is_query:
-        target_path = config['query_out_path']
-        if check_cache(config['output_dir'], target_path, model_name):
-            print(f"Cache hit for {target_path}. Skipping encoding.")
-            return
-        in_path = os.path.abspath(config['query_in_path'])
         tevatron_args.append("--encode_is_qry")
-        tevatron_args.extend(["--encode_in_path", in_path])
-        tevatron_args.extend(["--encoded_save_path", target_path])
-    else:
-        target_path = config['corpus_out_path']
-        if check_cache(config['output_dir'], target_path, model_name):
-            print(f"Cache hit for {target_path}. Skipping encoding.")
-            return
-        in_path = os.path.abspath(config['corpus_in_path'])
-        tevatron_args.extend(["--encode_in_path", in_path])
-        tevatron_args.extend(["--encoded_save_path", target_path])
 
     # Set CUDA_VISIBLE_DEVICES="" to force CPU
     os.environ["CUDA_VISIBLE_DEVICES"] = ""
     
     sys.argv = [sys.argv[0]] + tevatron_args
     encode_main()
+
+def run_encode(config, is_query=False):
+    if is_query:
+        in_path, target_path = config['query_in_path'], config['query_out_path']
+    else:
+        in_path, target_path = config['corpus_in_path'], config['corpus_out_path']
     
-    # Save model info after successful encoding
-    metadata_path = os.path.join(config['output_dir'], "model_info.json")
-    with open(metadata_path, 'w') as f:
-        json.dump({'model_name_or_path': model_name}, f)
+    # Only texts not already in the embedding cache reach the encoder
+    if config.get('encoder_backend', 'native') == 'tevatron':
+        encode_fn = tevatron_encode
+    elif config.get('encode_workers', 1) > 1:
+        encode_fn = sharded_encode
+    else:
+        encode_fn = native_encode
+    return cached_encode(config, in_path, target_path, is_query, partial(encode_fn, config, is_query=is_query))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -73,4 +55,6 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     config = load_config(args.config)
-    run_encode(config, is_query=args.is_query)
+    target_path = config['query_out_path'] if args.is_query else config['corpus_out_path']
+    with instrument("encode", telemetry_path(target_path, "encode"), unit="texts") as s:
+        s.count = run_encode(config, is_query=args.is_query)
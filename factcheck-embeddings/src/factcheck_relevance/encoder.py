@@ -0,0 +1,158 @@
+import logging
+import os
+from itertools import islice
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoTokenizer
+from tevatron.modeling import DenseModelForInference
+from factcheck_relevance.embedding_store import write_embeddings
+from factcheck_relevance.telemetry import step
+from factcheck_relevance.utils import iter_json
+
+logger = logging.getLogger(__name__)
+
+class Encoder:
+    """Bi-encoder loaded once and reused across encode calls.
+
+    Produces the same vectors as Tevatron's encode driver (same model wrapper, tokenizer and
+    pooling), but sorts texts by token length and pads each batch only to its longest member
+    instead of to ``max_len``. Outputs are returned in input order.
+    """
+
+    def __init__(self, model_name_or_path, q_max_len=64, p_max_len=192, batch_size=32,
+                 max_batch_tokens=None, sort_buffer=10000, use_fast_tokenizer=False, device='cpu'):
+        self.q_max_len = q_max_len
+        self.p_max_len = p_max_len
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.sort_buffer = sort_buffer
+        self.device = torch.device(device)
+
+        # Tevatron loads the slow tokenizer; keep that by default so token ids match exactly
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, use_fast=use_fast_tokenizer)
+        self.load_model(model_name_or_path)
+
+    def load_model(self, model_name_or_path):
+        config = AutoConfig.from_pretrained(model_name_or_path, num_labels=1)
+        self.model = DenseModelForInference.build(model_name_or_path=model_name_or_path, config=config)
+        self.model.to(self.device)
+        self.model.eval()
+        self.dim = self.model.lm_p.config.hidden_size
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        return cls(
+            encoder_path(config),
+            q_max_len=config.get('q_max_len', 64),
+            p_max_len=config.get('p_max_len', 192),
+            batch_size=config.get('per_device_eval_batch_size', 32),
+            max_batch_tokens=config.get('max_batch_tokens'),
+            use_fast_tokenizer=config.get('use_fast_tokenizer', False),
+            device=config.get('device', 'cpu'),
+            **kwargs,
+        )
+
+    def tokenize(self, texts, is_query=False):
+        max_len = self.q_max_len if is_query else self.p_max_len
+        # Same arguments as Tevatron's EncodeDataset, minus the padding
+        encoded = self.tokenizer(
+            list(texts),
+            max_length=max_len,
+            truncation='only_first',
+            padding=False,
+            return_token_type_ids=False,
+        )
+        return [dict(zip(encoded.keys(), values)) for values in zip(*encoded.values())]
+
+    def batches(self, lengths):
+        """Group positions into batches of similar length, longest first.
+
+        A batch is closed at ``batch_size`` texts or once its padded size
+        (texts x longest length) would exceed ``max_batch_tokens``.
+        """
+        order = np.argsort(-np.asarray(lengths), kind='stable')
+        batch = []
+        for i in order:
+            # Sorted descending, so the first entry is the longest in the batch
+            full = len(batch) >= self.batch_size or (
+                self.max_batch_tokens and batch and (len(batch) + 1) * lengths[batch[0]] > self.max_batch_tokens)
+            if full:
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    @torch.no_grad()
+    def forward(self, inputs, is_query=False):
+        inputs = {k: torch.from_numpy(v).to(self.device) for k, v in inputs.items()}
+        if is_query:
+            _, reps = self.model.encode_query(inputs)
+        else:
+            _, reps = self.model.encode_passage(inputs)
+        return reps.float().cpu().numpy()
+
+    def _encode_chunk(self, texts, is_query):
+        with step("tokenize", count=len(texts), unit="texts"):
+            features = self.tokenize(texts, is_query=is_query)
+        lengths = [len(f['input_ids']) for f in features]
+        reps = np.empty((len(texts), self.dim), dtype=np.float32)
+        for batch in self.batches(lengths):
+            with step("forward", count=len(batch), unit="texts"):
+                inputs = self.tokenizer.pad([features[i] for i in batch], padding='longest', return_tensors='np')
+                reps[batch] = self.forward({k: v.astype(np.int64) for k, v in inputs.items()}, is_query=is_query)
+        return reps
+
+    def encode_iter(self, texts, is_query=False):
+        # Sorting happens within buffers of ``sort_buffer`` texts, bounding memory on large inputs
+        texts = iter(texts)
+        while True:
+            chunk = list(islice(texts, self.sort_buffer))
+            if not chunk:
+                return
+            yield self._encode_chunk(chunk, is_query)
+
+    def encode(self, texts, is_query=False):
+        chunks = list(self.encode_iter(texts, is_query=is_query))
+        if not chunks:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.concatenate(chunks)
+
+    def encode_file(self, in_path, out_path, is_query=False):
+        # jsonl of {"text_id", "text"} -> Tevatron pickle or embedding store, following ``out_path``
+        ids = []
+        texts = []
+        for item in iter_json(in_path):
+            ids.append(item['text_id'])
+            texts.append(item['text'])
+        reps = self.encode(texts, is_query=is_query)
+        write_embeddings(out_path, ids, reps)
+        logger.info(f"Encoded {len(ids)} {'queries' if is_query else 'passages'} to {out_path}")
+
+# Config keys that determine a loaded encoder
+ENCODER_KEYS = ('encoder_backend', 'model_name_or_path', 'onnx_path', 'q_max_len', 'p_max_len',
+                'per_device_eval_batch_size', 'max_batch_tokens', 'use_fast_tokenizer', 'device', 'onnx_threads')
+
+# Encoders loaded in this process, so query and corpus encodes share one model
+_ENCODERS = {}
+
+def encoder_path(config):
+    # The ONNX backend loads the exported artifact (which carries its own tokenizer)
+    if config.get('encoder_backend', 'native') == 'onnx':
+        return config['onnx_path']
+    return config['model_name_or_path']
+
+def load_encoder(config):
+    key = tuple(config.get(k) for k in ENCODER_KEYS)
+    if key not in _ENCODERS:
+        logger.info(f"Loading {config.get('encoder_backend', 'native')} encoder from {encoder_path(config)}")
+        if config.get('encoder_backend', 'native') == 'onnx':
+            from factcheck_relevance.onnx_encoder import OnnxEncoder
+            _ENCODERS[key] = OnnxEncoder.from_config(config)
+        else:
+            _ENCODERS[key] = Encoder.from_config(config)
+    return _ENCODERS[key]
+
+def native_encode(config, in_path, out_path, is_query=False):
+    # Same signature as the Tevatron drivers; the model is only loaded once something needs encoding
+    load_encoder(config).encode_file(in_path, out_path, is_query=is_query)
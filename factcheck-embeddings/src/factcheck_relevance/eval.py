@@ -1,94 +1,165 @@
 import argparse
+import csv
+import json
+import re
 import pandas as pd
 import numpy as np
 import logging
+from factcheck_relevance.telemetry import instrument, step, telemetry_path
 from factcheck_relevance.utils import load_config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def compute_metrics(qrels_path, run_path):
-    # Load qrels: query_id, 0, docid, 1
-    qrels = {}
-    with open(qrels_path, 'r') as f:
-        for line in f:
-            qid, _, docid, label = line.strip().split('\t')
-            if int(label) > 0:
-                if qid not in qrels:
-                    qrels[qid] = set()
-                qrels[qid].add(docid)
-    
+DEFAULT_METRICS = ["MRR@10", "nDCG@10", "Recall@5", "Recall@10", "Recall@20", "Recall@50"]
+METRIC_PATTERN = re.compile(r"^(MRR|nDCG|Recall|P)@(\d+)$")
+
+class Qrels:
+    """Integer-coded relevance judgments, parsed once and shared by any number of runs."""
+
+    def __init__(self, path):
+        # Load qrels: query_id, 0, docid, 1
+        df = read_tsv(path, [0, 2, 3], ["qid", "docid", "label"])
+        df = df[df["label"].astype(int) > 0].drop_duplicates(["qid", "docid"])
+        
+        # Queries keep first-appearance order, so metric means sum in the same order as before
+        self.query_index = pd.Index(pd.unique(df["qid"]))
+        self.doc_index = pd.Index(pd.unique(df["docid"]))
+        q_codes = self.query_index.get_indexer(df["qid"])
+        d_codes = self.doc_index.get_indexer(df["docid"])
+        self.pair_codes = np.unique(q_codes.astype(np.int64) * len(self.doc_index) + d_codes)
+        self.num_pos = np.bincount(q_codes, minlength=len(self.query_index))
+
+    def __len__(self):
+        return len(self.query_index)
+
+def read_tsv(path, usecols, names):
+    try:
+        df = pd.read_csv(path, sep='\t', header=None, usecols=usecols, dtype=str,
+                         quoting=csv.QUOTE_NONE, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame({name: pd.Series(dtype=str) for name in names})
+    df.columns = names
+    return df
+
+def parse_metrics(metrics):
+    parsed = []
+    for name in metrics:
+        match = METRIC_PATTERN.match(name)
+        if not match:
+            raise ValueError(f"Unsupported metric '{name}', expected MRR@k, nDCG@k, Recall@k or P@k")
+        parsed.append((name, match.group(1), int(match.group(2))))
+    return parsed
+
+def group_positions(codes):
+    # Position of each row within its group, in file order (stable sort is linear on grouped input)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    counts = np.diff(np.r_[starts, len(codes)])
+    positions = np.empty(len(codes), dtype=np.int64)
+    positions[order] = np.arange(len(codes)) - np.repeat(starts, counts)
+    return positions
+
+def load_run_matrix(qrels, run_path, depth):
+    """Load a run as a (num qrels queries, depth) matrix of qrels doc codes (-1 = not judged / empty)."""
     # Load run: qid, docid, rank, score
-    run = {}
-    with open(run_path, 'r') as f:
-        for line in f:
-            qid, docid, rank, score = line.strip().split('\t')
-            if qid not in run:
-                run[qid] = []
-            run[qid].append(docid)
-            
-    # Metrics
-    recalls = {5: [], 10: [], 20: [], 50: []}
-    mrrs = []
-    ndcgs = []
+    df = read_tsv(run_path, [0, 1], ["qid", "docid"])
     
-    for qid, pos_docs in qrels.items():
-        retrieved = run.get(qid, [])
-        
-        # Recall@k
-        for k in recalls.keys():
-            topk = set(retrieved[:k])
-            recall = len(topk.intersection(pos_docs)) / len(pos_docs) if pos_docs else 0
-            recalls[k].append(recall)
-            
-        # MRR@10
-        mrr = 0
-        for i, docid in enumerate(retrieved[:10]):
-            if docid in pos_docs:
-                mrr = 1 / (i + 1)
-                break
-        mrrs.append(mrr)
-        
-        # nDCG@10 (simplified binary)
-        dcg = 0
-        for i, docid in enumerate(retrieved[:10]):
-            if docid in pos_docs:
-                dcg += 1 / np.log2(i + 2)
-        
-        idcg = 0
-        for i in range(min(len(pos_docs), 10)):
-            idcg += 1 / np.log2(i + 2)
-            
-        ndcg = dcg / idcg if idcg > 0 else 0
-        ndcgs.append(ndcg)
-        
-    results = {
-        "MRR@10": np.mean(mrrs),
-        "nDCG@10": np.mean(ndcgs)
-    }
-    for k, v in recalls.items():
-        results[f"Recall@{k}"] = np.mean(v)
-        
+    # Hash each column once, then map only the distinct values onto the qrels codes
+    run_q_codes, run_qids = pd.factorize(df["qid"])
+    run_d_codes, run_docids = pd.factorize(df["docid"])
+    q_codes = qrels.query_index.get_indexer(run_qids)[run_q_codes]
+    d_codes = qrels.doc_index.get_indexer(run_docids)[run_d_codes]
+    positions = group_positions(run_q_codes)
+    
+    keep = (q_codes >= 0) & (positions < depth)
+    docs = np.full((len(qrels), depth), -1, dtype=np.int64)
+    docs[q_codes[keep], positions[keep]] = d_codes[keep]
+    return docs
+
+def evaluate_matrix(qrels, docs, metrics):
+    num_docs = len(qrels.doc_index)
+    pair = np.arange(len(qrels), dtype=np.int64)[:, None] * num_docs + docs
+    hits = (docs >= 0) & np.isin(pair, qrels.pair_codes)
+    
+    # First occurrence of each docid per query (duplicate lines count once for set-based recall)
+    order = np.argsort(docs, axis=1, kind='stable')
+    sorted_docs = np.take_along_axis(docs, order, axis=1)
+    first_sorted = np.ones_like(sorted_docs, dtype=bool)
+    first_sorted[:, 1:] = sorted_docs[:, 1:] != sorted_docs[:, :-1]
+    first = np.empty_like(first_sorted)
+    np.put_along_axis(first, order, first_sorted, axis=1)
+    unique_hits = hits & first
+    
+    depth = docs.shape[1]
+    discounts = 1 / np.log2(np.arange(depth) + 2)
+    
+    results = {}
+    for name, kind, k in metrics:
+        if kind == "Recall":
+            per_query = unique_hits[:, :k].sum(axis=1) / qrels.num_pos
+        elif kind == "P":
+            per_query = unique_hits[:, :k].sum(axis=1) / k
+        elif kind == "MRR":
+            found = hits[:, :k].any(axis=1)
+            per_query = np.where(found, 1 / (hits[:, :k].argmax(axis=1) + 1), 0.0)
+        else:
+            # nDCG (simplified binary); cumsum keeps the sequential summation order
+            dcg = np.cumsum(hits[:, :k] * discounts[:k], axis=1)[:, -1]
+            idcg = np.cumsum(discounts[:k])[np.minimum(qrels.num_pos, k) - 1]
+            per_query = np.where(idcg > 0, dcg / idcg, 0.0)
+        results[name] = np.mean(per_query)
+    return results
+
+def evaluate_runs(qrels, run_paths, metrics=DEFAULT_METRICS):
+    """Evaluate several run files against one parsed ``Qrels``; returns {run_path: metrics}."""
+    parsed = parse_metrics(metrics)
+    depth = max(k for _, _, k in parsed)
+    results = {}
+    for run_path in run_paths:
+        with step("load_run", unit="lines") as s:
+            docs = load_run_matrix(qrels, run_path, depth)
+            s.count = int((docs >= 0).sum())
+        with step("compute_metrics", count=len(qrels), unit="queries"):
+            results[run_path] = evaluate_matrix(qrels, docs, parsed)
     return results
 
+def compute_metrics(qrels_path, run_path, metrics=DEFAULT_METRICS):
+    qrels = Qrels(qrels_path)
+    return evaluate_runs(qrels, [run_path], metrics)[run_path]
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", help="Path to config yaml")
     parser.add_argument("--qrels", help="Path to qrels tsv")
-    parser.add_argument("--run", help="Path to run tsv")
+    parser.add_argument("--run", nargs="+", help="Path(s) to run tsv")
+    parser.add_argument("--metrics", nargs="+", default=DEFAULT_METRICS, help="e.g. MRR@10 nDCG@10 Recall@100 P@5")
+    parser.add_argument("--output", help="Optional JSON file for the metrics ({run_path: {metric: value}})")
     args = parser.parse_args()
     
     if args.config:
         config = load_config(args.config)
         qrels_path = config.get('qrels_path')
-        run_path = config.get('run_path')
+        run_paths = [config['run_path']] if config.get('run_path') else None
     else:
         qrels_path = args.qrels
-        run_path = args.run
+        run_paths = args.run
         
-    if not qrels_path or not run_path:
+    if not qrels_path or not run_paths:
         parser.error("Must provide --config or both --qrels and --run")
         
-    metrics = compute_metrics(qrels_path, run_path)
-    for k, v in metrics.items():
-        print(f"{k}: {v:.4f}")
+    with instrument("eval", telemetry_path(run_paths[0], "eval"), unit="runs") as s:
+        with step("load_qrels"):
+            qrels = Qrels(qrels_path)
+        all_metrics = evaluate_runs(qrels, run_paths, args.metrics)
+        s.count = len(run_paths)
+    for run_path, metrics in all_metrics.items():
+        if len(run_paths) > 1:
+            print(f"== {run_path}")
+        for k, v in metrics.items():
+            print(f"{k}: {v:.4f}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({run: {k: float(v) for k, v in m.items()} for run, m in all_metrics.items()}, f, indent=2)
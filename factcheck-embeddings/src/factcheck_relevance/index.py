@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+import faiss
+from factcheck_relevance.embedding_store import embedding_files, is_embedding_store, open_embeddings, read_npy_header
+from factcheck_relevance.telemetry import step
+from factcheck_relevance.utils import hash_files
+
+logger = logging.getLogger(__name__)
+
+# Config keys used by each index type, with their defaults
+INDEX_PARAMS = {
+    'flat': {},
+    'ivf_flat': {'nlist': 1024, 'nprobe': 16},
+    'ivf_pq': {'nlist': 1024, 'nprobe': 16, 'pq_m': 16, 'pq_nbits': 8},
+    'hnsw': {'hnsw_m': 32, 'ef_construction': 200, 'ef_search': 128},
+    # Exhaustive scan over scalar-quantized codes: 1 byte (per-dimension range) or 2 bytes per dim
+    'sq8': {},
+    'sq_fp16': {},
+}
+
+SCALAR_QUANTIZERS = {'sq8': 'QT_8bit', 'sq_fp16': 'QT_fp16'}
+
+# Parameters applied at search time only; changing them does not invalidate a saved index
+SEARCH_PARAMS = ('nprobe', 'ef_search')
+
+# Vectors converted to float32 and added per call, so a float16 or memory-mapped corpus is never copied whole
+ADD_BATCH_SIZE = 65536
+
+def index_config(config):
+    """The slice of ``config`` that determines the index: its type plus that type's parameters."""
+    index_type = config.get('index_type', 'flat')
+    if index_type not in INDEX_PARAMS:
+        raise ValueError(f"Unknown index_type '{index_type}', expected one of {sorted(INDEX_PARAMS)}")
+    params = {k: config.get(k, v) for k, v in INDEX_PARAMS[index_type].items()}
+    if config.get('reduce_dim'):
+        # Any index type can be built on fewer dimensions: a PCA projection or the leading
+        # (Matryoshka) dimensions of each vector
+        params['reduce_dim'] = config['reduce_dim']
+        params['reduce_method'] = config.get('reduce_method', 'pca')
+        if params['reduce_method'] not in ('pca', 'truncate'):
+            raise ValueError(f"Unknown reduce_method '{params['reduce_method']}', expected 'pca' or 'truncate'")
+    return {'index_type': index_type, **params}
+
+def needs_training(params):
+    return params['index_type'] in ('ivf_flat', 'ivf_pq', 'sq8') or params.get('reduce_method') == 'pca'
+
+def build_index(corpus_reps, config):
+    """Build (and train, if needed) an inner-product FAISS index over ``corpus_reps``."""
+    with step("index_build", count=len(corpus_reps), unit="vectors"):
+        return _build_index(corpus_reps, config)
+
+def reduce_transform(params, dim, sample):
+    if params['reduce_dim'] >= dim:
+        raise ValueError(f"reduce_dim={params['reduce_dim']} must be below the embedding dim {dim}")
+    if params['reduce_method'] == 'truncate':
+        return faiss.RemapDimensionsTransform(dim, params['reduce_dim'], False)
+    # Uncentered PCA: top eigenvectors of the sample's (dim x dim) Gram matrix, i.e. its top right
+    # singular vectors, so projected inner products approximate the original ones without a per-document mean term
+    _, vecs = np.linalg.eigh((sample.T @ sample).astype(np.float64))
+    components = vecs[:, ::-1][:, :params['reduce_dim']].T
+    transform = faiss.LinearTransform(dim, params['reduce_dim'], False)
+    faiss.copy_array_to_vector(np.ascontiguousarray(components, dtype=np.float32).ravel(), transform.A)
+    transform.is_trained = True
+    return transform
+
+def _build_index(corpus_reps, config):
+    params = index_config(config)
+    index_type = params['index_type']
+    num_docs, dim = corpus_reps.shape
+    index_dim = params.get('reduce_dim', dim)
+    # IVF needs at least one training point per list
+    nlist = min(params['nlist'], num_docs) if 'nlist' in params else None
+
+    sample = None
+    if needs_training(params):
+        train_size = min(num_docs, config.get('index_train_size', 256 * nlist if nlist else 65536))
+        rows = np.random.default_rng(config.get('seed', 42)).choice(num_docs, train_size, replace=False)
+        sample = np.ascontiguousarray(corpus_reps[np.sort(rows)], dtype=np.float32)
+
+    if index_type == 'flat':
+        index = faiss.IndexFlatIP(index_dim)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(index_dim, params['hnsw_m'], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params['ef_construction']
+    elif index_type in SCALAR_QUANTIZERS:
+        qtype = getattr(faiss.ScalarQuantizer, SCALAR_QUANTIZERS[index_type])
+        index = faiss.IndexScalarQuantizer(index_dim, qtype, faiss.METRIC_INNER_PRODUCT)
+    else:
+        quantizer = faiss.IndexFlatIP(index_dim)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, index_dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            if index_dim % params['pq_m']:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the index dim {index_dim}")
+            # Each sub-quantizer trains 2**pq_nbits centroids, so small samples get fewer bits
+            pq_nbits = min(params['pq_nbits'], len(sample).bit_length() - 1)
+            if pq_nbits < 1:
+                raise ValueError(f"ivf_pq needs at least 2 training vectors, got {len(sample)}")
+            if pq_nbits < params['pq_nbits']:
+                logger.warning(f"Only {len(sample)} training vectors: using pq_nbits={pq_nbits} instead of {params['pq_nbits']}")
+            index = faiss.IndexIVFPQ(quantizer, index_dim, nlist, params['pq_m'], pq_nbits, faiss.METRIC_INNER_PRODUCT)
+
+    if 'reduce_dim' in params:
+        index = faiss.IndexPreTransform(reduce_transform(params, dim, sample), index)
+    if not index.is_trained:
+        logger.info(f"Training {index_type} index{f' (nlist={nlist})' if nlist else ''} on {len(sample)} vectors...")
+        index.train(sample)
+
+    logger.info(f"Adding {num_docs} vectors to {index_type} index...")
+    for start in range(0, num_docs, ADD_BATCH_SIZE):
+        index.add(np.ascontiguousarray(corpus_reps[start:start + ADD_BATCH_SIZE], dtype=np.float32))
+    configure_search(index, config)
+    return index
+
+def configure_search(index, config):
+    # Search-time parameters can change without rebuilding the index
+    params = index_config(config)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    if params['index_type'] in ('ivf_flat', 'ivf_pq'):
+        index.nprobe = params['nprobe']
+    elif params['index_type'] == 'hnsw':
+        index.hnsw.efSearch = params['ef_search']
+
+def index_memory_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
+
+def corpus_hash(corpus_path, count=None, block_rows=65536, start=0):
+    """Content hash of the corpus embeddings; for a store, of ``count`` rows from ``start``.
+
+    Stores are hashed by row rather than by file, so the hash an index was built against can be
+    recomputed after rows are appended to the store.
+    """
+    if not is_embedding_store(corpus_path):
+        return hash_files(embedding_files(corpus_path))
+    with open(os.path.join(corpus_path, "meta.json"), 'r') as f:
+        meta = json.load(f)
+    count = meta['count'] - start if count is None else count
+    h = hashlib.blake2b(f"{meta['dtype']}:{meta['dim']}".encode('utf-8'), digest_size=16)
+    # Plain reads rather than the memory map, which would leave the whole store resident
+    with open(os.path.join(corpus_path, "embeddings.npy"), 'rb') as reps, \
+            open(os.path.join(corpus_path, "ids.npy"), 'rb') as ids:
+        rep_bytes, id_bytes = (_row_size(read_npy_header(f)) for f in (reps, ids))
+        reps.seek(start * rep_bytes, os.SEEK_CUR)
+        ids.seek(start * id_bytes, os.SEEK_CUR)
+        for start in range(0, count, block_rows):
+            rows = min(block_rows, count - start)
+            h.update(reps.read(rows * rep_bytes))
+            h.update(ids.read(rows * id_bytes))
+    return h.hexdigest()
+
+def _row_size(header):
+    _, shape, _, dtype = header
+    return dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+
+def index_fingerprint(corpus_path, config, rows=None):
+    # Corpus embedding content plus every parameter that affects the built index
+    params = {k: v for k, v in index_config(config).items() if k not in SEARCH_PARAMS}
+    if needs_training(params):
+        params['index_train_size'] = config.get('index_train_size')
+        params['seed'] = config.get('seed', 42)
+    if rows is not None:
+        # A shard's index covers a fixed row range, so it is rebuilt rather than extended
+        params['rows'] = list(rows)
+        if is_embedding_store(corpus_path):
+            params['corpus'] = corpus_hash(corpus_path, rows[1] - rows[0], start=rows[0])
+        else:
+            params['corpus'] = corpus_hash(corpus_path)
+        return params
+    params['corpus'] = corpus_hash(corpus_path)
+    if is_embedding_store(corpus_path):
+        params['count'] = open_embeddings(corpus_path)[2]['count']
+    return params
+
+def extends(saved, fingerprint, corpus_path):
+    # The saved index was built with the same parameters on the first rows of this (appended) store
+    same_params = all(saved.get(k) == v for k, v in fingerprint.items() if k not in ('corpus', 'count'))
+    return (same_params and 'count' in saved and saved['count'] < fingerprint.get('count', 0)
+            and corpus_hash(corpus_path, saved['count']) == saved['corpus'])
+
+def load_or_build_index(corpus_reps, corpus_path, config, rows=None):
+    """Load the index saved next to ``corpus_path`` if it matches, else build and save it.
+
+    Saved indexes live at ``<corpus_path>.<index_type>.faiss`` with a ``.json`` sidecar holding
+    the fingerprint; a changed corpus or index config no longer matches and triggers a rebuild.
+    Rows appended to an embedding store since the save are added to the saved index instead.
+    With ``rows=(start, end)``, ``corpus_reps`` holds only those rows of the corpus and the
+    index is saved as ``<corpus_path>.<index_type>.rows_<start>_<end>.faiss``.
+    """
+    if not config.get('index_cache', True):
+        return build_index(corpus_reps, config)
+
+    index_type = index_config(config)['index_type']
+    suffix = f".rows_{rows[0]}_{rows[1]}" if rows is not None else ""
+    index_path = f"{corpus_path.rstrip(os.sep)}.{index_type}{suffix}.faiss"
+    meta_path = f"{index_path}.json"
+    fingerprint = index_fingerprint(corpus_path, config, rows)
+
+    if os.path.exists(index_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            saved = json.load(f)
+        if saved == fingerprint:
+            logger.info(f"Loading saved index from {index_path}")
+            with step("index_load"):
+                index = read_index(index_path, mmap=config.get('index_mmap', True))
+            configure_search(index, config)
+            return index
+        if extends(saved, fingerprint, corpus_path):
+            # Rows appended to the store are added to the saved index instead of rebuilding it;
+            # IVF indexes keep the centroids trained on the original rows
+            logger.info(f"Adding {fingerprint['count'] - saved['count']} appended vectors to saved index {index_path}")
+            with step("index_load"):
+                index = read_index(index_path, mmap=False)
+            with step("index_add", count=fingerprint['count'] - saved['count'], unit="vectors"):
+                index.add(np.ascontiguousarray(corpus_reps[saved['count']:], dtype=np.float32))
+            configure_search(index, config)
+            save_index(index, index_path, fingerprint)
+            return index
+        logger.info(f"Saved index {index_path} is stale, rebuilding")
+
+    index = build_index(corpus_reps, config)
+    save_index(index, index_path, fingerprint)
+    return index
+
+def save_index(index, index_path, fingerprint):
+    # Index first, fingerprint last: a crash in between leaves no matching sidecar
+    meta_path = f"{index_path}.json"
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    tmp_path = f"{index_path}.tmp"
+    with step("index_save"):
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, index_path)
+    with open(meta_path, 'w') as f:
+        json.dump(fingerprint, f, indent=2)
+    logger.info(f"Saved index to {index_path}")
+
+def search(index, query_reps, corpus_reps, topk, config):
+    """Top-``topk`` (scores, indices) from ``index``, optionally rescored exactly.
+
+    With ``rescore_k``, the index returns its top-``rescore_k`` candidates (coarse, e.g. on
+    quantized or reduced vectors) and they are re-ranked by exact inner product with their rows
+    of ``corpus_reps``, gathered on demand from the memory-mapped store.
+    """
+    rescore_k = config.get('rescore_k')
+    if not rescore_k:
+        return index.search(query_reps, topk)
+    _, candidates = index.search(query_reps, max(rescore_k, topk))
+    return rescore(query_reps, corpus_reps, candidates, topk, config.get('pair_batch_size', 16384))
+
+def rescore(query_reps, corpus_reps, candidates, topk, pair_batch_size=16384):
+    num_queries, k = candidates.shape
+    scores = np.full((num_queries, topk), -np.inf, dtype=np.float32)
+    indices = np.full((num_queries, topk), -1, dtype=np.int64)
+    # Blocks of queries whose gathered candidate rows hold about pair_batch_size vectors
+    block = max(1, pair_batch_size // k)
+    for start in range(0, num_queries, block):
+        cand = candidates[start:start + block]
+        valid = cand >= 0
+        rows = np.ascontiguousarray(corpus_reps[np.where(valid, cand, 0).ravel()], dtype=np.float32)
+        exact = np.einsum('bkd,bd->bk', rows.reshape(len(cand), k, -1), query_reps[start:start + block])
+        exact[~valid] = -np.inf
+        # Ties keep the coarse order
+        order = np.argsort(-exact, axis=1, kind='stable')[:, :topk]
+        n = order.shape[1]
+        scores[start:start + len(cand), :n] = np.take_along_axis(exact, order, axis=1)
+        indices[start:start + len(cand), :n] = np.where(np.take_along_axis(valid, order, axis=1),
+                                                        np.take_along_axis(cand, order, axis=1), -1)
+    return scores, indices
+
+def read_index(index_path, mmap=True):
+    if mmap:
+        # Not every index type can be memory-mapped by every FAISS build
+        try:
+            return faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.info(f"Memory-mapped read unsupported ({e}), reading into memory")
+    return faiss.read_index(index_path)
@@ -0,0 +1,125 @@
+import argparse
+import json
+import logging
+import os
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoTokenizer
+from tevatron.modeling import DenseModelForInference
+from factcheck_relevance.embedding_cache import model_fingerprint
+from factcheck_relevance.encoder import Encoder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Exported artifact: a directory holding
+#   passage.onnx       input_ids, attention_mask -> pooled reps (dynamic batch and sequence axes)
+#   query.onnx         only when the checkpoint has untied query/passage encoders or a pooler
+#   onnx_config.json   file names, dim, quantization and the source checkpoint fingerprint
+#   tokenizer files    copied from the checkpoint, so the directory is self-contained
+# onnx and onnxruntime are only needed for this backend and are imported lazily.
+
+class _Pooled(torch.nn.Module):
+    def __init__(self, model, is_query):
+        super().__init__()
+        self.model = model
+        self.is_query = is_query
+
+    def forward(self, input_ids, attention_mask):
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if self.is_query:
+            return self.model.encode_query(inputs)[1]
+        return self.model.encode_passage(inputs)[1]
+
+def export_onnx(model_name_or_path, output_dir, quantize=False, opset=17):
+    """Export a Tevatron checkpoint to ONNX, optionally with dynamic int8 weight quantization."""
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, use_fast=False)
+    tokenizer.save_pretrained(output_dir)
+    config = AutoConfig.from_pretrained(model_name_or_path, num_labels=1)
+    model = DenseModelForInference.build(model_name_or_path=model_name_or_path, config=config)
+    model.eval()
+
+    # Tied encoders without a pooler encode queries and passages identically: one graph serves both
+    tied = model.lm_q is model.lm_p and model.pooler is None
+    roles = ['passage'] if tied else ['passage', 'query']
+
+    dummy = tokenizer(["an example claim", "a longer example evidence snippet"], padding=True, return_tensors='pt')
+    files = {}
+    for role in roles:
+        fp32_path = os.path.join(output_dir, f"{role}.fp32.onnx" if quantize else f"{role}.onnx")
+        torch.onnx.export(
+            _Pooled(model, role == 'query'),
+            (dummy['input_ids'], dummy['attention_mask']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['reps'],
+            dynamic_axes={'input_ids': {0: 'batch', 1: 'seq'}, 'attention_mask': {0: 'batch', 1: 'seq'}, 'reps': {0: 'batch'}},
+            opset_version=opset,
+            dynamo=False,
+        )
+        files[role] = os.path.basename(fp32_path)
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            int8_path = os.path.join(output_dir, f"{role}.onnx")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+            os.remove(fp32_path)
+            files[role] = os.path.basename(int8_path)
+        logger.info(f"Exported {role} encoder to {os.path.join(output_dir, files[role])}")
+
+    meta = {
+        "passage": files['passage'],
+        "query": files.get('query', files['passage']),
+        "dim": model.lm_p.config.hidden_size,
+        "quantized": quantize,
+        "opset": opset,
+        "source_model": model_name_or_path,
+        "source_fingerprint": model_fingerprint(model_name_or_path),
+    }
+    with open(os.path.join(output_dir, "onnx_config.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+class OnnxEncoder(Encoder):
+    """``Encoder`` running an exported ONNX graph through ONNX Runtime instead of PyTorch."""
+
+    def __init__(self, onnx_path, num_threads=None, **kwargs):
+        self.num_threads = num_threads
+        super().__init__(onnx_path, **kwargs)
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        return super().from_config(config, num_threads=config.get('onnx_threads'), **kwargs)
+
+    def load_model(self, onnx_path):
+        import onnxruntime as ort
+        with open(os.path.join(onnx_path, "onnx_config.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.dim = self.meta['dim']
+
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        sessions = {}
+        for role in ('passage', 'query'):
+            name = self.meta[role]
+            if name not in sessions:
+                sessions[name] = ort.InferenceSession(os.path.join(onnx_path, name), options, providers=['CPUExecutionProvider'])
+        self.sessions = {role: sessions[self.meta[role]] for role in ('passage', 'query')}
+
+    def forward(self, inputs, is_query=False):
+        session = self.sessions['query' if is_query else 'passage']
+        feed = {'input_ids': inputs['input_ids'], 'attention_mask': inputs['attention_mask']}
+        return np.asarray(session.run(['reps'], feed)[0], dtype=np.float32)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a trained checkpoint to ONNX for the onnx encoder backend")
+    parser.add_argument("--model", required=True, help="Checkpoint directory (e.g. runs/factcheck_relevance_cpu) or hub id")
+    parser.add_argument("--output", help="Output directory (default <model>/onnx, or <model>/onnx-int8 with --quantize)")
+    parser.add_argument("--quantize", action="store_true", help="Apply dynamic int8 weight quantization")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(args.model, "onnx-int8" if args.quantize else "onnx")
+    export_onnx(args.model, output, quantize=args.quantize, opset=args.opset)
@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from factcheck_relevance.embedding_cache import model_fingerprint
+from factcheck_relevance.index import INDEX_PARAMS
+from factcheck_relevance.utils import load_config
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s", datefmt="%H:%M:%S")
+logger = logging.getLogger(__name__)
+
+# Config keys each inference stage reads; a change to any other key does not rerun the stage
+ENCODE_KEYS = ['model_name_or_path', 'model_revision', 'encoder_backend', 'onnx_path', 'use_fast_tokenizer', 'embedding_dtype', 'dataset_name']
+RETRIEVE_KEYS = ['topk', 'retrieval_mode', 'candidates_path', 'index_type', 'index_train_size', 'seed', 'run_score_format',
+                 'reduce_dim', 'reduce_method', 'rescore_k', 'retrieve_shards'] \
+    + sorted({k for params in INDEX_PARAMS.values() for k in params})
+
+# Named pipelines: the stage groups they run and the config each group reads
+PIPELINES = {
+    'cpu': [('build_data', 'configs/data_build.yaml'), ('train', 'configs/cpu_train.yaml'),
+            ('inference', 'configs/inference.yaml')],
+    'test': [('build_data', 'configs/test_data_build.yaml'), ('inference', 'configs/test_inference.yaml')],
+    'global': [('build_global', 'configs/global_data_build.yaml'), ('inference', 'configs/global_inference.yaml')],
+    'baseline': [('baseline', 'configs/baseline_gemma.yaml')],
+}
+
+class Stage:
+    """One step of the DAG: a command, the config slice and files it reads, and the files it writes.
+
+    A stage is up to date when its outputs exist and the fingerprint of its command, config
+    slice and input contents matches the one recorded after its last successful run.
+    """
+
+    def __init__(self, name, command, config=None, inputs=(), outputs=(), model=None):
+        self.name = name
+        self.command = list(command)
+        self.config = config or {}
+        self.inputs = [os.path.normpath(p) for p in inputs]
+        self.outputs = [os.path.normpath(p) for p in outputs]
+        self.model = model
+
+def module_command(module, *args):
+    return [sys.executable, '-m', f'factcheck_relevance.{module}', *args]
+
+def config_slice(config, keys):
+    return {k: config[k] for k in keys if k in config}
+
+def build_data_stages(prefix, config_path):
+    config = load_config(config_path)
+    out_dir = config['out_dir']
+    return [Stage(f"{prefix}:build_data", module_command('build_data', '--config', config_path), config,
+                  inputs=[config['input_path']],
+                  outputs=[os.path.join(out_dir, name) for name in
+                           ("train", "corpus.jsonl", "dev_queries.jsonl", "dev_qrels.tsv", "dev_candidates.jsonl")])]
+
+def build_global_stages(prefix, config_path):
+    config = load_config(config_path)
+    # The worker count, parse spooling and append mode do not change the output
+    config = {k: v for k, v in config.items() if k not in ('num_workers', 'parse_batch_size', 'tmp_dir', 'append')}
+    out_dir = config['out_dir']
+    return [Stage(f"{prefix}:build_global", module_command('build_global', '--config', config_path), config,
+                  inputs=config['input_paths'],
+                  outputs=[os.path.join(out_dir, name) for name in ("corpus.jsonl", "queries.jsonl", "qrels.tsv", "candidates.jsonl")])]
+
+def train_stages(prefix, config_path):
+    config = load_config(config_path)
+    # Thread counts do not change the trained model
+    config = {k: v for k, v in config.items() if k not in ('torch_threads', 'torch_interop_threads')}
+    return [Stage(f"{prefix}:train", module_command('train', '--config', config_path), config,
+                  inputs=[config['train_dir']], outputs=[config['output_dir']], model=config['model_name_or_path'])]
+
+def inference_stages(prefix, config_path, encode_module='encode'):
+    config = load_config(config_path)
+    model = config['onnx_path'] if config.get('encoder_backend') == 'onnx' else config['model_name_or_path']
+    stages = []
+    for role, is_query in (('corpus', False), ('query', True)):
+        keys = ENCODE_KEYS + ['q_max_len' if is_query else 'p_max_len', 'query_prefix' if is_query else 'document_prefix']
+        args = ['--config', config_path] + (['--is_query'] if is_query else [])
+        stages.append(Stage(f"{prefix}:encode_{role}", module_command(encode_module, *args), config_slice(config, keys),
+                            inputs=[config[f'{role}_in_path']], outputs=[config[f'{role}_out_path']], model=model))
+
+    retrieve_inputs = [config['query_out_path'], config['corpus_out_path']]
+    if config.get('retrieval_mode') == 'candidates':
+        retrieve_inputs.append(config['candidates_path'])
+    stages.append(Stage(f"{prefix}:retrieve", module_command('retrieve', '--config', config_path),
+                        config_slice(config, RETRIEVE_KEYS), inputs=retrieve_inputs, outputs=[config['run_path']]))
+
+    metrics_path = f"{config['run_path']}.metrics.json"
+    stages.append(Stage(f"{prefix}:eval", module_command('eval', '--qrels', config['qrels_path'], '--run', config['run_path'], '--output', metrics_path),
+                        inputs=[config['run_path'], config['qrels_path']], outputs=[metrics_path]))
+    return stages
+
+STAGE_GROUPS = {
+    'build_data': build_data_stages,
+    'build_global': build_global_stages,
+    'train': train_stages,
+    'inference': inference_stages,
+    'baseline': lambda prefix, config_path: inference_stages(prefix, config_path, encode_module='baseline_encode'),
+}
+
+def pipeline_stages(names):
+    stages = []
+    for name in names:
+        for group, config_path in PIPELINES[name]:
+            stages.extend(STAGE_GROUPS[group](name, config_path))
+    return stages
+
+def dependencies(stages):
+    # A stage depends on whichever stage writes one of its inputs (or its model)
+    producers = {path: stage.name for stage in stages for path in stage.outputs}
+    deps = {}
+    for stage in stages:
+        paths = stage.inputs + ([os.path.normpath(stage.model)] if stage.model else [])
+        deps[stage.name] = {producers[p] for p in paths if p in producers and producers[p] != stage.name}
+    return deps
+
+class PipelineState:
+    """Stage fingerprints from the last successful runs plus a (size, mtime) -> hash memo of input files."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"stages": {}, "files": {}}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+
+    def file_hash(self, path):
+        st = os.stat(path)
+        with self.lock:
+            memo = self.data["files"].get(path)
+        if memo and memo[:2] == [st.st_size, st.st_mtime_ns]:
+            return memo[2]
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        with self.lock:
+            self.data["files"][path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def path_hash(self, path):
+        if not os.path.exists(path):
+            return None
+        if not os.path.isdir(path):
+            return self.file_hash(path)
+        files = sorted(os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+        h = hashlib.blake2b(digest_size=16)
+        for file_path in files:
+            h.update(os.path.relpath(file_path, path).encode('utf-8'))
+            h.update(self.file_hash(file_path).encode('ascii'))
+        return h.hexdigest()
+
+    def fingerprint(self, stage):
+        payload = {
+            "command": stage.command[1:],
+            "config": stage.config,
+            "inputs": {p: self.path_hash(p) for p in stage.inputs},
+            "model": model_fingerprint(stage.model) if stage.model else None,
+        }
+        return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+    def is_current(self, stage, fingerprint):
+        with self.lock:
+            recorded = self.data["stages"].get(stage.name)
+        return recorded == fingerprint and all(os.path.exists(p) for p in stage.outputs)
+
+    def record(self, stage, fingerprint):
+        with self.lock:
+            self.data["stages"][stage.name] = fingerprint
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f"{self.path}.tmp", 'w') as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(f"{self.path}.tmp", self.path)
+
+def run_stage(stage, state, log_dir, force=False):
+    """Run ``stage`` unless it is up to date; returns True if it ran."""
+    fingerprint = state.fingerprint(stage)
+    if not force and state.is_current(stage, fingerprint):
+        logger.info(f"[{stage.name}] up to date, skipping")
+        return False
+
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"{stage.name.replace(':', '_')}.log")
+    logger.info(f"[{stage.name}] running (log: {log_path})")
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="")
+    with open(log_path, 'w') as log:
+        result = subprocess.run(stage.command, stdout=log, stderr=subprocess.STDOUT, env=env)
+    if result.returncode != 0:
+        with open(log_path, 'r') as log:
+            tail = log.readlines()[-20:]
+        raise RuntimeError(f"Stage {stage.name} failed with exit code {result.returncode}:\n{''.join(tail)}")
+
+    # Record the fingerprint taken before the run, so inputs edited mid-run trigger another run
+    state.record(stage, fingerprint)
+    logger.info(f"[{stage.name}] done")
+    return True
+
+def run_pipeline(stages, state_path, jobs=2, force=False):
+    """Run stages in dependency order, up to ``jobs`` at a time; returns the names of stages that ran."""
+    deps = dependencies(stages)
+    state = PipelineState(state_path)
+    log_dir = os.path.join(os.path.dirname(state_path) or '.', "logs")
+    by_name = {stage.name: stage for stage in stages}
+    pending = [stage.name for stage in stages]
+    done = set()
+    ran = []
+    running = {}
+    failure = None
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            if failure is None:
+                for name in [n for n in pending if deps[n] <= done]:
+                    if len(running) >= jobs:
+                        break
+                    pending.remove(name)
+                    running[pool.submit(run_stage, by_name[name], state, log_dir, force)] = name
+            if not running:
+                if failure is None:
+                    raise RuntimeError(f"Dependency cycle among stages {pending}")
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    if future.result():
+                        ran.append(name)
+                    done.add(name)
+                except Exception as e:
+                    # Let running stages finish, but start nothing new
+                    failure = failure or e
+    if failure is not None:
+        raise failure
+    return ran
+
+def describe(stages, state_path):
+    # Status of each stage without running anything; downstream of a stale stage shows as stale too
+    deps = dependencies(stages)
+    state = PipelineState(state_path)
+    stale = set()
+    for stage in stages:
+        upstream = deps[stage.name] & stale
+        if upstream:
+            status = f"stale (after {', '.join(sorted(upstream))})"
+        elif state.is_current(stage, state.fingerprint(stage)):
+            status = "up to date"
+        else:
+            status = "stale"
+        if status != "up to date":
+            stale.add(stage.name)
+        print(f"{stage.name:<28} {status}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pipeline stages incrementally, skipping stages whose inputs are unchanged")
+    parser.add_argument("--pipeline", nargs="+", default=["cpu"], choices=sorted(PIPELINES))
+    parser.add_argument("--jobs", type=int, default=2, help="Independent stages run concurrently up to this many")
+    parser.add_argument("--state", default="runs/pipeline/state.json", help="Fingerprint state file; stage logs go next to it")
+    parser.add_argument("--force", action="store_true", help="Rerun every stage")
+    parser.add_argument("--dry_run", action="store_true", help="Only show which stages would run")
+    args = parser.parse_args()
+
+    stages = pipeline_stages(args.pipeline)
+    if args.dry_run:
+        describe(stages, args.state)
+    else:
+        ran = run_pipeline(stages, args.state, jobs=args.jobs, force=args.force)
+        logger.info(f"Pipeline finished: {len(ran)} of {len(stages)} stages ran")
+
+        # Stage output goes to log files, so show the evaluation results here
+        for stage in stages:
+            if stage.name.endswith(':eval'):
+                with open(stage.outputs[0], 'r') as f:
+                    for run_path, metrics in json.load(f).items():
+                        print(f"== {stage.name} ({run_path})")
+                        for k, v in metrics.items():
+                            print(f"{k}: {v:.4f}")
@@ -0,0 +1,231 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+from dataclasses import dataclass
+import numpy as np
+from tevatron.data import QPCollator
+from torch.utils.data import Dataset
+from factcheck_relevance.utils import hash_files, iter_json, load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tokenized training set: a directory under ``tokenized_dir`` keyed by the train files, the tokenizer
+# and the max lengths, holding
+#   query_tokens.npy / query_offsets.npy        distinct claims, token ids concatenated (int32)
+#   passage_tokens.npy / passage_offsets.npy    distinct snippets
+#   group_query.npy                             per instance: row in the query table
+#   positives.npy / positive_offsets.npy        per instance: rows in the passage table
+#   negatives.npy / negative_offsets.npy
+#   meta.json
+# Texts are tokenized exactly as Tevatron's TrainDataset does on every __getitem__, once each.
+
+FORMAT_VERSION = 1
+ARRAYS = [
+    "query_tokens", "query_offsets", "passage_tokens", "passage_offsets", "group_query",
+    "positives", "positive_offsets", "negatives", "negative_offsets",
+]
+TOKENIZER_FILE_PATTERNS = ["tokenizer*", "special_tokens_map.json", "added_tokens.json", "vocab.txt", "*.model"]
+
+def train_files(train_dir):
+    # The files Tevatron reads from train_dir
+    return sorted(os.path.join(train_dir, f) for f in os.listdir(train_dir) if f.endswith('jsonl') or f.endswith('json'))
+
+def tokenizer_fingerprint(model_name_or_path, revision=None):
+    if not os.path.isdir(model_name_or_path):
+        return f"{model_name_or_path}@{revision or 'main'}"
+    files = set()
+    for pattern in TOKENIZER_FILE_PATTERNS:
+        files.update(glob.glob(os.path.join(model_name_or_path, pattern)))
+    return hash_files(sorted(files))
+
+def tokenized_path(config):
+    key_info = {
+        "format_version": FORMAT_VERSION,
+        "train_files": hash_files(train_files(config['train_dir'])),
+        "tokenizer": tokenizer_fingerprint(config['model_name_or_path'], config.get('model_revision')),
+        "q_max_len": config['q_max_len'],
+        "p_max_len": config['p_max_len'],
+    }
+    key = hashlib.blake2b(json.dumps(key_info, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(config.get('tokenized_dir', 'runs/tokenized'), key), key_info
+
+class TextTable:
+    """Distinct texts of one role, numbered in first-seen order."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, text):
+        return self.rows.setdefault(text, len(self.rows))
+
+    def tokenize(self, tokenizer, max_len, batch_size=1000):
+        texts = list(self.rows)
+        chunks = []
+        lengths = np.zeros(len(texts), dtype=np.int64)
+        for start in range(0, len(texts), batch_size):
+            encoded = tokenizer(texts[start:start + batch_size], truncation='only_first', max_length=max_len, padding=False,
+                                return_attention_mask=False, return_token_type_ids=False)['input_ids']
+            lengths[start:start + len(encoded)] = [len(ids) for ids in encoded]
+            chunks.extend(np.asarray(ids, dtype=np.int32) for ids in encoded)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tokens = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+        return tokens, offsets
+
+def flatten(groups):
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(g) for g in groups], out=offsets[1:])
+    values = np.fromiter((v for g in groups for v in g), dtype=np.int32, count=int(offsets[-1]))
+    return values, offsets
+
+def group_max(values, offsets):
+    # Max of each values[offsets[i]:offsets[i + 1]], 0 for empty groups
+    out = np.zeros(len(offsets) - 1, dtype=values.dtype)
+    nonempty = offsets[1:] > offsets[:-1]
+    if values.size:
+        out[nonempty] = np.maximum.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+def pretokenize(config, tokenizer=None):
+    """Tokenize ``train_dir`` once into ``tokenized_dir``; returns the directory (reused when current)."""
+    path, key_info = tokenized_path(config)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        logger.info(f"Using pre-tokenized training data from {path}")
+        return path
+
+    if tokenizer is None:
+        from transformers import AutoTokenizer
+        # Same tokenizer as the Tevatron driver
+        tokenizer = AutoTokenizer.from_pretrained(config['model_name_or_path'], revision=config.get('model_revision'), use_fast=False)
+
+    queries, passages = TextTable(), TextTable()
+    group_query, positives, negatives = [], [], []
+    for file_path in train_files(config['train_dir']):
+        for item in iter_json(file_path):
+            group_query.append(queries.add(item['query']))
+            positives.append([passages.add(t) for t in item['positives']])
+            negatives.append([passages.add(t) for t in item['negatives']])
+    logger.info(f"Tokenizing {len(queries.rows)} distinct queries and {len(passages.rows)} distinct passages "
+                f"for {len(group_query)} training instances")
+
+    arrays = {}
+    arrays["query_tokens"], arrays["query_offsets"] = queries.tokenize(tokenizer, config['q_max_len'])
+    arrays["passage_tokens"], arrays["passage_offsets"] = passages.tokenize(tokenizer, config['p_max_len'])
+    arrays["group_query"] = np.asarray(group_query, dtype=np.int32)
+    arrays["positives"], arrays["positive_offsets"] = flatten(positives)
+    arrays["negatives"], arrays["negative_offsets"] = flatten(negatives)
+
+    # Write into a sibling temp dir and swap it in, so a crash never leaves a partial dataset
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+    with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+        json.dump(dict(key_info, instances=len(group_query), queries=len(queries.rows), passages=len(passages.rows)), f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    logger.info(f"Saved pre-tokenized training data to {path}")
+    return path
+
+class PretokenizedTrainDataset(Dataset):
+    """Drop-in for Tevatron's TrainDataset that reads token ids from a ``pretokenize`` directory.
+
+    Positive and negative selection per epoch is the same as Tevatron's, so training sees the
+    same examples; the arrays are memory-mapped and nothing is tokenized.
+    """
+
+    def __init__(self, path, data_args, trainer=None):
+        self.arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}
+        self.data_args = data_args
+        self.trainer = trainer
+        self.total_len = len(self.arrays["group_query"])
+
+    def __len__(self):
+        return self.total_len
+
+    @property
+    def lengths(self):
+        # Sort key for length-grouped sampling: the longest passage an instance can contribute,
+        # since passages (train_n_passages per query) dominate the padded batch
+        passage_lengths = np.diff(self.arrays["passage_offsets"])
+        return np.maximum(
+            group_max(passage_lengths[self.arrays["positives"]], self.arrays["positive_offsets"]),
+            group_max(passage_lengths[self.arrays["negatives"]], self.arrays["negative_offsets"]),
+        ).tolist()
+
+    def _encoding(self, role, row):
+        tokens, offsets = self.arrays[f"{role}_tokens"], self.arrays[f"{role}_offsets"]
+        return {"input_ids": tokens[offsets[row]:offsets[row + 1]].tolist()}
+
+    def _group(self, name, item):
+        offsets = self.arrays[f"{name}_offsets"]
+        return self.arrays[f"{name}s"][offsets[item]:offsets[item + 1]].tolist()
+
+    def __getitem__(self, item):
+        epoch = int(self.trainer.state.epoch)
+        _hashed_seed = hash(item + self.trainer.args.seed)
+
+        encoded_query = self._encoding("query", self.arrays["group_query"][item])
+        group_positives = self._group("positive", item)
+        group_negatives = self._group("negative", item)
+
+        if self.data_args.positive_passage_no_shuffle:
+            pos_psg = group_positives[0]
+        else:
+            pos_psg = group_positives[(_hashed_seed + epoch) % len(group_positives)]
+        encoded_passages = [self._encoding("passage", pos_psg)]
+
+        negative_size = self.data_args.train_n_passages - 1
+        if len(group_negatives) < negative_size:
+            negs = random.choices(group_negatives, k=negative_size)
+        elif self.data_args.train_n_passages == 1:
+            negs = []
+        elif self.data_args.negative_passage_no_shuffle:
+            negs = group_negatives[:negative_size]
+        else:
+            _offset = epoch * negative_size % len(group_negatives)
+            negs = list(group_negatives)
+            random.Random(_hashed_seed).shuffle(negs)
+            negs = negs * 2
+            negs = negs[_offset: _offset + negative_size]
+
+        encoded_passages.extend(self._encoding("passage", neg) for neg in negs)
+        return encoded_query, encoded_passages
+
+@dataclass
+class TrainCollator(QPCollator):
+    """QPCollator that can pad each batch to its longest text instead of the max lengths.
+
+    Counts real (attention-masked) and padded tokens, for throughput and padding-efficiency reports.
+    """
+    dynamic_padding: bool = False
+    tokens: int = 0
+    padded_tokens: int = 0
+
+    def _pad(self, features, max_len):
+        if self.dynamic_padding:
+            return self.tokenizer.pad(features, padding='longest', pad_to_multiple_of=self.pad_to_multiple_of, return_tensors="pt")
+        return self.tokenizer.pad(features, padding='max_length', max_length=max_len, return_tensors="pt")
+
+    def __call__(self, features):
+        qq = [f[0] for f in features]
+        dd = [p for f in features for p in f[1]]
+        q_collated = self._pad(qq, self.max_q_len)
+        d_collated = self._pad(dd, self.max_p_len)
+        self.tokens += int(q_collated['attention_mask'].sum() + d_collated['attention_mask'].sum())
+        self.padded_tokens += q_collated['input_ids'].numel() + d_collated['input_ids'].numel()
+        return q_collated, d_collated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokenize the training set once for train.py (pretokenize: true)")
+    parser.add_argument("--config", required=True, help="Training config (train_dir, model_name_or_path, max lengths)")
+    args = parser.parse_args()
+
+    pretokenize(load_config(args.config))
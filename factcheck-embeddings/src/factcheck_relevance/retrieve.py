@@ -2,10 +2,14 @@ import argparse
 import numpy as np
 import faiss
 import logging
-import pickle
 import os
+from itertools import chain
 from tqdm import tqdm
-from factcheck_relevance.utils import load_config
+from factcheck_relevance.utils import load_config, iter_json
+from factcheck_relevance.embedding_store import load_embeddings
+from factcheck_relevance.index import load_or_build_index, search
+from factcheck_relevance.sharded_retrieve import check_shardable, search_shards
+from factcheck_relevance.telemetry import instrument, step, telemetry_path
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,57 +19,125 @@ def run_retrieval(config):
     corpus_reps_path = config['corpus_out_path']
     save_path = config['run_path']
     topk = config.get('topk', 100)
+    sharded = config.get('retrieve_shards', 1) > 1 and config.get('retrieval_mode', 'index') != 'candidates'
+    if sharded:
+        check_shardable(corpus_reps_path)
     
-    logger.info(f"Loading query representations from {query_reps_path}")
-    # Tevatron saves as pickle maps or multiple files. We assume standard glob or single file here.
-    # For simplicity, we handle the case where tevatron saves as list of pickles (default behavior)
+    with step("load_embeddings"):
+        logger.info(f"Loading query representations from {query_reps_path}")
+        query_ids, query_reps = load_embeddings(query_reps_path)
+        logger.info(f"Loading corpus representations from {corpus_reps_path}")
+        corpus_ids, corpus_reps = load_embeddings(corpus_reps_path)
+        
+        # FAISS needs float32 queries. Corpus rows stay as stored (memory-mapped for stores) and
+        # are converted per block when the index is built or candidates are scored
+        query_reps = np.ascontiguousarray(query_reps, dtype=np.float32)
+        
+        corpus_ids = np.asarray(corpus_ids).astype(str)
+    score_format = config.get('run_score_format', '%.6f')
+    batch_size = config.get('query_batch_size', 4096)
     
-    def load_reps(path):
-        # Handle directory or file
-        if os.path.isdir(path):
-            files = [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.pkl')]
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    with open(save_path, 'w') as writer:
+        if config.get('retrieval_mode', 'index') == 'candidates':
+            logger.info(f"Scoring each query against its candidates from {config['candidates_path']}, saving results to {save_path}")
+            chunks = score_candidates(query_ids, query_reps, corpus_ids, corpus_reps, config, topk, batch_size)
+        elif sharded:
+            chunks = search_shards(query_ids, len(corpus_ids), config, topk, batch_size)
         else:
-            files = [path]
+            chunks = search_index(query_ids, query_reps, corpus_reps, corpus_reps_path, config, topk, batch_size)
         
-        all_reps = []
-        all_ids = []
-        for f in sorted(files):
-            with open(f, 'rb') as reader:
-                data = pickle.load(reader)
-                # data is usually (reps, ids) in Tevatron
-                if isinstance(data[0], np.ndarray) and data[0].ndim > 1:
-                    reps, ids = data[0], data[1]
-                elif isinstance(data[1], np.ndarray) and data[1].ndim > 1:
-                    ids, reps = data[0], data[1]
-                else:
-                    reps, ids = data[0], data[1]
-                
-                all_ids.extend(ids)
-                if isinstance(reps, list):
-                    reps = np.array(reps)
-                all_reps.append(reps)
-        return all_ids, np.concatenate(all_reps, axis=0)
+        for chunk_qids, scores, indices in chunks:
+            with step("write_run", count=int((indices >= 0).sum()), unit="lines"):
+                write_run_chunk(writer, chunk_qids, corpus_ids, scores, indices, score_format)
 
-    query_ids, query_reps = load_reps(query_reps_path)
-    corpus_ids, corpus_reps = load_reps(corpus_reps_path)
+def search_index(query_ids, query_reps, corpus_reps, corpus_reps_path, config, topk, batch_size):
+    logger.info(f"Preparing FAISS index ({config.get('index_type', 'flat')})...")
+    index = load_or_build_index(corpus_reps, corpus_reps_path, config)
     
-    dim = query_reps.shape[1]
-    index = faiss.IndexFlatIP(dim)
+    threads = config.get('faiss_threads')
+    if threads:
+        faiss.omp_set_num_threads(threads)
     
-    logger.info("Building FAISS index...")
-    index.add(corpus_reps)
+    # Queries are searched and written chunk by chunk, so memory is bounded by the batch size
+    logger.info(f"Searching for top-{topk} in batches of {batch_size}...")
+    for start in tqdm(range(0, len(query_ids), batch_size), desc="Searching"):
+        end = start + batch_size
+        with step("search", count=len(query_reps[start:end]), unit="queries"):
+            scores, indices = search(index, query_reps[start:end], corpus_reps, topk, config)
+        yield query_ids[start:end], scores, indices
+
+def score_candidates(query_ids, query_reps, corpus_ids, corpus_reps, config, topk, batch_size):
+    """Exact ranking of each query against only its own candidate docids.
+
+    Yields the same (qids, scores, indices) chunks as ``search_index``, padded with -1
+    for queries with fewer than ``topk`` candidates.
+    """
+    doc_row = {docid: row for row, docid in enumerate(corpus_ids.tolist())}
+    query_row = {str(qid): row for row, qid in enumerate(query_ids)}
+    pair_batch_size = config.get('pair_batch_size', 16384)
     
-    logger.info(f"Searching for top-{topk}...")
-    scores, indices = index.search(query_reps, topk)
+    candidates = []
+    missing_docs = 0
+    for item in iter_json(config['candidates_path']):
+        row = query_row.get(str(item['text_id']))
+        if row is None:
+            continue
+        rows = [doc_row[d] for d in item['candidates'] if d in doc_row]
+        missing_docs += len(item['candidates']) - len(rows)
+        candidates.append((row, rows))
+    if missing_docs:
+        logger.warning(f"{missing_docs} candidate docids are not in the corpus embeddings and were skipped")
+    logger.info(f"Scoring {sum(len(c[1]) for c in candidates)} candidates for {len(candidates)} queries")
     
-    logger.info(f"Saving results to {save_path}")
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    with open(save_path, 'w') as writer:
-        for i, qid in enumerate(query_ids):
-            for j in range(topk):
-                docid = corpus_ids[indices[i][j]]
-                score = scores[i][j]
-                writer.write(f"{qid}\t{docid}\t{j+1}\t{score}\n")
+    for start in tqdm(range(0, len(candidates), batch_size), desc="Scoring"):
+        chunk = candidates[start:start + batch_size]
+        with step("score_candidates", count=len(chunk), unit="queries"):
+            scores, indices = _score_chunk(chunk, query_reps, corpus_reps, topk, pair_batch_size)
+        yield [query_ids[row] for row, _ in chunk], scores, indices
+
+def _score_chunk(chunk, query_reps, corpus_reps, topk, pair_batch_size):
+    # Exact top-k of one chunk of (query row, candidate rows) pairs
+    counts = np.array([len(rows) for _, rows in chunk], dtype=np.int64)
+    pair_q = np.repeat(np.arange(len(chunk)), counts)
+    pair_qrow = np.repeat(np.array([row for row, _ in chunk], dtype=np.int64), counts)
+    pair_drow = np.fromiter((d for _, rows in chunk for d in rows), dtype=np.int64, count=int(counts.sum()))
+    
+    # Gathered dot products, in blocks to bound the gathered matrices
+    pair_scores = np.empty(len(pair_drow), dtype=np.float32)
+    for b in range(0, len(pair_drow), pair_batch_size):
+        sl = slice(b, b + pair_batch_size)
+        pair_scores[sl] = np.einsum('ij,ij->i', query_reps[pair_qrow[sl]], corpus_reps[pair_drow[sl]].astype(np.float32, copy=False))
+    
+    # Sort by query, then score descending; ties keep candidate order
+    order = np.lexsort((-pair_scores, pair_q))
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ranks = np.arange(len(order)) - np.repeat(offsets, counts)
+    keep = ranks < topk
+    
+    scores = np.zeros((len(chunk), topk), dtype=np.float32)
+    indices = np.full((len(chunk), topk), -1, dtype=np.int64)
+    scores[pair_q[order][keep], ranks[keep]] = pair_scores[order][keep]
+    indices[pair_q[order][keep], ranks[keep]] = pair_drow[order][keep]
+    return scores, indices
+
+def write_run_chunk(writer, query_ids, corpus_ids, scores, indices, score_format='%.6f'):
+    """Write one chunk of search results as ``qid\tdocid\trank\tscore`` lines.
+
+    Columns are gathered with NumPy and the whole chunk is rendered by a single
+    %-format call instead of one f-string per (query, rank) pair.
+    """
+    num_queries, topk = indices.shape
+    # Approximate indexes pad with -1 when fewer than topk candidates were probed
+    valid = indices >= 0
+    
+    qid_col = np.repeat(np.asarray(query_ids).astype(str), valid.sum(axis=1)).tolist()
+    docid_col = corpus_ids[indices[valid]].tolist()
+    rank_col = np.broadcast_to(np.arange(1, topk + 1), (num_queries, topk))[valid].tolist()
+    score_col = scores[valid].astype(np.float64).tolist()
+    
+    template = f"%s\t%s\t%d\t{score_format}\n"
+    writer.write((template * len(qid_col)) % tuple(chain.from_iterable(zip(qid_col, docid_col, rank_col, score_col))))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -73,4 +145,5 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     config = load_config(args.config)
-    run_retrieval(config)
+    with instrument("retrieve", telemetry_path(config['run_path'], "retrieve")):
+        run_retrieval(config)
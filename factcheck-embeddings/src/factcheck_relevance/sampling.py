@@ -0,0 +1,56 @@
+import math
+import numpy as np
+
+# Negative sampling policies.
+# Each policy receives the claim's negative similarities already sorted in descending
+# order and returns a (num_samples, k_neg) array of positions into that sorted order.
+
+def hard_mix_policy(sorted_sims, num_samples, k_neg, rng, config):
+    # ceil(hard_frac * k_neg) from the top hard_pool_size, the rest from all remaining negatives
+    n = len(sorted_sims)
+    n_hard_pool = min(config.get('hard_pool_size', 20), n)
+    k_hard = min(math.ceil(config.get('hard_frac', 0.67) * k_neg), n_hard_pool)
+    k_rest = k_neg - k_hard
+    
+    # One random key per (sample, negative); ranking keys gives a uniform sample without replacement
+    keys = rng.random((num_samples, n))
+    hard = np.argsort(keys[:, :n_hard_pool], axis=1)[:, :k_hard]
+    if k_rest == 0:
+        return hard
+    
+    keys[np.arange(num_samples)[:, None], hard] = np.inf
+    rest = np.argpartition(keys, k_rest - 1, axis=1)[:, :k_rest]
+    return np.concatenate([hard, rest], axis=1)
+
+def random_policy(sorted_sims, num_samples, k_neg, rng, config):
+    keys = rng.random((num_samples, len(sorted_sims)))
+    return np.argpartition(keys, k_neg - 1, axis=1)[:, :k_neg]
+
+def hardest_policy(sorted_sims, num_samples, k_neg, rng, config):
+    return np.tile(np.arange(k_neg), (num_samples, 1))
+
+NEGATIVE_POLICIES = {
+    'hard_mix': hard_mix_policy,
+    'random': random_policy,
+    'hardest': hardest_policy,
+}
+
+def sample_negatives(sims, num_samples, config, rng):
+    """Sample k_neg negatives for each of ``num_samples`` positives of one claim.
+
+    Returns a (num_samples, k_neg) array of indices into ``sims``, or None when the
+    claim has fewer than k_neg negatives.
+    """
+    k_neg = config.get('k_neg', 3)
+    if len(sims) < k_neg:
+        return None
+    
+    policy_name = config.get('neg_policy', 'hard_mix')
+    if policy_name not in NEGATIVE_POLICIES:
+        raise ValueError(f"Unknown neg_policy '{policy_name}', expected one of {sorted(NEGATIVE_POLICIES)}")
+    
+    # Sort once per claim (stable, so ties keep input order)
+    sims = np.asarray(sims, dtype=np.float64)
+    order = np.argsort(-sims, kind='stable')
+    positions = NEGATIVE_POLICIES[policy_name](sims[order], num_samples, k_neg, rng, config)
+    return order[positions]
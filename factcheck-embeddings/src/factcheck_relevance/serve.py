@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from factcheck_relevance.embedding_store import load_embeddings
+from factcheck_relevance.encoder import load_encoder
+from factcheck_relevance.index import load_or_build_index, search
+from factcheck_relevance.utils import load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# API (JSON over HTTP/1.1, TCP or Unix socket):
+#   POST /search  {"claim": "...", "topk": 10}  ->  {"results": [{"docid": ..., "score": ...}, ...]}
+#   GET  /health                                ->  {"status": "ok", "docs": N, "batches": ..., ...}
+
+class Retriever:
+    """Query encoder and corpus index loaded once, with an LRU cache of claim embeddings."""
+
+    def __init__(self, config):
+        self.config = config
+        self.topk = config.get('topk', 100)
+        self.prefix = config.get('query_prefix', '')
+        self.encoder = load_encoder(config)
+
+        corpus_path = config['corpus_out_path']
+        logger.info(f"Loading corpus representations from {corpus_path}")
+        corpus_ids, self.corpus_reps = load_embeddings(corpus_path)
+        self.corpus_ids = np.asarray(corpus_ids).astype(str)
+        self.index = load_or_build_index(self.corpus_reps, corpus_path, config)
+
+        self.cache = OrderedDict()
+        self.cache_size = config.get('query_cache_size', 10000)
+        self.cache_hits = 0
+
+    def embed(self, claims):
+        reps = [self.cache.get(c) for c in claims]
+        missing = list(dict.fromkeys(c for c, r in zip(claims, reps) if r is None))
+        if missing:
+            new = dict(zip(missing, self.encoder.encode([f"{self.prefix}{c}" for c in missing], is_query=True)))
+            reps = [new[c] if r is None else r for c, r in zip(claims, reps)]
+        self.cache_hits += len(claims) - len(missing)
+
+        for claim, rep in zip(claims, reps):
+            self.cache[claim] = rep
+            self.cache.move_to_end(claim)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return np.stack(reps).astype(np.float32, copy=False)
+
+    def search(self, claims, topk):
+        scores, indices = search(self.index, self.embed(claims), self.corpus_reps, topk, self.config)
+        results = []
+        for row_scores, row_indices in zip(scores, indices):
+            valid = row_indices >= 0
+            results.append([{"docid": d, "score": float(s)}
+                            for d, s in zip(self.corpus_ids[row_indices[valid]].tolist(), row_scores[valid])])
+        return results
+
+class MicroBatcher:
+    """Groups concurrent requests into one encode + search call.
+
+    A batch is started by the first waiting request and closed after ``max_wait_ms``
+    or once it holds ``max_batch_size`` claims, whichever comes first.
+    """
+
+    def __init__(self, retriever, max_batch_size=64, max_wait_ms=5.0):
+        self.retriever = retriever
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # One worker thread: encoding and search keep the event loop free but never overlap
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.requests = 0
+
+    async def search(self, claim, topk):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((claim, topk, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            claims = [claim for claim, _, _ in batch]
+            topk = max(k for _, k, _ in batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self.retriever.search, claims, topk)
+            except Exception as e:
+                logger.exception("Batch failed")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            for (_, k, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result[:k])
+
+async def read_request(reader):
+    # Minimal HTTP/1.1 parsing: request line, headers, Content-Length body
+    line = await reader.readline()
+    if not line:
+        return None
+    method, path, _ = line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, path, headers, body
+
+def write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload).encode('utf-8')
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+    head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+
+class RetrievalService:
+    def __init__(self, retriever, max_batch_size=64, max_wait_ms=5.0):
+        self.retriever = retriever
+        self.batcher = MicroBatcher(retriever, max_batch_size, max_wait_ms)
+
+    async def handle(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {
+                "status": "ok", "docs": len(self.retriever.corpus_ids), "requests": self.batcher.requests,
+                "batches": self.batcher.batches, "cache_hits": self.retriever.cache_hits,
+            }
+        if method == 'POST' and path == '/search':
+            try:
+                request = json.loads(body)
+                claim = request['claim']
+                if not isinstance(claim, str):
+                    raise TypeError("claim must be a string")
+                topk = int(request.get('topk', self.retriever.topk))
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {"error": f"Expected {{\"claim\": str, \"topk\": int}}: {e}"}
+            try:
+                return 200, {"results": await self.batcher.search(claim, topk)}
+            except Exception as e:
+                return 500, {"error": str(e)}
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self.handle(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765, socket_path=None):
+        self.batch_task = asyncio.create_task(self.batcher.run())
+        if socket_path:
+            server = await asyncio.start_unix_server(self.serve_connection, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.serve_connection, host, port)
+        return server
+
+async def serve(config, host, port, socket_path=None):
+    start = time.perf_counter()
+    service = RetrievalService(
+        Retriever(config),
+        max_batch_size=config.get('serve_max_batch_size', 64),
+        max_wait_ms=config.get('serve_max_wait_ms', 5.0),
+    )
+    server = await service.start(host, port, socket_path)
+    logger.info(f"Ready in {time.perf_counter() - start:.1f}s, listening on {socket_path or f'http://{host}:{port}'}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve claim retrieval over a local HTTP API")
+    parser.add_argument("--config", required=True, help="Inference config (model, corpus embeddings, index settings)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    asyncio.run(serve(config, args.host, args.port, args.socket))
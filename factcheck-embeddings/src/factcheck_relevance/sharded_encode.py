@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import multiprocessing as mp
+import numpy as np
+import torch
+from factcheck_relevance.embedding_cache import encoder_fingerprint
+from factcheck_relevance.embedding_store import write_embeddings
+from factcheck_relevance.encoder import load_encoder
+from factcheck_relevance.utils import hash_files, iter_json, load_reps, save_jsonl
+
+logger = logging.getLogger(__name__)
+
+# Shard layout under <encode_shard_dir>/<job hash>/:
+#   shard_00000.jsonl  contiguous slice of the input
+#   shard_00000.pkl    its embeddings; written atomically, so its presence marks the shard done
+# The job hash covers the input content, model and encode settings, so a rerun after a
+# crash finds the finished shards and only encodes the rest.
+
+def job_dir(config, in_path, is_query, num_shards):
+    job = {
+        "input": hash_files([in_path]),
+        "model": encoder_fingerprint(config),
+        "max_len": config.get('q_max_len', 64) if is_query else config.get('p_max_len', 192),
+        "is_query": is_query,
+        "num_shards": num_shards,
+    }
+    digest = hashlib.blake2b(json.dumps(job, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(config.get('encode_shard_dir', 'runs/encode_shards'), digest)
+
+def split_shards(in_path, work_dir, num_shards):
+    items = list(iter_json(in_path))
+    bounds = [len(items) * i // num_shards for i in range(num_shards + 1)]
+    paths = []
+    for i in range(num_shards):
+        path = os.path.join(work_dir, f"shard_{i:05d}.jsonl")
+        if not os.path.exists(path):
+            save_jsonl(items[bounds[i]:bounds[i + 1]], f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        paths.append(path)
+    return paths
+
+def _init_worker(num_threads):
+    # Pin each worker's intra-op threads so workers don't oversubscribe the cores
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+def _encode_shard(args):
+    config, shard_in, shard_out, is_query = args
+    # The encoder is cached per process, so each worker loads the model once
+    load_encoder(config).encode_file(shard_in, f"{shard_out}.tmp.pkl", is_query=is_query)
+    os.replace(f"{shard_out}.tmp.pkl", shard_out)
+    return shard_out
+
+def sharded_encode(config, in_path, out_path, is_query=False):
+    """Encode ``in_path`` in contiguous shards across worker processes and merge them in order.
+
+    Same contract as the single-process encoders. ``encode_workers`` processes each run
+    ``encode_threads`` torch threads (default: cores / workers); ``encode_shards`` defaults
+    to the worker count.
+    """
+    num_workers = config.get('encode_workers', 1)
+    num_shards = config.get('encode_shards', num_workers)
+    num_threads = config.get('encode_threads', max(1, (os.cpu_count() or 1) // num_workers))
+
+    work_dir = job_dir(config, in_path, is_query, num_shards)
+    os.makedirs(work_dir, exist_ok=True)
+    shard_inputs = split_shards(in_path, work_dir, num_shards)
+    shard_outputs = [p[:-len(".jsonl")] + ".pkl" for p in shard_inputs]
+
+    # ONNX Runtime keeps its own thread pool; pin it the same way
+    worker_config = dict(config, onnx_threads=config.get('onnx_threads', num_threads))
+    pending = [(worker_config, i, o, is_query) for i, o in zip(shard_inputs, shard_outputs) if not os.path.exists(o)]
+    logger.info(f"Sharded encode in {work_dir}: {num_shards - len(pending)}/{num_shards} shards done, "
+                f"encoding {len(pending)} with {num_workers} workers x {num_threads} threads")
+
+    if pending:
+        # spawn, not fork: forking after torch has started its thread pools can deadlock
+        ctx = mp.get_context('spawn')
+        with ctx.Pool(min(num_workers, len(pending)), initializer=_init_worker, initargs=(num_threads,)) as pool:
+            for shard_out in pool.imap_unordered(_encode_shard, pending):
+                logger.info(f"Finished {shard_out}")
+
+    ids = []
+    reps = []
+    for shard_out in shard_outputs:
+        shard_ids, shard_reps = load_reps(shard_out)
+        ids.extend(shard_ids)
+        if len(shard_ids):
+            reps.append(np.asarray(shard_reps, dtype=np.float32))
+    reps = np.concatenate(reps) if reps else np.empty((0, 0), dtype=np.float32)
+    write_embeddings(out_path, ids, reps, model=config['model_name_or_path'])
+    logger.info(f"Merged {num_shards} shards ({len(ids)} texts) into {out_path}")
+    shutil.rmtree(work_dir, ignore_errors=True)
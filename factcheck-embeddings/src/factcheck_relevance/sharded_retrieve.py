@@ -0,0 +1,118 @@
+import heapq
+import logging
+import os
+import shutil
+import multiprocessing as mp
+from itertools import islice
+import numpy as np
+import faiss
+from factcheck_relevance.embedding_store import is_embedding_store, load_embeddings, open_embeddings
+from factcheck_relevance.index import load_or_build_index, search
+from factcheck_relevance.telemetry import step
+
+logger = logging.getLogger(__name__)
+
+# Shard layout under <run_path>.shards/:
+#   shard_00000.scores.npy   top-k scores of every query against one contiguous slice of the corpus
+#   shard_00000.indices.npy  the matching corpus rows (global row numbers, -1 padded)
+# Each worker writes its pair atomically; the parent merges them query chunk by query chunk
+# through memory maps and removes the directory afterwards.
+
+def check_shardable(corpus_path):
+    # Workers read their rows through the store's memory map; a pickle would be loaded whole by every process
+    if not is_embedding_store(corpus_path):
+        raise ValueError(f"retrieve_shards needs the corpus as an embedding store, not {corpus_path}; convert it with "
+                         f"python -m factcheck_relevance.embedding_store --input {corpus_path} --output <store dir>")
+
+def shard_bounds(num_docs, num_shards):
+    return [num_docs * i // num_shards for i in range(num_shards + 1)]
+
+def _init_worker(num_threads):
+    # Each worker searches with a fixed number of OpenMP threads so workers don't oversubscribe the cores
+    faiss.omp_set_num_threads(num_threads)
+
+def _search_shard(args):
+    config, start, end, out_prefix = args
+    _, query_reps = load_embeddings(config['query_out_path'])
+    query_reps = np.ascontiguousarray(query_reps, dtype=np.float32)
+    # The store is memory-mapped, so only this shard's rows are ever read
+    _, corpus_reps, _ = open_embeddings(config['corpus_out_path'])
+    shard_reps = corpus_reps[start:end]
+    index = load_or_build_index(shard_reps, config['corpus_out_path'], config, rows=(start, end))
+
+    topk = config.get('topk', 100)
+    batch_size = config.get('query_batch_size', 4096)
+    scores = np.lib.format.open_memmap(f"{out_prefix}.scores.tmp.npy", mode='w+', dtype=np.float32, shape=(len(query_reps), topk))
+    indices = np.lib.format.open_memmap(f"{out_prefix}.indices.tmp.npy", mode='w+', dtype=np.int64, shape=(len(query_reps), topk))
+    for q in range(0, len(query_reps), batch_size):
+        chunk_scores, chunk_indices = search(index, query_reps[q:q + batch_size], shard_reps, topk, config)
+        # Shard-local rows to corpus rows; shards smaller than topk pad with -1
+        scores[q:q + batch_size] = chunk_scores
+        indices[q:q + batch_size] = np.where(chunk_indices >= 0, chunk_indices + start, -1)
+    scores.flush()
+    indices.flush()
+    del scores, indices
+    for name in ("scores", "indices"):
+        os.replace(f"{out_prefix}.{name}.tmp.npy", f"{out_prefix}.{name}.npy")
+    return out_prefix
+
+def merge_topk(shard_scores, shard_indices, topk):
+    """Merge per-shard top-k lists into the global top-k of each query.
+
+    Every shard's list is already sorted by descending score, so a k-way heap merge
+    stops after ``topk`` pops. Equal scores are emitted higher corpus row first, as FAISS
+    orders them. Which of several rows tied at the ``topk`` cutoff a single FAISS index keeps
+    depends on its scan order, so at the cutoff the merged rows (not the scores) can differ.
+    """
+    num_queries = len(shard_scores[0])
+    scores = np.zeros((num_queries, topk), dtype=np.float32)
+    indices = np.full((num_queries, topk), -1, dtype=np.int64)
+    # -1 padding sits at the end of a shard's list; drop it before merging
+    counts = [(np.asarray(i) >= 0).sum(axis=1).tolist() for i in shard_indices]
+    shard_scores = [(-np.asarray(s, dtype=np.float64)).tolist() for s in shard_scores]
+    shard_indices = [(-np.asarray(i)).tolist() for i in shard_indices]
+    for q in range(num_queries):
+        runs = [zip(s[q][:n[q]], i[q][:n[q]]) for s, i, n in zip(shard_scores, shard_indices, counts)]
+        merged = list(islice(heapq.merge(*runs), topk))
+        if merged:
+            neg_scores, neg_rows = zip(*merged)
+            scores[q, :len(merged)] = np.negative(neg_scores)
+            indices[q, :len(merged)] = np.negative(neg_rows)
+    return scores, indices
+
+def search_shards(query_ids, num_docs, config, topk, batch_size):
+    """Search the corpus split into ``retrieve_shards`` contiguous shards across worker processes.
+
+    Yields the same (qids, scores, indices) chunks as ``retrieve.search_index``. With a flat
+    index the merged scores equal the single-index ones, and so do the rows apart from exact
+    ties at the ``topk`` cutoff (see ``merge_topk``); other index types are built and searched
+    per shard, so their candidates can differ from a single index over the whole corpus.
+    """
+    num_shards = min(config['retrieve_shards'], num_docs)
+    num_workers = config.get('retrieve_workers', min(num_shards, os.cpu_count() or 1))
+    num_threads = config.get('faiss_threads', max(1, (os.cpu_count() or 1) // num_workers))
+
+    work_dir = f"{config['run_path']}.shards"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    bounds = shard_bounds(num_docs, num_shards)
+    tasks = [(config, bounds[i], bounds[i + 1], os.path.join(work_dir, f"shard_{i:05d}")) for i in range(num_shards)]
+    logger.info(f"Searching {num_shards} corpus shards with {num_workers} workers x {num_threads} threads")
+
+    with step("search_shards", count=len(query_ids), unit="queries"):
+        # spawn, not fork: forking after FAISS has started its OpenMP pool can deadlock
+        ctx = mp.get_context('spawn')
+        with ctx.Pool(min(num_workers, num_shards), initializer=_init_worker, initargs=(num_threads,)) as pool:
+            for out_prefix in pool.imap_unordered(_search_shard, tasks):
+                logger.info(f"Finished {out_prefix}")
+
+    prefixes = [t[3] for t in tasks]
+    shard_scores = [np.load(f"{p}.scores.npy", mmap_mode='r') for p in prefixes]
+    shard_indices = [np.load(f"{p}.indices.npy", mmap_mode='r') for p in prefixes]
+    for start in range(0, len(query_ids), batch_size):
+        end = start + batch_size
+        with step("merge_shards", count=len(query_ids[start:end]), unit="queries"):
+            scores, indices = merge_topk([s[start:end] for s in shard_scores], [i[start:end] for i in shard_indices], topk)
+        yield query_ids[start:end], scores, indices
+    del shard_scores, shard_indices
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,137 @@
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Per-process record of timed steps. Modules wrap their sub-steps in ``step(...)``; a stage's
+# ``__main__`` wraps the whole run in ``instrument(...)``, which writes the records as JSON.
+# Steps nest ("retrieve/search") and repeated steps (one per batch) are aggregated by name.
+# Setting FACTCHECK_PROFILE=1 also dumps a cProfile file next to the telemetry JSON
+# (view with snakeviz or pstats); py-spy can attach to the pid recorded in the JSON.
+# Steps outside ``recording()`` (which ``instrument`` enters) are not kept, so long-lived
+# processes like the retrieval service don't accumulate records.
+
+_records = []
+_local = threading.local()
+_recording = 0
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return rss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+class StepCounter:
+    def __init__(self, count=None):
+        self.count = count
+
+@contextmanager
+def step(name, count=None, unit='items'):
+    """Time a block; set ``.count`` on the yielded object (or pass ``count``) to get a throughput."""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(name)
+    path = "/".join(stack)
+    counter = StepCounter(count)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield counter
+    finally:
+        stack.pop()
+        if _recording:
+            _records.append({
+                "name": path,
+                "start": wall,
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.process_time() - cpu,
+                "count": counter.count,
+                "unit": unit,
+                "peak_rss_mb": peak_rss_mb(),
+            })
+
+@contextmanager
+def recording():
+    """Keep the records of steps run inside this block (from any thread)."""
+    global _recording
+    _recording += 1
+    try:
+        yield _records
+    finally:
+        _recording -= 1
+
+def summarize(records):
+    # One entry per step name, ordered by first start, summing repeated calls
+    steps = {}
+    for r in sorted(records, key=lambda r: r["start"]):
+        s = steps.setdefault(r["name"], {"name": r["name"], "calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                         "count": None, "unit": r["unit"], "peak_rss_mb": None})
+        s["calls"] += 1
+        s["wall_s"] += r["wall_s"]
+        s["cpu_s"] += r["cpu_s"]
+        if r["count"] is not None:
+            s["count"] = (s["count"] or 0) + r["count"]
+        if r["peak_rss_mb"] is not None:
+            s["peak_rss_mb"] = max(s["peak_rss_mb"] or 0.0, r["peak_rss_mb"])
+    for s in steps.values():
+        s["per_sec"] = s["count"] / s["wall_s"] if s["count"] and s["wall_s"] > 0 else None
+    return list(steps.values())
+
+def telemetry_path(output_path, stage):
+    # Sibling of the stage's main output (never inside it, so output fingerprints stay stable)
+    return f"{output_path.rstrip(os.sep)}.{stage}.telemetry.json"
+
+def load_telemetry(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+@contextmanager
+def instrument(stage, path, unit='items'):
+    """Run a whole stage under ``step(stage)`` and write its telemetry to ``path``.
+
+    Yields the stage's counter, so the caller can record how many items the stage processed.
+    """
+    del _records[:]
+    started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    profiler = cProfile.Profile() if os.environ.get('FACTCHECK_PROFILE') else None
+    if profiler:
+        profiler.enable()
+    try:
+        with recording(), step(stage, unit=unit) as counter:
+            yield counter
+    finally:
+        if profiler:
+            profiler.disable()
+        steps = summarize(_records)
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                "stage": stage,
+                "argv": sys.argv,
+                "pid": os.getpid(),
+                "started": started,
+                "wall_s": steps[0]["wall_s"] if steps else None,
+                "cpu_s": steps[0]["cpu_s"] if steps else None,
+                "peak_rss_mb": peak_rss_mb(),
+                "steps": steps,
+            }, f, indent=2)
+        logger.info(f"Wrote telemetry to {path}")
+        if profiler:
+            profile_path = path[:-len(".telemetry.json")] + ".prof" if path.endswith(".telemetry.json") else f"{path}.prof"
+            profiler.dump_stats(profile_path)
+            logger.info(f"Wrote cProfile stats to {profile_path}")
@@ -1,10 +1,23 @@
 import argparse
+import json
+import logging
 import sys
 import os
+import time
+import torch
+import torch.nn.functional as F
+from transformers import AutoConfig, AutoTokenizer, HfArgumentParser, TrainerCallback, set_seed
+from transformers.trainer_pt_utils import LengthGroupedSampler
+from factcheck_relevance.pretokenize import PretokenizedTrainDataset, TrainCollator, pretokenize
+from factcheck_relevance.telemetry import instrument, step, telemetry_path
 from factcheck_relevance.utils import load_config
+from tevatron.arguments import DataArguments, DenseTrainingArguments, ModelArguments
 from tevatron.driver.train import main as train_main
+from tevatron.modeling import DenseModel
 from tevatron.trainer import DenseTrainer
 
+logger = logging.getLogger(__name__)
+
 # Monkeypatch DenseTrainer.compute_loss for compatibility with newer transformers
 def compute_loss_patched(self, model, inputs, return_outputs=False, **kwargs):
     query, passage = inputs
@@ -14,6 +27,181 @@ def compute_loss_patched(self, model, inputs, return_outputs=False, **kwargs):
 
 DenseTrainer.compute_loss = compute_loss_patched
 
+def loss_scale(trainer):
+    # Micro-batch losses are averaged over gradient_accumulation_steps. accelerate's backward divides
+    # by its own count, which the transformers Trainer leaves at 1, so the rest is scaled here
+    return trainer.accelerator.gradient_accumulation_steps / trainer.args.gradient_accumulation_steps
+
+# Same for DenseTrainer.training_step: transformers 4.46 backpropagates the unscaled micro-batch
+# loss, summing rather than averaging gradients over accumulation steps
+def training_step_patched(self, model, inputs, num_items_in_batch=None):
+    model.train()
+    inputs = self._prepare_inputs(inputs)
+    with self.compute_loss_context_manager():
+        loss = self.compute_loss(model, inputs)
+    if self.args.n_gpu > 1:
+        loss = loss.mean()
+    self.accelerator.backward(loss * loss_scale(self))
+    return loss.detach() / self.args.gradient_accumulation_steps / self._dist_loss_scale_factor
+
+DenseTrainer.training_step = training_step_patched
+
+def count_examples(train_dir):
+    # Training instances across the jsonl files Tevatron reads from train_dir
+    total = 0
+    for name in os.listdir(train_dir):
+        if name.endswith('.jsonl') or name.endswith('.json'):
+            with open(os.path.join(train_dir, name), 'rb') as f:
+                total += sum(1 for _ in f)
+    return total
+
+class LengthGroupedMixin:
+    # With group_by_length, batches are drawn from mega-batches sorted by the dataset's lengths
+    # (transformers can only infer lengths for datasets of plain dicts)
+    def _get_train_sampler(self):
+        if self.args.group_by_length and hasattr(self.train_dataset, 'lengths'):
+            return LengthGroupedSampler(self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                                        lengths=self.train_dataset.lengths)
+        return super()._get_train_sampler()
+
+class Trainer(LengthGroupedMixin, DenseTrainer):
+    pass
+
+def split_inputs(inputs, chunk_size):
+    return [{k: v[i:i + chunk_size] for k, v in inputs.items()} for i in range(0, len(inputs['input_ids']), chunk_size)]
+
+def grad_cache_step(model, queries, passages, q_chunk_size, p_chunk_size, backward=torch.autograd.backward, scale=1.0):
+    """One contrastive step over the whole batch with activation memory bounded by the chunk sizes.
+
+    1. encode query and passage chunks without autograd, keeping only the representations
+    2. compute the in-batch loss over all of them and its gradient w.r.t. each representation
+    3. re-encode each chunk with autograd and backpropagate its cached representation gradient
+
+    Each chunk's second forward replays the CPU RNG state of its first, so dropout masks match and
+    the parameter gradients equal those of one full-batch forward/backward. Returns the loss.
+    """
+    chunks = [(model.encode_query, split_inputs(queries, q_chunk_size)),
+              (model.encode_passage, split_inputs(passages, p_chunk_size))]
+    reps, rng_states = [], []
+    with torch.no_grad():
+        for encode, role_chunks in chunks:
+            role_reps = []
+            for chunk in role_chunks:
+                rng_states.append(torch.get_rng_state())
+                role_reps.append(encode(chunk)[1])
+            reps.append(torch.cat(role_reps).requires_grad_())
+
+    q_reps, p_reps = reps
+    target = torch.arange(q_reps.size(0), device=q_reps.device) * model.data_args.train_n_passages
+    loss = F.cross_entropy(q_reps @ p_reps.T, target)
+    loss.backward()
+
+    states = iter(rng_states)
+    for (encode, role_chunks), role_reps in zip(chunks, reps):
+        grads = (role_reps.grad * scale).split([len(c['input_ids']) for c in role_chunks])
+        for chunk, grad in zip(role_chunks, grads):
+            with torch.random.fork_rng(devices=[]):
+                torch.set_rng_state(next(states))
+                chunk_reps = encode(chunk)[1]
+            backward(torch.dot(chunk_reps.flatten(), grad.flatten()))
+    return loss.detach()
+
+class GradCacheTrainer(LengthGroupedMixin, DenseTrainer):
+    """DenseTrainer whose training step runs ``grad_cache_step``, so per_device_train_batch_size can
+    be far larger than the batch whose activations fit in memory."""
+
+    def __init__(self, *args, q_chunk_size=32, p_chunk_size=32, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.q_chunk_size = q_chunk_size
+        self.p_chunk_size = p_chunk_size
+
+    def training_step(self, model, inputs, num_items_in_batch=None):
+        model.train()
+        queries, passages = self._prepare_inputs(inputs)
+        loss = grad_cache_step(model, queries, passages, self.q_chunk_size, self.p_chunk_size,
+                               backward=self.accelerator.backward, scale=loss_scale(self))
+        return loss / self.args.gradient_accumulation_steps
+
+class ThroughputCallback(TrainerCallback):
+    """Logs time, tokens/sec and padding efficiency per epoch from the collator's token counts."""
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.epochs = []
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.start = time.perf_counter()
+        self.counts = (self.collator.tokens, self.collator.padded_tokens)
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        seconds = time.perf_counter() - self.start
+        tokens = self.collator.tokens - self.counts[0]
+        padded = self.collator.padded_tokens - self.counts[1]
+        self.epochs.append({"epoch": len(self.epochs) + 1, "seconds": seconds, "tokens": tokens, "padded_tokens": padded,
+                            "tokens_per_sec": tokens / seconds, "padding_efficiency": tokens / max(padded, 1)})
+        logger.info(f"Epoch {len(self.epochs)}: {seconds:.1f}s, {tokens / seconds:.0f} tokens/s, "
+                    f"{tokens / max(padded, 1):.1%} of padded tokens are real")
+
+def set_torch_threads(config):
+    # 0 / unset keeps torch's defaults (intra-op: one thread per physical core)
+    if config.get('torch_threads'):
+        torch.set_num_threads(config['torch_threads'])
+    if config.get('torch_interop_threads'):
+        try:
+            torch.set_num_interop_threads(config['torch_interop_threads'])
+        except RuntimeError:
+            # Only settable once per process, before any inter-op work
+            logger.warning("torch inter-op threads already set, keeping the current value")
+    logger.info(f"torch threads: {torch.get_num_threads()} intra-op, {torch.get_num_interop_threads()} inter-op")
+
+def train_pretokenized(tevatron_args, config):
+    # Tevatron's train driver, reading token ids from the pre-tokenized dataset instead of
+    # tokenizing train.jsonl on every __getitem__ (i.e. once per example per epoch)
+    model_args, data_args, training_args = HfArgumentParser(
+        (ModelArguments, DataArguments, DenseTrainingArguments)).parse_args_into_dataclasses(args=tevatron_args)
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(name)s -   %(message)s", level=logging.INFO)
+    set_seed(training_args.seed)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_args.model_name_or_path, use_fast=False)
+    with step("pretokenize"):
+        path = pretokenize(config, tokenizer)
+    model = DenseModel.build(model_args, data_args, training_args,
+                             config=AutoConfig.from_pretrained(model_args.model_name_or_path, num_labels=1))
+
+    train_dataset = PretokenizedTrainDataset(path, data_args)
+    collator = TrainCollator(tokenizer, max_p_len=data_args.p_max_len, max_q_len=data_args.q_max_len,
+                             dynamic_padding=config.get('dynamic_padding', False),
+                             pad_to_multiple_of=config.get('pad_to_multiple_of'))
+    throughput = ThroughputCallback(collator)
+    trainer_kwargs = dict(model=model, args=training_args, train_dataset=train_dataset, data_collator=collator, callbacks=[throughput])
+    if config.get('grad_cache', False):
+        logger.info(f"Gradient caching: batch {training_args.per_device_train_batch_size}, "
+                    f"chunks of {config.get('gc_q_chunk_size', 32)} queries / {config.get('gc_p_chunk_size', 32)} passages")
+        trainer = GradCacheTrainer(q_chunk_size=config.get('gc_q_chunk_size', 32), p_chunk_size=config.get('gc_p_chunk_size', 32),
+                                   **trainer_kwargs)
+    else:
+        trainer = Trainer(**trainer_kwargs)
+    train_dataset.trainer = trainer
+
+    with step("train_loop", unit="tokens") as s:
+        result = trainer.train()
+        s.count = collator.tokens
+    trainer.save_model()
+    if trainer.is_world_process_zero():
+        tokenizer.save_pretrained(training_args.output_dir)
+
+    runtime = result.metrics['train_runtime']
+    stats = {
+        "train_runtime": runtime, "steps": result.global_step, "tokens": collator.tokens, "padded_tokens": collator.padded_tokens,
+        "tokens_per_sec": collator.tokens / runtime, "padding_efficiency": collator.tokens / max(collator.padded_tokens, 1),
+        "epochs": throughput.epochs,
+    }
+    logger.info(f"Trained {result.global_step} steps in {runtime:.1f}s: {stats['tokens_per_sec']:.0f} tokens/s, "
+                f"{stats['padding_efficiency']:.1%} of padded tokens are real")
+    with open(os.path.join(training_args.output_dir, "train_throughput.json"), 'w') as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
 def run_train(config):
     # Prepare arguments for Tevatron driver
     train_dir = os.path.abspath(config['train_dir'])
@@ -41,9 +229,26 @@ def run_train(config):
     else:
         tevatron_args.append("--fp16")
 
+    # Effective batch = per_device_train_batch_size x gradient_accumulation_steps; in-batch
+    # negatives still come from one per-device batch
+    tevatron_args.extend(["--gradient_accumulation_steps", str(config.get('gradient_accumulation_steps', 1))])
+    if config.get('max_steps'):
+        tevatron_args.extend(["--max_steps", str(config['max_steps'])])
+
     # Set CUDA_VISIBLE_DEVICES="" to force CPU
     os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    set_torch_threads(config)
     
+    # Pre-tokenization reads train_dir, so it does not apply to hub datasets
+    if config.get('pretokenize', False) and not config.get('dataset_name'):
+        logger.info("Training from pre-tokenized data")
+        if config.get('group_by_length', False):
+            tevatron_args.append("--group_by_length")
+        return train_pretokenized(tevatron_args, config)
+
+    if config.get('group_by_length') or config.get('dynamic_padding') or config.get('grad_cache'):
+        logger.warning("group_by_length, dynamic_padding and grad_cache need pretokenize: true; ignoring them")
+
     # Mock sys.argv to pass to Tevatron
     sys.argv = [sys.argv[0]] + tevatron_args
     
@@ -55,4 +260,6 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     config = load_config(args.config)
-    run_train(config)
+    with instrument("train", telemetry_path(config['output_dir'], "train"), unit="examples") as s:
+        run_train(config)
+        s.count = count_examples(config['train_dir']) * config['num_train_epochs']
@@ -1,6 +1,9 @@
 import yaml
 import json
+import hashlib
 import os
+import pickle
+import numpy as np
 
 def load_config(config_path):
     with open(config_path, 'r') as f:
@@ -10,14 +13,122 @@ def load_json(file_path):
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def save_jsonl(data, file_path):
+def iter_json(file_path, chunk_size=1 << 20):
+    """Yield records one at a time from a top-level JSON array or a JSONL file.
+
+    Only ``chunk_size`` characters (plus the record being decoded) are held in
+    memory, so peak usage does not grow with the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as f:
+        buf = f.read(chunk_size)
+        pos = _skip_ws(buf, 0)
+        while pos == len(buf):
+            buf = f.read(chunk_size)
+            if not buf:
+                return
+            pos = _skip_ws(buf, 0)
+
+        if buf[pos] != '[':
+            # JSONL: one record per line
+            rest = buf[pos:]
+            lines = rest.split('\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            for line in f:
+                line = pending + line
+                pending = ''
+                if line.strip():
+                    yield json.loads(line)
+            if pending.strip():
+                yield json.loads(pending)
+            return
+
+        # Top-level JSON array
+        pos += 1
+        eof = False
+        while True:
+            pos = _skip_ws(buf, pos, ',')
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            if pos < len(buf):
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                    # A scalar cut at the chunk boundary may still decode
+                    if end < len(buf) or eof:
+                        yield item
+                        pos = end
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                raise ValueError(f"Unterminated JSON array in {file_path}")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+def _skip_ws(buf, pos, extra=''):
+    while pos < len(buf) and (buf[pos].isspace() or buf[pos] in extra):
+        pos += 1
+    return pos
+
+def hash_files(paths, digest_size=16):
+    """Content hash over ``paths`` (in the given order), including their names."""
+    h = hashlib.blake2b(digest_size=digest_size)
+    for path in paths:
+        h.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+def open_output(file_path):
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w') as f:
+    return open(file_path, 'w')
+
+def write_jsonl(f, item):
+    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+def write_tsv(f, row):
+    f.write('\t'.join(map(str, row)) + '\n')
+
+def save_jsonl(data, file_path):
+    with open_output(file_path) as f:
         for item in data:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            write_jsonl(f, item)
 
 def save_tsv(data, file_path):
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w') as f:
+    with open_output(file_path) as f:
         for row in data:
-            f.write('\t'.join(map(str, row)) + '\n')
+            write_tsv(f, row)
+
+def load_reps(path):
+    """Load Tevatron pickle output (a file or a directory of shards) as (ids, reps)."""
+    # Handle directory or file
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.pkl')]
+    else:
+        files = [path]
+    
+    all_reps = []
+    all_ids = []
+    for f in sorted(files):
+        with open(f, 'rb') as reader:
+            data = pickle.load(reader)
+            # data is usually (reps, ids) in Tevatron
+            if isinstance(data[0], np.ndarray) and data[0].ndim > 1:
+                reps, ids = data[0], data[1]
+            elif isinstance(data[1], np.ndarray) and data[1].ndim > 1:
+                ids, reps = data[0], data[1]
+            else:
+                reps, ids = data[0], data[1]
+            
+            all_ids.extend(ids)
+            if isinstance(reps, list):
+                reps = np.array(reps)
+            all_reps.append(reps)
+    return all_ids, np.concatenate(all_reps, axis=0)
@@ -0,0 +1,17 @@
+import pytest
+import torch
+from transformers import BertConfig, BertModel, BertTokenizer
+from tests.helpers import WORDS
+
+@pytest.fixture(scope="session")
+def model_dir(tmp_path_factory):
+    # Tiny randomly initialised BERT, so nothing is downloaded
+    path = tmp_path_factory.mktemp("tiny_bert")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS
+    (path / "vocab.txt").write_text("\n".join(vocab) + "\n")
+    BertTokenizer(str(path / "vocab.txt")).save_pretrained(str(path))
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=16, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=32, max_position_embeddings=64)
+    BertModel(config).save_pretrained(str(path))
+    return str(path)
@@ -0,0 +1,8 @@
+import numpy as np
+
+# Vocabulary of the tiny test model (see the model_dir fixture in conftest.py)
+WORDS = "the a claim fact check vaccine climate tax vote false true said study report year city".split()
+
+def make_texts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, rng.integers(1, 40))) for _ in range(n)]
@@ -0,0 +1,75 @@
+import json
+import os
+from factcheck_relevance.build_global import OUTPUTS, build_global
+
+LABELS = {"RELEVANT": "positive", "NOT_RELEVANT": "negative"}
+
+def write_claims(path, claims):
+    with open(path, 'w') as f:
+        json.dump([{"claim": c, "evidence": [{"snippet": s, "relevance_label": l} for s, l in ev]} for c, ev in claims], f)
+    return str(path)
+
+def read_outputs(out_dir):
+    outputs = {}
+    for name in OUTPUTS:
+        with open(os.path.join(out_dir, name), 'r') as f:
+            outputs[name] = f.read()
+    return outputs
+
+def test_append_matches_full_rebuild(tmp_path):
+    jan = write_claims(tmp_path / "jan.json", [("claim a", [("s1", "RELEVANT"), ("s2", "NOT_RELEVANT")]),
+                                               ("claim b", [("s2", "RELEVANT"), ("s3", "NOT_RELEVANT")])])
+    feb = write_claims(tmp_path / "feb.json", [("claim c", [("s3", "RELEVANT"), ("s4", "NOT_RELEVANT")])])
+    mar = write_claims(tmp_path / "mar.json", [("claim d", [("s5", "RELEVANT"), ("s1", "NOT_RELEVANT")])])
+    full_dir, append_dir = str(tmp_path / "full"), str(tmp_path / "append")
+
+    build_global({"input_paths": [jan, feb, mar], "out_dir": full_dir, "label_mapping": LABELS})
+    build_global({"input_paths": [jan], "out_dir": append_dir, "label_mapping": LABELS, "append": True})
+    assert build_global({"input_paths": [jan, feb], "out_dir": append_dir, "label_mapping": LABELS, "append": True}) == 1
+    assert build_global({"input_paths": [jan, feb, mar], "out_dir": append_dir, "label_mapping": LABELS, "append": True}) == 1
+
+    expected = read_outputs(full_dir)
+    assert read_outputs(append_dir) == expected
+    # Only s4 and s5 were new after January, continuing the docid sequence
+    assert expected["corpus.jsonl"].splitlines()[-1] == json.dumps({"text_id": "g_doc_00000004", "text": "s5"})
+
+    # A changed ingested file can't be appended to: everything is rebuilt
+    write_claims(tmp_path / "jan.json", [("claim a", [("s9", "RELEVANT")])])
+    assert build_global({"input_paths": [jan, feb, mar], "out_dir": append_dir, "label_mapping": LABELS, "append": True}) == 3
+    assert read_outputs(append_dir)["corpus.jsonl"].splitlines()[0] == json.dumps({"text_id": "g_doc_00000000", "text": "s9"})
+
+def test_parallel_parse_matches_serial(tmp_path):
+    paths = [write_claims(tmp_path / f"m{m}.json", [(f"claim {m}-{c}", [(f"s{(m + c) % 7}", "RELEVANT"), (f"s{c}", "NOT_RELEVANT")])
+                                                     for c in range(5)]) for m in range(3)]
+    serial_dir, parallel_dir = str(tmp_path / "serial"), str(tmp_path / "parallel")
+
+    build_global({"input_paths": paths, "out_dir": serial_dir, "label_mapping": LABELS})
+    # Batches smaller than a file, so each file is spooled in several pieces
+    build_global({"input_paths": paths, "out_dir": parallel_dir, "label_mapping": LABELS, "num_workers": 2,
+                  "parse_batch_size": 2, "tmp_dir": str(tmp_path)})
+
+    assert read_outputs(parallel_dir) == read_outputs(serial_dir)
+    # The spool directory is cleaned up
+    assert sorted(os.listdir(tmp_path)) == ["m0.json", "m1.json", "m2.json", "parallel", "serial"]
+
+def test_interrupted_append_rolls_back(tmp_path):
+    jan = write_claims(tmp_path / "jan.json", [("claim a", [("s1", "RELEVANT"), ("s2", "NOT_RELEVANT")])])
+    feb = str(tmp_path / "feb.json")
+    full_dir, append_dir = str(tmp_path / "full"), str(tmp_path / "append")
+    build_global({"input_paths": [jan], "out_dir": append_dir, "label_mapping": LABELS, "append": True})
+
+    # The first claim of feb is written out before the malformed second one stops the build
+    with open(feb, 'w') as f:
+        json.dump([{"claim": "claim b", "evidence": [{"snippet": "s3", "relevance_label": "RELEVANT"}]}, {"evidence": []}], f)
+    try:
+        build_global({"input_paths": [jan, feb], "out_dir": append_dir, "label_mapping": LABELS, "append": True})
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("malformed claim was accepted")
+
+    write_claims(feb, [("claim b", [("s3", "RELEVANT")]), ("claim c", [("s1", "NOT_RELEVANT")])])
+    # Only feb is parsed again: the partial output is truncated rather than the history rebuilt
+    assert build_global({"input_paths": [jan, feb], "out_dir": append_dir, "label_mapping": LABELS, "append": True}) == 2
+    build_global({"input_paths": [jan, feb], "out_dir": full_dir, "label_mapping": LABELS})
+    assert read_outputs(append_dir) == read_outputs(full_dir)
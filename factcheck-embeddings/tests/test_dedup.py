@@ -0,0 +1,69 @@
+import json
+import os
+from factcheck_relevance.build_data import build_data
+from factcheck_relevance.dedup import Canonicalizer
+
+LABELS = {"RELEVANT": "positive", "NOT_RELEVANT": "negative", "ERROR": "drop"}
+SHARED = "the city council voted to raise the sales tax by two percent starting next year according to officials"
+VARIANT = SHARED + " read more"
+
+def read_jsonl(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f]
+
+def build(tmp_path, claims, mode, dev_ratio=1.0):
+    input_path = tmp_path / "raw.json"
+    input_path.write_text(json.dumps(claims))
+    out_dir = str(tmp_path / mode)
+    # dev_ratio 1.0 puts every claim in the dev split, so all docids show up in qrels and candidates
+    build_data({"input_path": str(input_path), "out_dir": out_dir, "dev_ratio": dev_ratio, "label_mapping": LABELS,
+                "corpus_dedup": mode, "shingle_size": 2, "neg_policy": "hardest", "k_neg": 1})
+    return out_dir
+
+def evidence(snippet, label="NOT_RELEVANT"):
+    return {"snippet": snippet, "relevance_label": label, "cosine_similarity": 0.5}
+
+def test_near_duplicates_share_a_bucket():
+    canon = Canonicalizer(near_dup=True, shingle_size=2)
+    assert canon.assign("d0", SHARED) == ("d0", SHARED, True)
+    assert canon.assign("d1", VARIANT) == ("d0", SHARED, False)
+    assert canon.assign("d2", "an unrelated snippet about vaccine trials") == ("d2", "an unrelated snippet about vaccine trials", True)
+    assert canon.stats()["near_duplicates"] == 1
+
+def test_exact_only_keeps_variants(tmp_path):
+    claims = [{"claim": "claim one", "evidence": [evidence(SHARED, "RELEVANT"), evidence("other one")]},
+              {"claim": "claim two", "evidence": [evidence(SHARED), evidence(VARIANT, "RELEVANT")]}]
+    out_dir = build(tmp_path, claims, "exact")
+    corpus = read_jsonl(os.path.join(out_dir, "corpus.jsonl"))
+    assert [d["text"] for d in corpus] == [SHARED, "other one", VARIANT]
+
+    candidates = read_jsonl(os.path.join(out_dir, "dev_candidates.jsonl"))
+    assert candidates[1]["candidates"] == [corpus[2]["text_id"], corpus[0]["text_id"]]
+
+def test_canonical_docids_in_qrels_and_candidates(tmp_path):
+    claims = [{"claim": "claim one", "evidence": [evidence(SHARED, "RELEVANT"), evidence("other one")]},
+              # The variant collapses into the positive of claim one; within a claim the first label wins
+              {"claim": "claim two", "evidence": [evidence(VARIANT, "RELEVANT"), evidence(SHARED), evidence("other two")]}]
+    none_dir = build(tmp_path, claims, "none")
+    near_dir = build(tmp_path, claims, "near")
+    assert len(read_jsonl(os.path.join(none_dir, "corpus.jsonl"))) == 5
+
+    corpus = read_jsonl(os.path.join(near_dir, "corpus.jsonl"))
+    assert [d["text"] for d in corpus] == [SHARED, "other one", "other two"]
+    shared_id = corpus[0]["text_id"]
+    with open(os.path.join(near_dir, "dev_qrels.tsv"), 'r') as f:
+        qrels = [line.split("\t") for line in f]
+    assert [(q[0], q[2]) for q in qrels] == [("dev_c000000", shared_id), ("dev_c000001", shared_id)]
+    candidates = read_jsonl(os.path.join(near_dir, "dev_candidates.jsonl"))
+    assert candidates[1]["candidates"] == [shared_id, corpus[2]["text_id"]]
+
+    with open(os.path.join(near_dir, "dedup_stats.json"), 'r') as f:
+        stats = json.load(f)
+    assert (stats["occurrences"], stats["canonical"], stats["exact_duplicates"], stats["near_duplicates"]) == (5, 3, 1, 1)
+
+def test_train_negatives_use_canonical_text(tmp_path):
+    claims = [{"claim": "claim one", "evidence": [evidence(SHARED, "RELEVANT"), evidence("other one")]},
+              {"claim": "claim two", "evidence": [evidence("fact two", "RELEVANT"), evidence(VARIANT)]}]
+    out_dir = build(tmp_path, claims, "near", dev_ratio=0.0)
+    train = read_jsonl(os.path.join(out_dir, "train", "train.jsonl"))
+    assert train[1] == {"query": "claim two", "positives": ["fact two"], "negatives": [SHARED]}
@@ -0,0 +1,110 @@
+import json
+import os
+import pickle
+import numpy as np
+from factcheck_relevance.embedding_cache import cached_encode
+from factcheck_relevance.embedding_store import open_embeddings
+
+class FakeEncoder:
+    """Deterministic stand-in for Tevatron: one vector per text, recording what it was asked to encode."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, in_path, out_path):
+        with open(in_path) as f:
+            items = [json.loads(l) for l in f]
+        self.calls.append([i['text'] for i in items])
+        reps = np.array([[len(i['text']), sum(map(ord, i['text']))] for i in items], dtype=np.float32)
+        with open(out_path, 'wb') as f:
+            pickle.dump((reps, [i['text_id'] for i in items]), f)
+
+def write_corpus(path, texts):
+    with open(path, 'w') as f:
+        for i, t in enumerate(texts):
+            f.write(json.dumps({"text_id": f"d{i}", "text": t}) + '\n')
+
+def load_output(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def test_only_new_texts_are_encoded(tmp_path):
+    config = {"model_name_or_path": "some/hub-model", "embedding_cache_dir": str(tmp_path / "cache")}
+    corpus = tmp_path / "corpus.jsonl"
+    out = tmp_path / "corpus.pkl"
+    encoder = FakeEncoder()
+    
+    write_corpus(corpus, ["a", "bb", "a"])
+    cached_encode(config, str(corpus), str(out), False, encoder)
+    assert encoder.calls == [["a", "bb"]]
+    
+    write_corpus(corpus, ["ccc", "a", "bb"])
+    cached_encode(config, str(corpus), str(out), False, encoder)
+    assert encoder.calls[-1] == ["ccc"]
+    
+    reps, ids = load_output(out)
+    assert ids == ["d0", "d1", "d2"]
+    assert reps[:, 0].tolist() == [3, 1, 2]
+    
+    # Nothing new: no encode call at all
+    cached_encode(config, str(corpus), str(out), False, encoder)
+    assert len(encoder.calls) == 2
+
+def test_prefix_and_role_are_part_of_the_key(tmp_path):
+    config = {"model_name_or_path": "some/hub-model", "embedding_cache_dir": str(tmp_path / "cache")}
+    corpus = tmp_path / "corpus.jsonl"
+    encoder = FakeEncoder()
+    write_corpus(corpus, ["a"])
+    
+    cached_encode(config, str(corpus), str(tmp_path / "p.pkl"), False, encoder)
+    cached_encode(config, str(corpus), str(tmp_path / "q.pkl"), True, encoder)
+    cached_encode(config, str(corpus), str(tmp_path / "x.pkl"), False, encoder, prefix="x: ")
+    assert encoder.calls == [["a"], ["a"], ["x: a"]]
+
+def test_store_grows_in_place_when_input_is_appended(tmp_path):
+    config = {"model_name_or_path": "some/hub-model", "embedding_cache_dir": str(tmp_path / "cache")}
+    corpus = tmp_path / "corpus.jsonl"
+    out = str(tmp_path / "corpus.emb")
+    encoder = FakeEncoder()
+    
+    write_corpus(corpus, ["a", "bb"])
+    assert cached_encode(config, str(corpus), out, False, encoder) == 2
+    embeddings_inode = os.stat(os.path.join(out, "embeddings.npy")).st_ino
+    
+    write_corpus(corpus, ["a", "bb", "ccc", "dddd"])
+    assert cached_encode(config, str(corpus), out, False, encoder) == 2
+    assert encoder.calls == [["a", "bb"], ["ccc", "dddd"]]
+    # Appended to the existing files rather than rewritten
+    assert os.stat(os.path.join(out, "embeddings.npy")).st_ino == embeddings_inode
+    ids, reps, meta = open_embeddings(out)
+    assert ids.tolist() == ["d0", "d1", "d2", "d3"]
+    assert reps[:, 0].tolist() == [1, 2, 3, 4]
+    assert meta["count"] == 4
+    assert np.load(os.path.join(out, "embeddings.npy")).shape == (4, 2)
+    
+    # Earlier rows changed: the store is rewritten
+    write_corpus(corpus, ["e", "bb", "ccc"])
+    assert cached_encode(config, str(corpus), out, False, encoder) == 3
+    ids, reps, _ = open_embeddings(out)
+    assert ids.tolist() == ["d0", "d1", "d2"]
+    assert reps[:, 0].tolist() == [1, 2, 3]
+
+def test_backend_and_quantization_are_part_of_the_key(tmp_path):
+    corpus = tmp_path / "corpus.jsonl"
+    write_corpus(corpus, ["a"])
+    for name, quantized in (("onnx", False), ("onnx-int8", True)):
+        os.makedirs(tmp_path / name)
+        with open(tmp_path / name / "onnx_config.json", 'w') as f:
+            json.dump({"quantized": quantized}, f)
+    base = {"model_name_or_path": "some/hub-model", "embedding_cache_dir": str(tmp_path / "cache")}
+    encoder = FakeEncoder()
+
+    configs = [base, dict(base, encoder_backend="tevatron"), dict(base, encode_workers=2),
+               dict(base, encoder_backend="onnx", onnx_path=str(tmp_path / "onnx")),
+               dict(base, encoder_backend="onnx", onnx_path=str(tmp_path / "onnx-int8"))]
+    for i, config in enumerate(configs):
+        cached_encode(config, str(corpus), str(tmp_path / f"out{i}.pkl"), False, encoder)
+    assert len(encoder.calls) == len(configs)
+    # Same backend again: served from the cache
+    cached_encode(configs[-1], str(corpus), str(tmp_path / "again.pkl"), False, encoder)
+    assert len(encoder.calls) == len(configs)
@@ -0,0 +1,38 @@
+import pickle
+import numpy as np
+import pytest
+from factcheck_relevance.embedding_store import convert, load_embeddings, open_embeddings, save_embeddings
+
+def unit_vectors(n, dim, seed=0):
+    reps = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return reps / np.linalg.norm(reps, axis=1, keepdims=True)
+
+def test_store_round_trip_is_memory_mapped(tmp_path):
+    reps = unit_vectors(10, 8)
+    ids = [f"g_doc_{i:08d}" for i in range(10)]
+    path = str(tmp_path / "corpus.emb")
+    save_embeddings(path, ids, reps, model="m")
+    
+    loaded_ids, loaded_reps, meta = open_embeddings(path)
+    assert isinstance(loaded_reps, np.memmap)
+    assert list(loaded_ids) == ids
+    assert np.array_equal(loaded_reps, reps)
+    assert meta["dim"] == 8 and meta["count"] == 10 and meta["normalized"]
+
+@pytest.mark.parametrize("reps_first", [True, False])
+def test_convert_from_pickle(tmp_path, reps_first):
+    reps = unit_vectors(5, 4)
+    ids = [f"d{i}" for i in range(5)]
+    pkl = tmp_path / "corpus.pkl"
+    with open(pkl, 'wb') as f:
+        pickle.dump((reps, ids) if reps_first else (ids, reps), f)
+    
+    convert(str(pkl), str(tmp_path / "corpus.emb"), dtype="float16")
+    loaded_ids, loaded_reps = load_embeddings(str(tmp_path / "corpus.emb"))
+    assert list(loaded_ids) == ids
+    assert loaded_reps.dtype == np.float16
+    assert np.allclose(loaded_reps, reps, atol=1e-3)
+
+def test_shape_mismatch(tmp_path):
+    with pytest.raises(ValueError):
+        save_embeddings(str(tmp_path / "x.emb"), ["a"], unit_vectors(2, 4))
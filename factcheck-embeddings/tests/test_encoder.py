@@ -0,0 +1,48 @@
+import json
+import pickle
+import numpy as np
+import torch
+from factcheck_relevance.encoder import Encoder
+from tests.helpers import make_texts
+
+
+def reference_reps(encoder, texts, max_len):
+    # Tevatron's path: one fixed-length batch padded to max_len
+    features = encoder.tokenize(texts)
+    inputs = encoder.tokenizer.pad(features, padding='max_length', max_length=max_len, return_tensors='pt')
+    with torch.no_grad():
+        return encoder.model.encode_passage(dict(inputs))[1].numpy()
+
+def test_dynamic_batches_match_fixed_padding(model_dir):
+    texts = make_texts(50)
+    encoder = Encoder(model_dir, p_max_len=24, batch_size=8, sort_buffer=20)
+    reps = encoder.encode(texts)
+    assert reps.shape == (50, 16)
+    np.testing.assert_allclose(reps, reference_reps(encoder, texts, 24), atol=1e-5)
+
+def test_batches_respect_limits(model_dir):
+    encoder = Encoder(model_dir, batch_size=4, max_batch_tokens=40)
+    lengths = [3, 12, 5, 12, 7, 2, 9, 1, 4]
+    batches = list(encoder.batches(lengths))
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+    for b in batches:
+        assert len(b) <= 4
+        assert len(b) == 1 or len(b) * max(lengths[i] for i in b) <= 40
+        # Each batch holds consecutive lengths from the descending order
+        assert [lengths[i] for i in b] == sorted((lengths[i] for i in b), reverse=True)
+
+def test_encode_file_keeps_ids_in_order(model_dir, tmp_path):
+    texts = make_texts(7, seed=1)
+    in_path = tmp_path / "corpus.jsonl"
+    with open(in_path, 'w') as f:
+        for i, t in enumerate(texts):
+            f.write(json.dumps({"text_id": f"d{i}", "text": t}) + '\n')
+
+    encoder = Encoder(model_dir, q_max_len=8, batch_size=3)
+    encoder.encode_file(str(in_path), str(tmp_path / "query.pkl"), is_query=True)
+    with open(tmp_path / "query.pkl", 'rb') as f:
+        reps, ids = pickle.load(f)
+    assert ids == [f"d{i}" for i in range(7)]
+    for i in (0, 4, 6):
+        np.testing.assert_allclose(reps[i], encoder.encode([texts[i]], is_query=True)[0], atol=1e-5)
+    assert encoder.encode([], is_query=True).shape == (0, 16)
@@ -0,0 +1,45 @@
+import math
+import pytest
+from factcheck_relevance.eval import Qrels, compute_metrics, evaluate_runs
+
+@pytest.fixture
+def qrels_path(tmp_path):
+    path = tmp_path / "qrels.tsv"
+    path.write_text(
+        "q1\t0\td1\t1\n"
+        "q1\t0\td2\t1\n"
+        "q2\t0\td3\t1\n"
+        "q2\t0\td9\t0\n"  # not relevant
+        "q3\t0\td4\t1\n"  # never retrieved
+    )
+    return str(path)
+
+def write_run(path, rows):
+    path.write_text(''.join(f"{q}\t{d}\t{r}\t0.5\n" for q, d, r in rows))
+    return str(path)
+
+def test_compute_metrics_values(tmp_path, qrels_path):
+    run_path = write_run(tmp_path / "a.run", [
+        ("q1", "d5", 1), ("q1", "d1", 2), ("q1", "d1", 3),  # duplicate counts once for recall
+        ("q2", "d3", 1), ("q2", "d9", 2),
+        ("qX", "d1", 1),  # not in qrels, ignored
+    ])
+    m = compute_metrics(qrels_path, run_path)
+    
+    assert list(m) == ["MRR@10", "nDCG@10", "Recall@5", "Recall@10", "Recall@20", "Recall@50"]
+    assert m["Recall@5"] == pytest.approx((0.5 + 1.0 + 0.0) / 3)
+    assert m["MRR@10"] == pytest.approx((0.5 + 1.0 + 0.0) / 3)
+    q1_ndcg = (1 / math.log2(3) + 1 / math.log2(4)) / (1 + 1 / math.log2(3))
+    assert m["nDCG@10"] == pytest.approx((q1_ndcg + 1.0 + 0.0) / 3)
+
+def test_many_runs_custom_metrics(tmp_path, qrels_path):
+    a = write_run(tmp_path / "a.run", [("q1", "d1", 1), ("q2", "d0", 1), ("q2", "d3", 2)])
+    b = write_run(tmp_path / "b.run", [])
+    results = evaluate_runs(Qrels(qrels_path), [a, b], ["Recall@1", "MRR@2", "P@2"])
+    
+    assert results[a] == pytest.approx({"Recall@1": 0.5 / 3, "MRR@2": 1.5 / 3, "P@2": 1.0 / 3})
+    assert results[b] == {"Recall@1": 0.0, "MRR@2": 0.0, "P@2": 0.0}
+
+def test_unknown_metric(qrels_path, tmp_path):
+    with pytest.raises(ValueError):
+        evaluate_runs(Qrels(qrels_path), [write_run(tmp_path / "a.run", [])], ["MAP@10"])
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+import torch
+from transformers import AutoTokenizer, BertModel
+from tevatron.arguments import DataArguments, DenseTrainingArguments
+from tevatron.modeling import DenseModel
+from factcheck_relevance.train import GradCacheTrainer, Trainer, grad_cache_step, split_inputs
+from tests.helpers import make_texts
+
+def build_model(model_dir, batch_size, dropout):
+    encoder = BertModel.from_pretrained(model_dir, hidden_dropout_prob=dropout, attention_probs_dropout_prob=dropout)
+    model = DenseModel(encoder, encoder, data_args=DataArguments(train_n_passages=3),
+                       train_args=SimpleNamespace(negatives_x_device=False, per_device_train_batch_size=batch_size))
+    model.train()
+    return model
+
+def make_batch(model_dir, batch_size):
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    queries = tokenizer(make_texts(batch_size, seed=2), padding=True, truncation=True, max_length=16, return_tensors='pt')
+    passages = tokenizer(make_texts(batch_size * 3, seed=3), padding=True, truncation=True, max_length=32, return_tensors='pt')
+    return dict(queries), dict(passages)
+
+def gradients(model):
+    grads = {name: p.grad.clone() for name, p in model.named_parameters() if p.grad is not None}
+    model.zero_grad()
+    return grads
+
+def plain_gradients(model, queries, passages, seed=0):
+    torch.manual_seed(seed)
+    loss = model(query=queries, passage=passages).loss
+    loss.backward()
+    return loss.detach(), gradients(model)
+
+def assert_same(loss, grads, expected_loss, expected_grads):
+    torch.testing.assert_close(loss, expected_loss, atol=1e-6, rtol=1e-5)
+    assert grads.keys() == expected_grads.keys()
+    for name in grads:
+        torch.testing.assert_close(grads[name], expected_grads[name], atol=1e-6, rtol=1e-4)
+
+def test_chunked_gradients_match_full_batch(model_dir):
+    model = build_model(model_dir, 8, dropout=0.0)
+    queries, passages = make_batch(model_dir, 8)
+    expected_loss, expected_grads = plain_gradients(model, queries, passages)
+
+    loss = grad_cache_step(model, queries, passages, q_chunk_size=3, p_chunk_size=5)
+    assert_same(loss, gradients(model), expected_loss, expected_grads)
+
+def test_dropout_masks_are_replayed(model_dir):
+    # One chunk per role draws the same dropout masks as the full-batch forward
+    model = build_model(model_dir, 4, dropout=0.2)
+    queries, passages = make_batch(model_dir, 4)
+    expected_loss, expected_grads = plain_gradients(model, queries, passages, seed=7)
+
+    torch.manual_seed(7)
+    loss = grad_cache_step(model, queries, passages, q_chunk_size=4, p_chunk_size=12)
+    assert_same(loss, gradients(model), expected_loss, expected_grads)
+
+def accumulated_update(trainer_cls, model_dir, output_dir, micro_batches, **kwargs):
+    model = build_model(model_dir, 4, dropout=0.0)
+    args = DenseTrainingArguments(output_dir=output_dir, gradient_accumulation_steps=2, per_device_train_batch_size=4,
+                                  use_cpu=True, report_to=[])
+    trainer = trainer_cls(model=model, args=args, **kwargs)
+    optimizer = torch.optim.SGD(model.parameters(), lr=1.0)
+    losses = [trainer.training_step(model, batch) for batch in micro_batches]
+    grads = {name: p.grad.clone() for name, p in model.named_parameters() if p.grad is not None}
+    optimizer.step()
+    return sum(losses), grads, {name: p.detach().clone() for name, p in model.named_parameters()}
+
+def test_accumulation_scales_both_training_paths(model_dir, tmp_path):
+    queries, passages = make_batch(model_dir, 8)
+    micro_batches = [(split_inputs(queries, 4)[i], split_inputs(passages, 12)[i]) for i in range(2)]
+    plain_loss, plain_grads, plain_params = accumulated_update(Trainer, model_dir, str(tmp_path / "plain"), micro_batches)
+    cached_loss, cached_grads, cached_params = accumulated_update(
+        GradCacheTrainer, model_dir, str(tmp_path / "cached"), micro_batches, q_chunk_size=3, p_chunk_size=5)
+    assert_same(cached_loss, cached_grads, plain_loss, plain_grads)
+    for name in plain_params:
+        torch.testing.assert_close(cached_params[name], plain_params[name], atol=1e-6, rtol=1e-5)
+
+    # The accumulated gradient is the mean of the micro-batch gradients, not their sum
+    model = build_model(model_dir, 4, dropout=0.0)
+    expected = [plain_gradients(model, q, p) for q, p in micro_batches]
+    expected_loss = sum(loss for loss, _ in expected) / 2
+    expected_grads = {name: sum(grads[name] for _, grads in expected) / 2 for name in expected[0][1]}
+    assert_same(plain_loss, plain_grads, expected_loss, expected_grads)
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+import pytest
+from factcheck_relevance.embedding_store import append_embeddings, load_embeddings, save_embeddings
+from factcheck_relevance.index import build_index, index_fingerprint, load_or_build_index, rescore, search
+
+def unit_vectors(n, dim, seed=0):
+    reps = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return reps / np.linalg.norm(reps, axis=1, keepdims=True)
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "hnsw"])
+def test_approximate_indexes_find_exact_neighbours(index_type):
+    reps = unit_vectors(2000, 16)
+    config = {"index_type": index_type, "nlist": 16, "nprobe": 16, "ef_search": 256}
+    _, approx = build_index(reps, config).search(reps[:20], 1)
+    assert approx[:, 0].tolist() == list(range(20))
+
+def test_small_corpus_clamps_ivf_pq_training():
+    # Fewer vectors than the 2**8 PQ centroids and the default 1024 lists
+    reps = unit_vectors(200, 16)
+    index = build_index(reps, {"index_type": "ivf_pq", "pq_m": 4, "nprobe": 200})
+    assert index.nlist == 200 and index.pq.nbits == 7
+    _, found = index.search(reps[:5], 10)
+    assert (found >= 0).all()
+
+def test_saved_index_is_reused_and_invalidated(tmp_path):
+    corpus_path = str(tmp_path / "corpus.emb")
+    reps = unit_vectors(100, 8)
+    save_embeddings(corpus_path, [f"d{i}" for i in range(100)], reps)
+    config = {"index_type": "flat"}
+    index_path = corpus_path + ".flat.faiss"
+    
+    load_or_build_index(reps, corpus_path, config)
+    first_mtime = os.path.getmtime(index_path)
+    
+    # Same corpus and config: loaded, not rewritten
+    index = load_or_build_index(reps, corpus_path, config)
+    assert os.path.getmtime(index_path) == first_mtime
+    assert index.ntotal == 100
+    
+    # Changed corpus embeddings: rebuilt
+    reps = unit_vectors(50, 8, seed=1)
+    save_embeddings(corpus_path, [f"d{i}" for i in range(50)], reps)
+    index = load_or_build_index(reps, corpus_path, config)
+    assert index.ntotal == 50
+
+def test_saved_index_grows_with_appended_rows(tmp_path):
+    corpus_path = str(tmp_path / "corpus.emb")
+    reps = unit_vectors(150, 8)
+    keys = np.zeros((150, 16), dtype=np.uint8)
+    save_embeddings(corpus_path, [f"d{i}" for i in range(100)], reps[:100], keys=keys[:100])
+    config = {"index_type": "hnsw"}
+    load_or_build_index(reps[:100], corpus_path, config)
+    
+    append_embeddings(corpus_path, [f"d{i}" for i in range(100, 150)], reps[100:], keys[100:])
+    index = load_or_build_index(reps, corpus_path, config)
+    assert index.ntotal == 150
+    assert index_fingerprint(corpus_path, config)["count"] == 150
+    _, found = index.search(reps[100:110], 1)
+    assert found[:, 0].tolist() == list(range(100, 110))
+    
+    # Saved with its new fingerprint: loaded as is next time
+    assert load_or_build_index(reps, corpus_path, config).ntotal == 150
+
+@pytest.mark.parametrize("extra", [{"index_type": "sq8"}, {"index_type": "sq_fp16"},
+                                   {"index_type": "sq8", "reduce_dim": 8},
+                                   {"index_type": "hnsw", "reduce_dim": 8, "reduce_method": "truncate"}])
+def test_rescoring_restores_exact_scores(tmp_path, extra):
+    reps = unit_vectors(500, 16)
+    queries = unit_vectors(20, 16, seed=1)
+    exact_scores, exact = build_index(reps, {"index_type": "flat"}).search(queries, 5)
+    
+    config = dict(extra, rescore_k=250)
+    corpus_path = str(tmp_path / "corpus.emb")
+    save_embeddings(corpus_path, [f"d{i}" for i in range(500)], reps, dtype="float16")
+    _, stored = load_embeddings(corpus_path)
+    scores, indices = search(load_or_build_index(stored, corpus_path, config), queries, stored, 5, config)
+    # Rescored against the float16 store: the same neighbours, scores within float16 precision
+    assert (indices == exact).mean() > 0.95
+    np.testing.assert_allclose(scores[indices == exact], exact_scores[indices == exact], atol=2e-3)
+    
+    # The saved compressed index is reused
+    scores_again, indices_again = search(load_or_build_index(stored, corpus_path, config), queries, stored, 5, config)
+    assert (indices_again == indices).all()
+
+def test_rescore_pads_missing_candidates():
+    reps = unit_vectors(10, 4)
+    candidates = np.array([[3, 1, -1, -1], [-1, -1, -1, -1]])
+    scores, indices = rescore(reps[:2], reps, candidates, 3)
+    assert indices.tolist()[1] == [-1, -1, -1]
+    assert sorted(indices[0, :2].tolist()) == [1, 3] and indices[0, 2] == -1
+    assert scores[0, 0] >= scores[0, 1]
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from factcheck_relevance.embedding_cache import encoder_fingerprint
+from factcheck_relevance.encoder import Encoder
+from tests.helpers import make_texts
+
+pytest.importorskip("onnxruntime")
+from factcheck_relevance.onnx_encoder import OnnxEncoder, export_onnx
+
+def test_onnx_export_matches_torch(model_dir, tmp_path):
+    onnx_path = str(tmp_path / "onnx")
+    meta = export_onnx(model_dir, onnx_path)
+    assert meta["query"] == meta["passage"] == "passage.onnx"
+
+    texts = make_texts(30, seed=4)
+    expected = Encoder(model_dir, p_max_len=24, batch_size=8).encode(texts)
+    reps = OnnxEncoder(onnx_path, p_max_len=24, batch_size=8).encode(texts)
+    np.testing.assert_allclose(reps, expected, atol=1e-4)
+
+def test_quantized_export_stays_close(model_dir, tmp_path):
+    onnx_path = str(tmp_path / "onnx-int8")
+    assert export_onnx(model_dir, onnx_path, quantize=True)["quantized"]
+
+    texts = make_texts(30, seed=5)
+    expected = Encoder(model_dir).encode(texts, is_query=True)
+    reps = OnnxEncoder(onnx_path).encode(texts, is_query=True)
+    cos = np.einsum('ij,ij->i', reps, expected) / (np.linalg.norm(reps, axis=1) * np.linalg.norm(expected, axis=1))
+    assert cos.min() > 0.99
+
+    # Cached embeddings from the quantized graph live in their own namespace
+    config = {"model_name_or_path": model_dir, "onnx_path": onnx_path}
+    assert encoder_fingerprint(dict(config, encoder_backend='onnx')) != encoder_fingerprint(config)
@@ -0,0 +1,51 @@
+import sys
+import time
+from factcheck_relevance.pipeline import Stage, dependencies, pipeline_stages, run_pipeline
+
+def copy_stage(name, src, dst, config=None, sleep=0.0):
+    # Appends the source file to the destination, so every run is visible in the output
+    code = f"import time; time.sleep({sleep}); open({dst!r}, 'a').write(open({src!r}).read())"
+    return Stage(name, [sys.executable, '-c', code], config, inputs=[src], outputs=[dst])
+
+def make_stages(tmp_path, topk=10):
+    p = lambda name: str(tmp_path / name)
+    return [
+        copy_stage("encode_corpus", p("corpus.txt"), p("corpus.emb"), sleep=0.5),
+        copy_stage("encode_query", p("query.txt"), p("query.emb"), sleep=0.5),
+        Stage("retrieve", [sys.executable, '-c', f"open({p('run')!r}, 'a').write('run\\n')"], {"topk": topk},
+              inputs=[p("corpus.emb"), p("query.emb")], outputs=[p("run")]),
+        copy_stage("eval", p("run"), p("metrics")),
+    ]
+
+def test_stages_rerun_only_when_inputs_change(tmp_path):
+    (tmp_path / "corpus.txt").write_text("c\n")
+    (tmp_path / "query.txt").write_text("q\n")
+    state = str(tmp_path / "state" / "state.json")
+
+    start = time.perf_counter()
+    assert run_pipeline(make_stages(tmp_path), state, jobs=2) != []
+    # The two encodes are independent and sleep concurrently
+    assert time.perf_counter() - start < 2 * 0.5 + 0.4
+    assert (tmp_path / "metrics").read_text() == "run\n"
+
+    assert run_pipeline(make_stages(tmp_path), state) == []
+
+    # A retrieve-only config change reruns retrieve and eval, not the encodes
+    assert sorted(run_pipeline(make_stages(tmp_path, topk=50), state)) == ["eval", "retrieve"]
+
+    # New queries rerun their encode and everything downstream
+    (tmp_path / "query.txt").write_text("q2\n")
+    assert run_pipeline(make_stages(tmp_path, topk=50), state) == ["encode_query", "retrieve", "eval"]
+
+    # A missing output reruns its stage even if the fingerprint matches
+    (tmp_path / "metrics").unlink()
+    assert run_pipeline(make_stages(tmp_path, topk=50), state) == ["eval"]
+
+def test_named_pipelines_wire_dependencies():
+    stages = pipeline_stages(["cpu", "test"])
+    deps = dependencies(stages)
+    assert deps["cpu:train"] == {"cpu:build_data"}
+    assert deps["cpu:encode_corpus"] == {"cpu:build_data", "cpu:train"}
+    assert deps["test:encode_query"] == {"test:build_data", "cpu:train"}
+    assert deps["cpu:retrieve"] == {"cpu:encode_corpus", "cpu:encode_query"}
+    assert deps["test:eval"] == {"test:retrieve", "test:build_data"}
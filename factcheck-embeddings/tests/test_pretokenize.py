@@ -0,0 +1,94 @@
+import json
+import os
+import random
+from types import SimpleNamespace
+import datasets
+from transformers import AutoTokenizer
+from tevatron.arguments import DataArguments
+from tevatron.data import TrainDataset
+from factcheck_relevance.pretokenize import PretokenizedTrainDataset, TrainCollator, pretokenize
+from tests.helpers import make_texts
+
+def write_train(train_dir, n=30):
+    texts = make_texts(200, seed=1)
+    rng = random.Random(0)
+    instances = []
+    for i in range(n):
+        # Claims repeat across instances and snippets across claims, as in build_data's output
+        instances.append({
+            "query": texts[i % 10],
+            "positives": rng.sample(texts[10:60], rng.randint(1, 3)),
+            "negatives": rng.sample(texts[60:], rng.randint(1, 6)),
+        })
+    os.makedirs(train_dir)
+    with open(os.path.join(train_dir, "train.jsonl"), 'w') as f:
+        for instance in instances:
+            f.write(json.dumps(instance) + "\n")
+    return instances
+
+def test_matches_tevatron_train_dataset(tmp_path, model_dir):
+    train_dir = str(tmp_path / "train")
+    instances = write_train(train_dir)
+    config = {"train_dir": train_dir, "model_name_or_path": model_dir, "q_max_len": 8, "p_max_len": 16,
+              "tokenized_dir": str(tmp_path / "tokenized")}
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    data_args = DataArguments(train_n_passages=4, q_max_len=8, p_max_len=16)
+
+    trainer = SimpleNamespace(state=SimpleNamespace(epoch=0), args=SimpleNamespace(seed=42))
+    reference = TrainDataset(data_args, datasets.Dataset.from_list(instances), tokenizer, trainer)
+    dataset = PretokenizedTrainDataset(pretokenize(config, tokenizer), data_args, trainer)
+
+    assert len(dataset) == len(reference)
+    for epoch in range(3):
+        trainer.state.epoch = epoch
+        for i in range(len(dataset)):
+            # Groups short of negatives are filled with random.choices from the global RNG
+            random.seed(i)
+            expected_query, expected_passages = reference[i]
+            random.seed(i)
+            query, passages = dataset[i]
+            assert query["input_ids"] == expected_query["input_ids"]
+            assert [p["input_ids"] for p in passages] == [p["input_ids"] for p in expected_passages]
+
+def test_reused_until_inputs_change(tmp_path, model_dir):
+    train_dir = str(tmp_path / "train")
+    write_train(train_dir)
+    config = {"train_dir": train_dir, "model_name_or_path": model_dir, "q_max_len": 8, "p_max_len": 16,
+              "tokenized_dir": str(tmp_path / "tokenized")}
+
+    path = pretokenize(config)
+    mtime = os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+    assert pretokenize(config) == path
+    assert os.stat(os.path.join(path, "meta.json")).st_mtime_ns == mtime
+
+    assert pretokenize(dict(config, p_max_len=32)) != path
+    with open(os.path.join(train_dir, "train.jsonl"), 'a') as f:
+        f.write(json.dumps({"query": "new claim", "positives": ["fact"], "negatives": ["tax"]}) + "\n")
+    assert pretokenize(config) != path
+
+def test_dynamic_padding_and_lengths(tmp_path, model_dir):
+    train_dir = str(tmp_path / "train")
+    instances = write_train(train_dir)
+    config = {"train_dir": train_dir, "model_name_or_path": model_dir, "q_max_len": 48, "p_max_len": 48,
+              "tokenized_dir": str(tmp_path / "tokenized")}
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    data_args = DataArguments(train_n_passages=2, q_max_len=48, p_max_len=48)
+    trainer = SimpleNamespace(state=SimpleNamespace(epoch=0), args=SimpleNamespace(seed=42))
+    dataset = PretokenizedTrainDataset(pretokenize(config, tokenizer), data_args, trainer)
+
+    # Longest passage each instance can contribute
+    expected = [max(len(tokenizer(t, truncation=True, max_length=48)["input_ids"]) for t in i["positives"] + i["negatives"])
+                for i in instances]
+    assert dataset.lengths == expected
+
+    features = [dataset[i] for i in range(4)]
+    fixed = TrainCollator(tokenizer, max_q_len=48, max_p_len=48)
+    dynamic = TrainCollator(tokenizer, max_q_len=48, max_p_len=48, dynamic_padding=True)
+    (fq, fd), (dq, dd) = fixed(features), dynamic(features)
+
+    assert fd["input_ids"].shape == (8, 48)
+    assert dd["input_ids"].shape == (8, max(len(p["input_ids"]) for f in features for p in f[1]))
+    # Same real tokens either way; dynamic padding only drops pad columns
+    assert fixed.tokens == dynamic.tokens == int(fq["attention_mask"].sum() + fd["attention_mask"].sum())
+    assert (fd["input_ids"][:, :dd["input_ids"].shape[1]] == dd["input_ids"]).all()
+    assert dynamic.padded_tokens < fixed.padded_tokens == 4 * 48 + 8 * 48
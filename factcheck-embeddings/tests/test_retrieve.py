@@ -0,0 +1,98 @@
+import json
+import pickle
+import faiss
+import numpy as np
+import pytest
+from factcheck_relevance.embedding_store import save_embeddings
+from factcheck_relevance.retrieve import run_retrieval
+from factcheck_relevance.sharded_retrieve import merge_topk
+
+def read_run(path):
+    run = {}
+    with open(path) as f:
+        for line in f:
+            qid, docid, rank, score = line.rstrip('\n').split('\t')
+            run.setdefault(qid, []).append(docid)
+    return run
+
+def test_candidate_mode_ranks_only_own_evidence(tmp_path):
+    rng = np.random.default_rng(0)
+    corpus = rng.standard_normal((50, 8)).astype(np.float32)
+    queries = rng.standard_normal((3, 8)).astype(np.float32)
+    save_embeddings(str(tmp_path / "corpus.emb"), [f"d{i}" for i in range(50)], corpus)
+    save_embeddings(str(tmp_path / "query.emb"), ["q0", "q1", "q2"], queries)
+    
+    candidates = {"q0": ["d1", "d2", "d3", "d4"], "q1": ["d10"], "q2": []}
+    with open(tmp_path / "candidates.jsonl", 'w') as f:
+        for qid, docs in candidates.items():
+            f.write(json.dumps({"text_id": qid, "candidates": docs}) + '\n')
+    
+    config = {
+        "query_out_path": str(tmp_path / "query.emb"),
+        "corpus_out_path": str(tmp_path / "corpus.emb"),
+        "run_path": str(tmp_path / "out" / "dev.run"),
+        "topk": 3,
+        "retrieval_mode": "candidates",
+        "candidates_path": str(tmp_path / "candidates.jsonl"),
+    }
+    run_retrieval(config)
+    run = read_run(config["run_path"])
+    
+    expected = sorted(candidates["q0"], key=lambda d: -float(queries[0] @ corpus[int(d[1:])]))[:3]
+    assert run["q0"] == expected
+    assert run["q1"] == ["d10"]
+    assert "q2" not in run
+
+def test_sharded_search_matches_single_index(tmp_path):
+    rng = np.random.default_rng(1)
+    corpus = rng.standard_normal((203, 16)).astype(np.float32)
+    queries = rng.standard_normal((9, 16)).astype(np.float32)
+    save_embeddings(str(tmp_path / "corpus.emb"), [f"d{i}" for i in range(203)], corpus)
+    save_embeddings(str(tmp_path / "query.emb"), [f"q{i}" for i in range(9)], queries)
+    base = {"query_out_path": str(tmp_path / "query.emb"), "corpus_out_path": str(tmp_path / "corpus.emb"),
+            "topk": 20, "query_batch_size": 4, "run_score_format": "%r"}
+
+    run_retrieval(dict(base, run_path=str(tmp_path / "single.run")))
+    # Shards are smaller than topk, so every shard's list is padded
+    run_retrieval(dict(base, run_path=str(tmp_path / "sharded.run"), retrieve_shards=13, retrieve_workers=2))
+
+    with open(tmp_path / "single.run") as f, open(tmp_path / "sharded.run") as g:
+        assert f.read() == g.read()
+    assert not (tmp_path / "sharded.run.shards").exists()
+    assert (tmp_path / "corpus.emb.flat.rows_0_15.faiss").exists()
+
+def test_merge_topk_matches_single_flat_index():
+    rng = np.random.default_rng(3)
+    # Duplicate vectors give exactly tied scores, including at rank k; the last shard is smaller than k
+    corpus = rng.standard_normal((300, 16)).astype(np.float32)[rng.integers(0, 300, 1100)]
+    queries = rng.standard_normal((40, 16)).astype(np.float32)
+    topk = 20
+    bounds = [0, 500, 1090, 1100]
+
+    single = faiss.IndexFlatIP(16)
+    single.add(corpus)
+    expected_scores, expected_indices = single.search(queries, topk)
+    shard_scores, shard_indices = [], []
+    for start, end in zip(bounds, bounds[1:]):
+        shard = faiss.IndexFlatIP(16)
+        shard.add(corpus[start:end])
+        s, i = shard.search(queries, topk)
+        shard_scores.append(s)
+        shard_indices.append(np.where(i >= 0, i + start, -1))
+    scores, indices = merge_topk(shard_scores, shard_indices, topk)
+
+    assert np.array_equal(scores, expected_scores)
+    for q in range(len(queries)):
+        # Rows scoring above the cutoff match exactly, in order; rows tied at the cutoff only by score
+        above = expected_scores[q] > expected_scores[q, -1]
+        assert indices[q][above].tolist() == expected_indices[q][above].tolist()
+        assert np.all(scores[q][indices[q] != expected_indices[q]] == expected_scores[q, -1])
+
+def test_sharded_search_requires_a_store(tmp_path):
+    with open(tmp_path / "corpus.pkl", 'wb') as f:
+        pickle.dump((np.ones((4, 2), dtype=np.float32), ["d0", "d1", "d2", "d3"]), f)
+    save_embeddings(str(tmp_path / "query.emb"), ["q0"], np.ones((1, 2), dtype=np.float32))
+    config = {"query_out_path": str(tmp_path / "query.emb"), "corpus_out_path": str(tmp_path / "corpus.pkl"),
+              "run_path": str(tmp_path / "dev.run"), "retrieve_shards": 2}
+    with pytest.raises(ValueError, match="embedding store"):
+        run_retrieval(config)
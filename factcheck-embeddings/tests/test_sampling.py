@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from factcheck_relevance.sampling import sample_negatives
+
+CONFIG = {"k_neg": 3, "hard_pool_size": 2, "hard_frac": 0.67}
+
+def test_hard_mix_draws_from_hard_pool_first():
+    sims = [0.1, 0.9, 0.3, 0.8, 0.2, 0.4]
+    sampled = sample_negatives(sims, 50, CONFIG, np.random.default_rng(0))
+    
+    assert sampled.shape == (50, 3)
+    for row in sampled:
+        assert len(set(row)) == 3
+        # The hard pool (top-2 by similarity) is exhausted before random picks
+        assert set(row[:2]) == {1, 3}
+
+def test_sampling_is_reproducible():
+    sims = np.random.default_rng(1).random(200)
+    a = sample_negatives(sims, 10, CONFIG, np.random.default_rng(42))
+    b = sample_negatives(sims, 10, CONFIG, np.random.default_rng(42))
+    assert np.array_equal(a, b)
+
+def test_too_few_negatives():
+    assert sample_negatives([0.5, 0.4], 1, CONFIG, np.random.default_rng(0)) is None
+
+@pytest.mark.parametrize("policy", ["random", "hardest"])
+def test_other_policies(policy):
+    sims = [0.1, 0.9, 0.3, 0.8]
+    sampled = sample_negatives(sims, 4, dict(CONFIG, neg_policy=policy), np.random.default_rng(0))
+    assert sampled.shape == (4, 3)
+    if policy == "hardest":
+        assert list(sampled[0]) == [1, 3, 2]
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        sample_negatives([0.1, 0.2, 0.3], 1, dict(CONFIG, neg_policy="nope"), np.random.default_rng(0))
@@ -0,0 +1,49 @@
+import asyncio
+import json
+import numpy as np
+from factcheck_relevance.embedding_store import save_embeddings
+from factcheck_relevance.encoder import Encoder
+from factcheck_relevance.serve import RetrievalService, Retriever
+from tests.helpers import make_texts
+
+async def post(port, payload):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode()
+    writer.write(b"POST /search HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+def test_concurrent_claims_are_batched(model_dir, tmp_path):
+    docs = make_texts(40, seed=6)
+    claims = make_texts(12, seed=7)
+    encoder = Encoder(model_dir)
+    corpus_path = str(tmp_path / "corpus.emb")
+    save_embeddings(corpus_path, [f"d{i}" for i in range(40)], encoder.encode(docs))
+    config = {"model_name_or_path": model_dir, "corpus_out_path": corpus_path, "index_cache": False, "topk": 5}
+
+    # Brute-force scores for comparison (the tiny model's scores are near-ties, so compare scores, not ids)
+    scores = encoder.encode(claims, is_query=True) @ encoder.encode(docs).T
+
+    async def scenario():
+        service = RetrievalService(Retriever(config), max_batch_size=8, max_wait_ms=50)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        first = await asyncio.gather(*(post(port, {"claim": c, "topk": 3}) for c in claims))
+        repeat = await post(port, {"claim": claims[0]})
+        bad = await post(port, {"text": claims[0]})
+        server.close()
+        return service, first, repeat, bad
+
+    service, first, repeat, bad = asyncio.run(scenario())
+    assert [s for s, _ in first] == [200] * 12
+    for row, (_, body) in zip(scores, first):
+        got = [(int(r["docid"][1:]), r["score"]) for r in body["results"]]
+        np.testing.assert_allclose([s for _, s in got], np.sort(row)[::-1][:3], rtol=1e-5)
+        np.testing.assert_allclose([row[d] for d, _ in got], [s for _, s in got], rtol=1e-5)
+    # 12 concurrent claims with at most 8 per batch
+    assert service.batcher.batches == 3 and service.batcher.requests == 13
+    assert len(repeat[1]["results"]) == 5 and service.retriever.cache_hits == 1
+    assert bad[0] == 400
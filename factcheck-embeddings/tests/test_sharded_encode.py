@@ -0,0 +1,48 @@
+import json
+import os
+import pickle
+import numpy as np
+from factcheck_relevance.encoder import Encoder
+from factcheck_relevance.sharded_encode import job_dir, sharded_encode, split_shards
+from tests.helpers import make_texts
+
+def write_corpus(path, texts):
+    with open(path, 'w') as f:
+        for i, t in enumerate(texts):
+            f.write(json.dumps({"text_id": f"d{i}", "text": t}) + '\n')
+
+def test_sharded_matches_single_process(model_dir, tmp_path):
+    texts = make_texts(23, seed=2)
+    in_path = str(tmp_path / "corpus.jsonl")
+    write_corpus(in_path, texts)
+    config = {"model_name_or_path": model_dir, "p_max_len": 24, "encode_workers": 2, "encode_shards": 3,
+              "encode_threads": 1, "encode_shard_dir": str(tmp_path / "shards")}
+
+    sharded_encode(config, in_path, str(tmp_path / "corpus.pkl"))
+    with open(tmp_path / "corpus.pkl", 'rb') as f:
+        reps, ids = pickle.load(f)
+
+    assert ids == [f"d{i}" for i in range(23)]
+    np.testing.assert_allclose(reps, Encoder(model_dir, p_max_len=24).encode(texts), atol=1e-5)
+    # Shards are cleaned up once merged
+    assert os.listdir(tmp_path / "shards") == []
+
+def test_finished_shards_are_reused(model_dir, tmp_path):
+    in_path = str(tmp_path / "corpus.jsonl")
+    write_corpus(in_path, make_texts(10, seed=3))
+    config = {"model_name_or_path": model_dir, "encode_workers": 2, "encode_threads": 1,
+              "encode_shard_dir": str(tmp_path / "shards")}
+
+    # Simulate a crash after the first shard finished: its output must not be recomputed
+    work_dir = job_dir(config, in_path, False, 2)
+    os.makedirs(work_dir)
+    first = split_shards(in_path, work_dir, 2)[0]
+    done = np.full((5, 16), 7.0, dtype=np.float32)
+    with open(first.replace(".jsonl", ".pkl"), 'wb') as f:
+        pickle.dump((done, [f"d{i}" for i in range(5)]), f)
+
+    sharded_encode(config, in_path, str(tmp_path / "corpus.pkl"))
+    with open(tmp_path / "corpus.pkl", 'rb') as f:
+        reps, ids = pickle.load(f)
+    assert ids == [f"d{i}" for i in range(10)]
+    assert (reps[:5] == 7.0).all() and not (reps[5:] == 7.0).all()
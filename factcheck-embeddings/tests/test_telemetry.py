@@ -0,0 +1,53 @@
+import time
+from factcheck_relevance.encoder import Encoder
+from factcheck_relevance.telemetry import instrument, load_telemetry, recording, step, summarize, telemetry_path, _records
+from tests.helpers import make_texts
+
+def test_steps_nest_and_aggregate_repeated_calls():
+    del _records[:]
+    with recording(), step("retrieve"):
+        for _ in range(3):
+            with step("search", count=10, unit="queries"):
+                time.sleep(0.01)
+    steps = {s["name"]: s for s in summarize(_records)}
+
+    assert list(steps) == ["retrieve", "retrieve/search"]
+    search = steps["retrieve/search"]
+    assert search["calls"] == 3
+    assert search["count"] == 30
+    assert search["per_sec"] == search["count"] / search["wall_s"]
+    assert steps["retrieve"]["wall_s"] >= search["wall_s"]
+    assert steps["retrieve"]["per_sec"] is None
+
+def test_instrument_writes_stage_json(tmp_path):
+    path = telemetry_path(str(tmp_path / "out" / "dev.run"), "retrieve")
+    assert path.endswith("dev.run.retrieve.telemetry.json")
+
+    with instrument("retrieve", path, unit="queries") as stage:
+        with step("load_embeddings"):
+            pass
+        stage.count = 5
+    telemetry = load_telemetry(path)
+
+    assert telemetry["stage"] == "retrieve"
+    assert [s["name"] for s in telemetry["steps"]] == ["retrieve", "retrieve/load_embeddings"]
+    assert telemetry["steps"][0]["count"] == 5
+    assert telemetry["wall_s"] == telemetry["steps"][0]["wall_s"]
+    assert telemetry["peak_rss_mb"] > 0
+
+def test_instrument_writes_telemetry_on_failure(tmp_path):
+    path = str(tmp_path / "encode.telemetry.json")
+    try:
+        with instrument("encode", path):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert load_telemetry(path)["steps"][0]["name"] == "encode"
+
+def test_steps_outside_instrument_are_not_kept(model_dir):
+    # A long-running process (the retrieval service) encodes batch after batch with no stage around it
+    del _records[:]
+    encoder = Encoder(model_dir, q_max_len=16)
+    for _ in range(20):
+        encoder.encode(make_texts(3), is_query=True)
+    assert _records == []
@@ -0,0 +1,31 @@
+import json
+from factcheck_relevance.utils import iter_json
+
+RECORDS = [
+    {"claim": "Claim 1", "evidence": [{"snippet": "a ] b, c", "relevance_label": "RELEVANT"}]},
+    {"claim": "Claim 2", "evidence": []},
+    {"claim": "Claim 3", "evidence": [{"snippet": "x", "cosine_similarity": 0.25}]},
+]
+
+def test_iter_json_array_small_chunks(tmp_path):
+    path = tmp_path / "input.json"
+    with open(path, 'w') as f:
+        json.dump(RECORDS, f, indent=2)
+    
+    # Chunks smaller than a record force decoding across chunk boundaries
+    for chunk_size in (1, 7, 1 << 20):
+        assert list(iter_json(str(path), chunk_size=chunk_size)) == RECORDS
+
+def test_iter_json_jsonl(tmp_path):
+    path = tmp_path / "input.jsonl"
+    with open(path, 'w') as f:
+        for r in RECORDS:
+            f.write(json.dumps(r) + '\n')
+        f.write('\n')
+    
+    assert list(iter_json(str(path), chunk_size=5)) == RECORDS
+
+def test_iter_json_empty_array(tmp_path):
+    path = tmp_path / "empty.json"
+    path.write_text(" [ ] ")
+    assert list(iter_json(str(path))) == []